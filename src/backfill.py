@@ -0,0 +1,97 @@
+# src/backfill.py
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from src.data import add_missing_slots, load_hourly_rides_one_month
+from src.download import download_raw_data
+from src.ts_store import set_watermark, upsert_ts_data
+
+
+def get_year_months(from_year: int, to_year: int) -> List[Tuple[int, int]]:
+    """Every (year, month) from January of `from_year` to December of `to_year`"""
+    return [(year, month) for year in range(from_year, to_year + 1) for month in range(1, 13)]
+
+
+def _hourly_rides_one_month(year_month: Tuple[int, int]) -> pd.DataFrame:
+    year, month = year_month
+    return load_hourly_rides_one_month(year, month)
+
+
+def backfill_ts_data(
+    from_year: int,
+    to_year: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    update_store: bool = False,
+) -> pd.DataFrame:
+    """
+    Builds the hourly time-series of every month between `from_year` and
+    `to_year` without holding all raw rides in memory at once.
+
+    Raw files are downloaded concurrently first. Then each month is mapped, in
+    a pool of `max_workers` processes, to its hourly ride counts per location,
+    so a worker only ever holds the raw rides of one month. The small
+    aggregates are summed per (pickup_hour, pickup_location_id), which merges
+    any hour that more than one shard contributes to, and missing slots are
+    filled once at the end.
+
+    Args:
+        from_year: first year to backfill
+        to_year: last year to backfill. Defaults to the current year
+        max_workers: number of worker processes. Defaults to the number of CPUs
+        update_store: if True, also upsert the result into the local
+            time-series store and move its watermark past the last hour
+
+    Returns:
+        pd.DataFrame: DataFrame with columns `pickup_hour`, `rides` and
+        `pickup_location_id` for every (hour, location) slot
+    """
+    to_year = to_year or datetime.now().year
+    year_months = get_year_months(from_year, to_year)
+
+    download_raw_data(year_months)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        hourly_rides = list(executor.map(_hourly_rides_one_month, year_months))
+
+    agg_rides = pd.concat(hourly_rides, ignore_index=True)
+    if agg_rides.empty:
+        return pd.DataFrame(columns=['pickup_hour', 'rides', 'pickup_location_id'])
+
+    agg_rides = (
+        agg_rides.groupby(['pickup_hour', 'pickup_location_id'], as_index=False)['rides']
+        .sum()
+    )
+
+    # add rows for (locations, pickup_hours)s with 0 rides
+    ts_data = add_missing_slots(agg_rides)
+
+    if update_store:
+        upsert_ts_data(ts_data)
+        set_watermark(ts_data['pickup_hour'].max() + pd.Timedelta(hours=1))
+
+    return ts_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill the hourly time-series, one month per worker')
+    parser.add_argument('--from-year', type=int, default=2022)
+    parser.add_argument('--to-year', type=int, default=None)
+    parser.add_argument('--max-workers', type=int, default=None)
+    parser.add_argument('--update-store', action='store_true')
+    args = parser.parse_args()
+
+    ts_data = backfill_ts_data(
+        from_year=args.from_year,
+        to_year=args.to_year,
+        max_workers=args.max_workers,
+        update_store=args.update_store,
+    )
+    print(f'✅ Backfilled {len(ts_data):,} rows')
+
+
+if __name__ == '__main__':
+    main()
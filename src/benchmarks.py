@@ -0,0 +1,1019 @@
+# src/benchmarks.py
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.data import add_missing_slots, transform_ts_data_into_features_and_target
+from src.dtype_policy import FEATURE_DTYPE, compact_features, get_feature_columns, memory_report
+from src.features import build_features
+from src.model import (
+    ROLLING_WINDOWS,
+    SAME_HOUR_WEEKS,
+    average_rides_last_4_weeks,
+    ArrayFeatureEngineer,
+    RollingStatsFeatures,
+    TemporalFeaturesEngineer,
+)
+from src.compiled_model import CompiledEnsemble, compile_pipeline
+from src.paths import MODELS_DIR, PARENT_DIR, TRANSFORMED_DATA_DIR
+
+# number of hours in each benchmark size
+SIZES = {
+    '1w': 24 * 7,
+    '1m': 24 * 30,
+    '1y': 24 * 365,
+}
+N_ZONES = [50, 265]
+
+# same window as the training notebooks
+INPUT_SEQ_LEN = 24 * 28
+STEP_SIZE = 23
+
+# relative demand per hour of the day and per day of the week (Monday first),
+# shaped like NYC yellow taxi pickups: night trough, morning and evening peaks
+HOUR_OF_DAY_PROFILE = np.array([
+    0.55, 0.40, 0.28, 0.20, 0.18, 0.22, 0.40, 0.65, 0.85, 0.90, 0.90, 0.92,
+    0.95, 0.97, 1.00, 1.00, 0.95, 1.05, 1.15, 1.15, 1.05, 1.00, 0.90, 0.75,
+])
+DAY_OF_WEEK_PROFILE = np.array([0.90, 0.95, 1.00, 1.05, 1.10, 1.00, 0.85])
+
+
+def generate_rides_matrix(
+    n_locations: int = 265,
+    n_hours: int = 24 * 365,
+    seed: int = 42,
+    start: str = '2022-01-01',
+) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+    """
+    Generates a deterministic dense (n_locations, n_hours) matrix of hourly
+    ride counts with NYC-like seasonality: a few busy zones and many quiet
+    ones, daily peaks and quieter weekends.
+
+    Returns:
+        Tuple with the pickup hours and the rides matrix
+    """
+    rng = np.random.default_rng(seed)
+    hours = pd.date_range(start, periods=n_hours, freq='H')
+
+    # heavy-tailed zone popularity, like Midtown vs. outer boroughs
+    zone_scale = rng.lognormal(mean=1.5, sigma=1.3, size=n_locations)
+    time_profile = (
+        HOUR_OF_DAY_PROFILE[hours.hour.to_numpy()]
+        * DAY_OF_WEEK_PROFILE[hours.dayofweek.to_numpy()]
+    )
+    rides = rng.poisson(zone_scale[:, None] * time_profile[None, :])
+
+    return hours, rides
+
+
+def generate_ts_data(
+    n_locations: int = 265,
+    n_hours: int = 24 * 365,
+    sparse: bool = True,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Generates hourly time-series data with columns
+    - pickup_hour
+    - pickup_location_id
+    - rides
+    If `sparse`, slots with 0 rides are dropped, like the output of the hourly
+    aggregation before `add_missing_slots`.
+    """
+    hours, rides = generate_rides_matrix(n_locations, n_hours, seed)
+
+    ts_data = pd.DataFrame({
+        'pickup_hour': np.tile(hours.values, n_locations),
+        'pickup_location_id': np.repeat(np.arange(1, n_locations + 1), n_hours),
+        'rides': rides.ravel(),
+    })
+    if sparse:
+        ts_data = ts_data[ts_data['rides'] > 0].reset_index(drop=True)
+    return ts_data
+
+
+def generate_lag_features(
+    n_locations: int = 265,
+    n_hours: int = 24 * 365,
+    n_lags: int = 653,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Generates a feature store batch, one row per (location, hour) with the
+    `n_lags` previous hours as `lag_1`..`lag_n_lags` and the current `rides`
+    """
+    hours, rides = generate_rides_matrix(n_locations, n_hours + n_lags, seed)
+    windows = np.lib.stride_tricks.sliding_window_view(rides, n_lags + 1, axis=1)
+
+    # windows[..., -1] is the current hour, windows[..., -1 - lag] is lag_{lag}
+    lags = windows[..., :-1][..., ::-1].reshape(-1, n_lags).astype(FEATURE_DTYPE)
+    features = pd.DataFrame(lags, columns=[f'lag_{lag}' for lag in range(1, n_lags + 1)])
+    features.insert(0, 'rides', windows[..., -1].ravel())
+    features.insert(0, 'pickup_ts', np.tile(hours[n_lags:].values, n_locations))
+    features.insert(0, 'pickup_location_id', np.repeat(np.arange(1, n_locations + 1), n_hours))
+    return features
+
+
+def add_missing_slots_loop(ts_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reference per-location implementation of `add_missing_slots`, kept here to
+    measure the speedup of the vectorized version.
+    """
+    location_ids = range(1, int(ts_data['pickup_location_id'].max()) + 1)
+    full_range = pd.date_range(ts_data['pickup_hour'].min(),
+                               ts_data['pickup_hour'].max(),
+                               freq='H')
+    output = pd.DataFrame()
+    for location_id in location_ids:
+        ts_data_i = ts_data.loc[ts_data.pickup_location_id == location_id, ['pickup_hour', 'rides']]
+        if ts_data_i.empty:
+            ts_data_i = pd.DataFrame.from_dict([
+                {'pickup_hour': ts_data['pickup_hour'].max(), 'rides': 0}
+            ])
+        ts_data_i.set_index('pickup_hour', inplace=True)
+        ts_data_i.index = pd.DatetimeIndex(ts_data_i.index)
+        ts_data_i = ts_data_i.reindex(full_range, fill_value=0)
+        ts_data_i['pickup_location_id'] = location_id
+        output = pd.concat([output, ts_data_i])
+
+    output = output.reset_index().rename(columns={'index': 'pickup_hour'})
+    return output
+
+
+def time_it(fn: Callable, *args, repeat: int = 3) -> Tuple[float, object]:
+    """Returns the best wall time in seconds over `repeat` runs and the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_memory_mb(fn: Callable, *args) -> float:
+    """
+    Peak memory allocated by one call of `fn`, in megabytes, as seen by
+    tracemalloc (Python and NumPy allocations, not native library buffers)
+    """
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024**2
+
+
+@dataclass
+class BenchmarkCase:
+    """
+    One hot path to benchmark. `setup(n_zones, n_hours)` builds the arguments
+    of `run` outside of the timed region. Sizes whose `estimate_bytes` exceed
+    the memory limit of the suite are skipped.
+    """
+    name: str
+    setup: Callable[[int, int], tuple]
+    run: Callable
+    estimate_bytes: Callable[[int, int], float] = lambda n_zones, n_hours: 0
+
+
+def _setup_add_missing_slots(n_zones: int, n_hours: int) -> tuple:
+    return (generate_ts_data(n_zones, n_hours),)
+
+
+def _setup_transform_ts_data(n_zones: int, n_hours: int) -> tuple:
+    return (generate_ts_data(n_zones, n_hours, sparse=False), INPUT_SEQ_LEN, STEP_SIZE)
+
+
+def _setup_build_features(n_zones: int, n_hours: int) -> tuple:
+    ts_data = generate_ts_data(n_zones, n_hours, sparse=False)
+    return (ts_data.rename(columns={'pickup_hour': 'pickup_ts'}),)
+
+
+def _setup_model_features(n_zones: int, n_hours: int) -> tuple:
+    ts_data = generate_ts_data(n_zones, n_hours + INPUT_SEQ_LEN, sparse=False)
+    features, _ = transform_ts_data_into_features_and_target(ts_data, INPUT_SEQ_LEN, STEP_SIZE)
+    return (features,)
+
+
+def _run_build_features(df: pd.DataFrame) -> pd.DataFrame:
+    return build_features(df.copy())
+
+
+def _run_temporal_features(X: pd.DataFrame) -> pd.DataFrame:
+    return TemporalFeaturesEngineer().fit_transform(X)
+
+
+def _run_rolling_stats(X: pd.DataFrame) -> pd.DataFrame:
+    return RollingStatsFeatures().fit_transform(X)
+
+
+def _run_feature_steps(X: pd.DataFrame) -> pd.DataFrame:
+    # the DataFrame feature steps of get_pipeline, one copy of X per step
+    X = average_rides_last_4_weeks(X)
+    X = RollingStatsFeatures().fit_transform(X)
+    return TemporalFeaturesEngineer().fit_transform(X)
+
+
+def _run_array_features(X: pd.DataFrame) -> np.ndarray:
+    return ArrayFeatureEngineer().fit_transform(X)
+
+
+_inference_models = {}
+
+
+def _get_inference_model(expected_features: List[str]):
+    """Small pipeline with the same steps as `train.py`, trained once per feature set"""
+    key = tuple(expected_features)
+    if key not in _inference_models:
+        import lightgbm as lgb
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import StandardScaler
+
+        X = generate_lag_features(n_locations=20, n_hours=24 * 7)
+        X['pickup_ts'] = X['pickup_ts'].astype('int64') // 10**9
+        y = X['rides'].shift(-1).fillna(0)
+        pipeline = Pipeline([
+            ('scaler', StandardScaler()),
+            ('model', lgb.LGBMRegressor(n_estimators=100, verbosity=-1)),
+        ])
+        pipeline.fit(X[expected_features], y)
+        _inference_models[key] = pipeline
+    return _inference_models[key]
+
+
+def _setup_run_inference(n_zones: int, n_hours: int) -> tuple:
+    # imported here because src.inference needs the feature store client
+    from src.inference import run_inference
+
+    features = generate_lag_features(n_zones, n_hours)
+    expected_features = features.columns.tolist()
+    return run_inference, _get_inference_model(expected_features), features, expected_features
+
+
+def _run_inference(
+    run_inference: Callable,
+    model,
+    features: pd.DataFrame,
+    expected_features: List[str],
+) -> pd.DataFrame:
+    return run_inference(model, features.copy(), expected_features)
+
+
+def _lag_block_bytes(n_zones: int, n_hours: int, n_lags: int = 653) -> float:
+    # float64 while the lags are shifted, plus the float32 result
+    return n_zones * n_hours * n_lags * (8 + 4)
+
+
+CASES = [
+    BenchmarkCase('add_missing_slots', _setup_add_missing_slots, add_missing_slots),
+    BenchmarkCase(
+        'transform_ts_data_into_features_and_target',
+        _setup_transform_ts_data,
+        transform_ts_data_into_features_and_target,
+    ),
+    BenchmarkCase('build_features', _setup_build_features, _run_build_features, _lag_block_bytes),
+    BenchmarkCase(
+        'average_rides_last_4_weeks',
+        _setup_model_features,
+        average_rides_last_4_weeks,
+        lambda n_zones, n_hours: 2 * n_zones * (n_hours / STEP_SIZE) * INPUT_SEQ_LEN * 8,
+    ),
+    BenchmarkCase(
+        'TemporalFeaturesEngineer',
+        _setup_model_features,
+        _run_temporal_features,
+        lambda n_zones, n_hours: 2 * n_zones * (n_hours / STEP_SIZE) * INPUT_SEQ_LEN * 8,
+    ),
+    BenchmarkCase(
+        'RollingStatsFeatures',
+        _setup_model_features,
+        _run_rolling_stats,
+        lambda n_zones, n_hours: 2 * n_zones * (n_hours / STEP_SIZE) * INPUT_SEQ_LEN * 8,
+    ),
+    BenchmarkCase(
+        'feature_steps',
+        _setup_model_features,
+        _run_feature_steps,
+        lambda n_zones, n_hours: 4 * n_zones * (n_hours / STEP_SIZE) * INPUT_SEQ_LEN * 8,
+    ),
+    BenchmarkCase(
+        'ArrayFeatureEngineer',
+        _setup_model_features,
+        _run_array_features,
+        lambda n_zones, n_hours: 2 * n_zones * (n_hours / STEP_SIZE) * INPUT_SEQ_LEN * 4,
+    ),
+    BenchmarkCase('run_inference', _setup_run_inference, _run_inference, _lag_block_bytes),
+]
+
+
+def run_suite(
+    sizes: List[str] = ('1w', '1m', '1y'),
+    n_zones: List[int] = N_ZONES,
+    cases: Optional[List[str]] = None,
+    repeat: int = 3,
+    memory_limit_gb: float = 4.0,
+) -> dict:
+    """
+    Runs every benchmark case at every (size, zones) combination and returns
+    a JSON-serializable dict with wall time and peak memory of each run
+    """
+    results = []
+    for case in CASES:
+        if cases and case.name not in cases:
+            continue
+        for size in sizes:
+            for zones in n_zones:
+                n_hours = SIZES[size]
+                result = {'case': case.name, 'size': size, 'n_zones': zones, 'n_hours': n_hours}
+
+                if case.estimate_bytes(zones, n_hours) > memory_limit_gb * 1024**3:
+                    result['status'] = 'skipped: above memory limit'
+                    results.append(result)
+                    print(f'⏭️ {case.name} [{size}, {zones} zones] skipped')
+                    continue
+
+                try:
+                    args = case.setup(zones, n_hours)
+                    seconds, _ = time_it(case.run, *args, repeat=repeat)
+                    result['seconds'] = seconds
+                    result['peak_mb'] = peak_memory_mb(case.run, *args)
+                    result['status'] = 'ok'
+                    print(f"⏱️ {case.name} [{size}, {zones} zones]: "
+                          f"{seconds:.4f}s, {result['peak_mb']:.1f} MB")
+                except Exception as e:
+                    result['status'] = f'error: {type(e).__name__}: {e}'
+                    print(f'❌ {case.name} [{size}, {zones} zones]: {result["status"]}')
+                results.append(result)
+
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'results': results,
+    }
+
+
+def save_results(results: dict, path: Path) -> None:
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'💾 Benchmark results saved to {path}')
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.1) -> List[dict]:
+    """
+    Compares two `run_suite` outputs and returns the runs whose wall time or
+    peak memory grew by more than `threshold` (relative) over the baseline
+    """
+    def key(r: dict) -> tuple:
+        return r['case'], r['size'], r['n_zones']
+
+    baseline_by_key = {key(r): r for r in baseline['results'] if r.get('status') == 'ok'}
+
+    regressions = []
+    for r in current['results']:
+        base = baseline_by_key.get(key(r))
+        if base is None or r.get('status') != 'ok':
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            if base[metric] > 0 and r[metric] > base[metric] * (1 + threshold):
+                regressions.append({
+                    'case': r['case'],
+                    'size': r['size'],
+                    'n_zones': r['n_zones'],
+                    'metric': metric,
+                    'baseline': base[metric],
+                    'current': r[metric],
+                    'ratio': r[metric] / base[metric],
+                })
+    return regressions
+
+
+def benchmark_add_missing_slots(n_locations: int = 265, n_hours: int = 24 * 365) -> dict:
+    """Compares the vectorized `add_missing_slots` against the per-location loop"""
+    ts_data = generate_ts_data(n_locations=n_locations, n_hours=n_hours)
+
+    t_loop, expected = time_it(add_missing_slots_loop, ts_data, repeat=1)
+    t_vectorized, output = time_it(add_missing_slots, ts_data)
+    pd.testing.assert_frame_equal(output, expected, check_dtype=False)
+
+    return {
+        'n_locations': n_locations,
+        'n_hours': n_hours,
+        'loop_seconds': t_loop,
+        'vectorized_seconds': t_vectorized,
+        'speedup': t_loop / t_vectorized,
+    }
+
+
+def rolling_stats_pandas(
+    ts_data: pd.DataFrame,
+    features: pd.DataFrame,
+    windows=ROLLING_WINDOWS,
+    n_weeks=SAME_HOUR_WEEKS,
+) -> pd.DataFrame:
+    """
+    Reference for `RollingStatsFeatures` with pandas `.rolling` over each
+    location's hourly series, joined back onto the rows of `features`
+    """
+    ts_data = ts_data.sort_values(['pickup_location_id', 'pickup_hour'])
+    by_location = ts_data.groupby('pickup_location_id')['rides']
+
+    # windows end one hour before the hour to predict
+    previous = by_location.shift(1).astype(np.float64)
+    by_location_previous = previous.groupby(ts_data['pickup_location_id'])
+
+    stats = {}
+    for w in windows:
+        rolling = by_location_previous.rolling(w)
+        stats[f'rolling_mean_{w}h'] = rolling.mean().droplevel(0)
+        stats[f'rolling_std_{w}h'] = rolling.std().droplevel(0)
+    for n in n_weeks:
+        weeks = [by_location.shift(7 * 24 * k) for k in range(1, n + 1)]
+        stats[f'same_hour_mean_last_{n}_weeks'] = sum(weeks) / n
+    last_day = by_location_previous.rolling(24).sum().droplevel(0)
+    day_before = by_location.shift(25).groupby(ts_data['pickup_location_id']).rolling(24).sum().droplevel(0)
+    stats['ratio_last_24h_to_previous_24h'] = (last_day / day_before).where(day_before > 0)
+    same_hour_day_before = by_location.shift(25)
+    stats['ratio_last_hour_to_day_before'] = (previous / same_hour_day_before).where(same_hour_day_before > 0)
+
+    stats = pd.DataFrame(stats).astype(FEATURE_DTYPE)
+    stats[['pickup_hour', 'pickup_location_id']] = ts_data[['pickup_hour', 'pickup_location_id']]
+    return features[['pickup_hour', 'pickup_location_id']].merge(
+        stats, on=['pickup_hour', 'pickup_location_id'], how='left'
+    )
+
+
+def benchmark_rolling_stats(n_locations: int = 265, n_hours: int = 24 * 30) -> dict:
+    """
+    Compares the prefix-sum `RollingStatsFeatures` against pandas `.rolling`
+    on the same rows, and checks that both give the same statistics
+    """
+    ts_data = generate_ts_data(n_locations, n_hours + INPUT_SEQ_LEN, sparse=False)
+    features, _ = transform_ts_data_into_features_and_target(ts_data, INPUT_SEQ_LEN, STEP_SIZE)
+
+    t_pandas, expected = time_it(rolling_stats_pandas, ts_data, features, repeat=1)
+    t_prefix_sum, output = time_it(_run_rolling_stats, features)
+
+    stat_cols = [c for c in expected.columns if c not in ('pickup_hour', 'pickup_location_id')]
+    pd.testing.assert_frame_equal(
+        output[stat_cols].reset_index(drop=True), expected[stat_cols], rtol=1e-3, atol=1e-3,
+    )
+
+    return {
+        'n_locations': n_locations,
+        'n_hours': n_hours,
+        'n_rows': len(features),
+        'pandas_seconds': t_pandas,
+        'prefix_sum_seconds': t_prefix_sum,
+        'speedup': t_pandas / t_prefix_sum,
+    }
+
+
+def _cold_start_seconds(code: str, repeat: int = 3) -> float:
+    """Best wall time of running `code` in a fresh interpreter, imports included"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=PARENT_DIR, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_compiled_model(
+    model_path: Path = MODELS_DIR / 'taxi_demand_predictor_next_hour_v1.pkl',
+    n_rows: int = 265,
+    repeat: int = 20,
+) -> dict:
+    """
+    Compares the joblib pipeline bundle against its `CompiledEnsemble`
+    export: cold start (a fresh interpreter that imports and loads the model)
+    and predict latency on one hourly batch of `n_rows` zones
+    """
+    import joblib
+
+    bundle = joblib.load(model_path)
+    pipeline, expected_features = bundle['model'], bundle['expected_features']
+    compiled = compile_pipeline(pipeline, expected_features)
+
+    # one hourly batch, prepared like run_inference does
+    X = generate_lag_features(n_locations=n_rows, n_hours=1)
+    X['pickup_hour'] = X['pickup_ts']
+    for col in ('pickup_ts', 'pickup_hour'):
+        X[col] = X[col].astype('int64') // 10**9
+    X = X.reindex(columns=expected_features, fill_value=0)
+
+    max_abs_diff = float(np.max(np.abs(pipeline.predict(X) - compiled.predict(X))))
+    t_pipeline, _ = time_it(pipeline.predict, X, repeat=repeat)
+    t_compiled, _ = time_it(compiled.predict, X, repeat=repeat)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        compiled_path = Path(tmp_dir) / 'compiled.npz'
+        compiled.save(compiled_path)
+        pipeline_cold_start = _cold_start_seconds(
+            f'import joblib; joblib.load({str(model_path)!r})'
+        )
+        compiled_cold_start = _cold_start_seconds(
+            f'from src.compiled_model import CompiledEnsemble; CompiledEnsemble.load({str(compiled_path)!r})'
+        )
+
+    return {
+        'n_rows': n_rows,
+        'n_trees': len(compiled.roots),
+        'max_depth': compiled.max_depth,
+        'max_abs_diff': max_abs_diff,
+        'pipeline_cold_start_seconds': pipeline_cold_start,
+        'compiled_cold_start_seconds': compiled_cold_start,
+        'pipeline_predict_seconds': t_pipeline,
+        'compiled_predict_seconds': t_compiled,
+    }
+
+
+def _full_fit_objective(trial, X_train, y_train, X_valid, y_valid) -> float:
+    """
+    Reference for the search before early stopping and pruning: 500 trees
+    per trial, scored on the training rows. Validation MAE is recorded too,
+    to compare the models both searches pick.
+    """
+    import lightgbm as lgb
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    params = {
+        "objective": "regression",
+        "metric": "mae",
+        "boosting_type": "gbdt",
+        "verbosity": -1,
+        "num_leaves": trial.suggest_int("num_leaves", 31, 255),
+        "feature_fraction": trial.suggest_float("feature_fraction", 0.5, 1.0),
+        "bagging_fraction": trial.suggest_float("bagging_fraction", 0.5, 1.0),
+        "min_child_samples": trial.suggest_int("min_child_samples", 5, 100),
+    }
+    pipeline = Pipeline([
+        ("scaler", StandardScaler()),
+        ("model", lgb.LGBMRegressor(**params, n_estimators=500)),
+    ])
+    pipeline.fit(X_train, y_train)
+    trial.set_user_attr("valid_mae", float(np.mean(np.abs(y_valid - pipeline.predict(X_valid)))))
+    return float(np.mean(np.abs(y_train - pipeline.predict(X_train))))
+
+
+def generate_training_data(n_locations: int = 50, n_hours: int = 24 * 60, n_lags: int = 24 * 7) -> pd.DataFrame:
+    """Lag features with the next-hour target, as `train.fetch_features_and_target` returns them"""
+    from src.train import TARGET_COL
+
+    df = generate_lag_features(n_locations, n_hours + 1, n_lags)
+    df[TARGET_COL] = df.groupby('pickup_location_id')['rides'].shift(-1)
+    return df.dropna(subset=[TARGET_COL]).reset_index(drop=True)
+
+
+def benchmark_hyperparameter_search(n_trials: int = 10, seed: int = 42) -> dict:
+    """
+    Wall time and best validation MAE of the early-stopped, pruned search in
+    `train` against full 500-tree fits scored on the training rows, with the
+    same sampler seed and the same time-based split
+    """
+    import optuna
+    from src import train
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = generate_training_data()
+    X_train, _, y_train, _ = train.split_data(df)
+    X_fit, y_fit, X_valid, y_valid = train.split_validation(X_train, y_train)
+
+    full_study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=seed))
+    start = time.perf_counter()
+    full_study.optimize(
+        lambda trial: _full_fit_objective(trial, X_fit, y_fit, X_valid, y_valid), n_trials=n_trials,
+    )
+    full_seconds = time.perf_counter() - start
+
+    study = train.create_study(storage=None)
+    study.sampler = optuna.samplers.TPESampler(seed=seed)
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        train_set, valid_set = train.load_search_datasets(
+            *train.build_search_datasets(X_fit, y_fit, X_valid, y_valid, Path(dataset_dir))
+        )
+        study.optimize(lambda trial: train.objective(trial, train_set, valid_set), n_trials=n_trials)
+    seconds = time.perf_counter() - start
+
+    return {
+        'n_trials': n_trials,
+        'n_rows': len(X_fit),
+        'full_fit_seconds': full_seconds,
+        'full_fit_valid_mae': full_study.best_trial.user_attrs['valid_mae'],
+        'early_stopped_seconds': seconds,
+        'early_stopped_valid_mae': study.best_value,
+        'n_pruned': sum(t.state == optuna.trial.TrialState.PRUNED for t in study.trials),
+        'speedup': full_seconds / seconds,
+    }
+
+
+def benchmark_parallel_search(
+    n_trials: int = 8,
+    splits: Optional[List[Tuple[int, int]]] = None,
+) -> List[dict]:
+    """
+    Trials per hour of `train.run_search` for each (workers, threads per
+    trial) split of the cores, on one set of binned datasets. Defaults to
+    one worker with every thread against one single-threaded worker per core.
+    """
+    import optuna
+    from src import train
+
+    n_cores = os.cpu_count() or 1
+    splits = splits or sorted({(1, n_cores), (n_cores, 1)})
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = generate_training_data()
+    X_train, _, y_train, _ = train.split_data(df)
+
+    results = []
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        start = time.perf_counter()
+        paths = train.build_search_datasets(*train.split_validation(X_train, y_train), Path(dataset_dir))
+        binning_seconds = time.perf_counter() - start
+
+        for n_workers, num_threads in splits:
+            start = time.perf_counter()
+            study = train.run_search(
+                *paths, n_trials=n_trials, n_workers=n_workers, num_threads=num_threads,
+                storage=Path(dataset_dir) / f'study_{n_workers}x{num_threads}.log',
+            )
+            seconds = time.perf_counter() - start
+            results.append({
+                'n_workers': n_workers,
+                'num_threads': num_threads,
+                'n_trials': len(study.trials),
+                'seconds': seconds,
+                'trials_per_hour': len(study.trials) * 3600 / seconds,
+                'best_valid_mae': study.best_value,
+                'binning_seconds': binning_seconds,
+            })
+    return results
+
+
+def benchmark_feature_selection(n_locations: int = 50, n_hours: int = 24 * 60, n_lags: int = 24 * 7) -> dict:
+    """
+    Lags kept by `feature_selection.select_lag_features`, and the test MAE,
+    predict time and feature memory of a model on them against one on every
+    lag, with the same split as `train`
+    """
+    import lightgbm as lgb
+    from src import train
+    from src.feature_selection import get_lag_columns, select_lag_features
+
+    df = generate_training_data(n_locations, n_hours, n_lags)
+    X_train, X_test, y_train, y_test = train.split_data(df)
+    X_fit, y_fit, X_valid, y_valid = train.split_validation(X_train, y_train)
+
+    X_select, y_select, X_select_valid, y_select_valid = train.split_validation(X_fit, y_fit)
+
+    start = time.perf_counter()
+    selected = select_lag_features(
+        X_select, y_select, X_select_valid, y_select_valid, X_holdout=X_valid, y_holdout=y_valid,
+    )
+    selection_seconds = time.perf_counter() - start
+
+    results = {'n_lags': n_lags, 'selection_seconds': selection_seconds}
+    for name, columns in (('all', X_train.columns.tolist()), ('selected', selected)):
+        model = lgb.LGBMRegressor(n_estimators=200, verbosity=-1).fit(X_train[columns], y_train)
+        X = compact_features(X_test[columns])
+        predict_seconds, _ = time_it(model.predict, X)
+        results[f'{name}_n_lags'] = len(get_lag_columns(columns))
+        results[f'{name}_test_mae'] = float(np.mean(np.abs(y_test - model.predict(X))))
+        results[f'{name}_predict_seconds'] = predict_seconds
+        results[f'{name}_feature_mb'] = X.memory_usage(deep=True).sum() / 1024**2
+    return results
+
+
+def benchmark_prediction_service(
+    n_clients: int = 32,
+    n_requests: int = 2000,
+    zones_per_request: int = 1,
+    n_zones: int = 265,
+    batch_sizes: Tuple[int, ...] = (1, 1024),
+) -> List[dict]:
+    """
+    p50/p99 latency and throughput of `prediction_service` on localhost,
+    with the load generator in the same process, for each max batch size.
+    A max batch size of 1 predicts every request on its own.
+    """
+    from src.prediction_service import PredictionService, run_load_test, start_service
+
+    features = generate_lag_features(n_zones, 1)
+    expected_features = features.columns.tolist()
+    model = _get_inference_model(expected_features)
+
+    async def run(max_batch_size: int) -> dict:
+        service = PredictionService(model, features, expected_features, max_batch_size=max_batch_size)
+        server = await start_service(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            result = await run_load_test(
+                port=port, n_clients=n_clients, n_requests=n_requests,
+                zones_per_request=zones_per_request, location_ids=list(range(1, n_zones + 1)),
+            )
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.stop()
+        return {
+            'max_batch_size': max_batch_size,
+            'mean_batch_size': service.batcher.n_rows / max(service.batcher.n_batches, 1),
+            **result,
+        }
+
+    return [asyncio.run(run(max_batch_size)) for max_batch_size in batch_sizes]
+
+
+def _forecast_by_rebuild(run_inference: Callable, model, latest: pd.DataFrame, expected_features: List[str],
+                         n_hours: int) -> np.ndarray:
+    """
+    Reference recursive forecast that builds a new feature frame for every
+    hour, for frames with `rides` and `lag_1`..`lag_n` in that order
+    """
+    lag_columns = [col for col in expected_features if col.startswith('lag_')]
+    predictions = []
+    for _ in range(n_hours):
+        preds = run_inference(model, latest, expected_features)['predicted_rides_next_hour'].to_numpy()
+        predictions.append(preds)
+        lags = np.column_stack([latest['rides'].to_numpy(FEATURE_DTYPE), latest[lag_columns[:-1]].to_numpy(FEATURE_DTYPE)])
+        latest = pd.concat([
+            latest[['pickup_location_id']],
+            (latest['pickup_ts'] + pd.Timedelta(hours=1)).to_frame(),
+            pd.DataFrame({'rides': preds.astype(FEATURE_DTYPE)}, index=latest.index),
+            pd.DataFrame(lags, columns=lag_columns, index=latest.index),
+        ], axis=1)
+    return np.array(predictions)
+
+
+def benchmark_forecast(n_zones: int = 265, n_hours: int = 24, repeat: int = 5) -> dict:
+    """
+    Recursive `n_hours` forecast of every zone against `n_hours` times one
+    `run_inference` call on the same rows, and against a forecast that
+    rebuilds its feature frame at every hour
+    """
+    from src.inference import forecast_next_hours, latest_rows, run_inference
+
+    features = generate_lag_features(n_zones, 2)
+    expected_features = features.columns.tolist()
+    model = _get_inference_model(expected_features)
+    latest = latest_rows(features)
+
+    def best_of(fn: Callable) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    single = best_of(lambda: run_inference(model, latest, expected_features))
+    forecast = best_of(lambda: forecast_next_hours(model, latest, expected_features, n_hours))
+    rebuild = best_of(lambda: _forecast_by_rebuild(run_inference, model, latest, expected_features, n_hours))
+
+    predictions = forecast_next_hours(model, latest, expected_features, n_hours)['prediction'].to_numpy()
+    reference = _forecast_by_rebuild(run_inference, model, latest, expected_features, n_hours).T.ravel()
+    return {
+        'n_zones': n_zones,
+        'n_hours': n_hours,
+        'single_step_seconds': single,
+        'forecast_seconds': forecast,
+        'rebuild_seconds': rebuild,
+        'ratio_to_single_steps': forecast / (n_hours * single),
+        'max_abs_diff': float(np.abs(predictions - reference).max()),
+    }
+
+
+def benchmark_prediction_log(n_zones: int = 265, n_days: int = 30, dashboard_hours: int = 24 * 7) -> dict:
+    """
+    One inference run written and read back as the overwritten CSV with every
+    feature column, against the same run appended to the prediction log; and
+    a dashboard read of the last `dashboard_hours` out of `n_days` of log
+    """
+    from src.inference import run_inference
+    from src.prediction_log import append_predictions, read_last_hours
+
+    features = generate_lag_features(n_zones, 24)
+    expected_features = features.columns.tolist()
+    predictions = run_inference(_get_inference_model(expected_features), features, expected_features)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / 'predictions.csv'
+        start = time.perf_counter()
+        predictions.to_csv(csv_path, index=False)
+        pd.read_csv(csv_path)
+        csv_seconds = time.perf_counter() - start
+
+        root = Path(tmp) / 'prediction_log'
+        start = time.perf_counter()
+        append_predictions(predictions, root=root)
+        read_last_hours(24, root=root)
+        log_seconds = time.perf_counter() - start
+
+        # one run per day of history, each covering 24 hours
+        log = predictions[['pickup_location_id', 'pickup_ts', 'rides', 'predicted_rides_next_hour']]
+        for day in range(1, n_days):
+            append_predictions(log.assign(pickup_ts=log['pickup_ts'] - day * 86400), root=root)
+        start = time.perf_counter()
+        dashboard = read_last_hours(dashboard_hours, root=root)
+        dashboard_seconds = time.perf_counter() - start
+        log_bytes = sum(p.stat().st_size for p in root.rglob('*.parquet'))
+
+        return {
+            'n_rows': len(predictions),
+            'csv_seconds': csv_seconds,
+            'csv_mb': csv_path.stat().st_size / 1024**2,
+            'log_seconds': log_seconds,
+            'log_mb_per_day': log_bytes / n_days / 1024**2,
+            'n_days': n_days,
+            'dashboard_hours': dashboard_hours,
+            'dashboard_rows': len(dashboard),
+            'dashboard_seconds': dashboard_seconds,
+        }
+
+
+def widen_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Casts a frame back to the int64/float64 dtypes used before the dtype policy"""
+    casts = {c: np.float64 for c in get_feature_columns(df.columns)}
+    casts.update({c: np.int64 for c in ('pickup_location_id', 'rides') if c in df.columns})
+    return df.astype(casts)
+
+
+def benchmark_dtype_policy(n_lags: int = 653) -> pd.DataFrame:
+    """
+    Memory of the fallback parquet, its lag features and a synthetic year of
+    ts_data for 265 zones, before and after the dtype policy.
+
+    A year of lag features does not fit in memory with float64, so its size
+    is computed from the number of rows and lags instead of measured.
+    """
+    fallback = pd.read_parquet(TRANSFORMED_DATA_DIR / 'ts_data_2022_01.parquet')
+    fallback_features = build_features(fallback.rename(columns={'pickup_hour': 'pickup_ts'}))
+    year = generate_ts_data(sparse=False)
+
+    report = memory_report({
+        'fallback ts_data': widen_dtypes(fallback),
+        'fallback features': widen_dtypes(fallback_features),
+        'synthetic year ts_data': widen_dtypes(year),
+    })
+
+    n_rows = len(year)
+    before = n_rows * n_lags * np.dtype(np.float64).itemsize / 1024**2
+    after = n_rows * n_lags * np.dtype(FEATURE_DTYPE).itemsize / 1024**2
+    report.loc[len(report)] = {
+        'data': 'synthetic year lag block (computed)',
+        'shape': (n_rows, n_lags),
+        'before_mb': round(before, 1),
+        'after_mb': round(after, 1),
+        'reduction': round(before / after, 2),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data, feature and model hot paths')
+    parser.add_argument('--sizes', nargs='+', default=['1w', '1m'], choices=list(SIZES))
+    parser.add_argument('--zones', nargs='+', type=int, default=N_ZONES)
+    parser.add_argument('--cases', nargs='+', default=None, choices=[c.name for c in CASES])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory-limit-gb', type=float, default=4.0)
+    parser.add_argument('--output', type=Path, default=Path('benchmark_results.json'))
+    parser.add_argument('--compare', type=Path, default=None,
+                        help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown or memory growth reported as a regression')
+    parser.add_argument('--loop-speedup', action='store_true',
+                        help='also compare add_missing_slots against the per-location loop')
+    parser.add_argument('--rolling-speedup', action='store_true',
+                        help='also compare RollingStatsFeatures against pandas .rolling')
+    parser.add_argument('--compiled-model', action='store_true',
+                        help='also compare the saved pipeline against its NumPy export')
+    parser.add_argument('--search', action='store_true',
+                        help='also compare the early-stopped search against full fits')
+    parser.add_argument('--parallel-search', action='store_true',
+                        help='also compare trials per hour across worker/thread splits')
+    parser.add_argument('--feature-selection', action='store_true',
+                        help='also compare the model on the selected lags against all lags')
+    parser.add_argument('--service', action='store_true',
+                        help='also load test the prediction service with and without batching')
+    parser.add_argument('--forecast', action='store_true',
+                        help='also time the recursive 24-hour forecast against single-step inference')
+    parser.add_argument('--prediction-log', action='store_true',
+                        help='also time the prediction log against the predictions CSV')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='also report memory before/after the dtype policy')
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.zones, args.cases, args.repeat, args.memory_limit_gb)
+    save_results(results, args.output)
+
+    if args.loop_speedup:
+        speedup = benchmark_add_missing_slots()
+        print(f"add_missing_slots @ {speedup['n_locations']} zones x {speedup['n_hours']} hours")
+        print(f"  loop       : {speedup['loop_seconds']:.3f}s")
+        print(f"  vectorized : {speedup['vectorized_seconds']:.3f}s")
+        print(f"  speedup    : {speedup['speedup']:.1f}x")
+
+    if args.rolling_speedup:
+        speedup = benchmark_rolling_stats()
+        print(f"rolling stats @ {speedup['n_locations']} zones x {speedup['n_hours']} hours "
+              f"({speedup['n_rows']:,} rows)")
+        print(f"  pandas .rolling : {speedup['pandas_seconds']:.3f}s")
+        print(f"  prefix sums     : {speedup['prefix_sum_seconds']:.3f}s")
+        print(f"  speedup         : {speedup['speedup']:.1f}x")
+
+    if args.compiled_model:
+        compiled = benchmark_compiled_model()
+        print(f"compiled model @ {compiled['n_trees']} trees, {compiled['n_rows']} rows "
+              f"(max abs diff {compiled['max_abs_diff']:.2e})")
+        print(f"  cold start : pipeline {compiled['pipeline_cold_start_seconds']:.3f}s, "
+              f"compiled {compiled['compiled_cold_start_seconds']:.3f}s")
+        print(f"  predict    : pipeline {compiled['pipeline_predict_seconds'] * 1000:.2f}ms, "
+              f"compiled {compiled['compiled_predict_seconds'] * 1000:.2f}ms")
+
+    if args.search:
+        search = benchmark_hyperparameter_search()
+        print(f"hyperparameter search @ {search['n_trials']} trials, {search['n_rows']:,} rows")
+        print(f"  full fits      : {search['full_fit_seconds']:.1f}s, "
+              f"validation MAE {search['full_fit_valid_mae']:.4f}")
+        print(f"  early stopping : {search['early_stopped_seconds']:.1f}s, "
+              f"validation MAE {search['early_stopped_valid_mae']:.4f} ({search['n_pruned']} pruned)")
+        print(f"  speedup        : {search['speedup']:.1f}x")
+
+    if args.parallel_search:
+        for split in benchmark_parallel_search():
+            print(f"parallel search @ {split['n_workers']} workers x {split['num_threads']} threads: "
+                  f"{split['n_trials']} trials in {split['seconds']:.1f}s, "
+                  f"{split['trials_per_hour']:.0f} trials/hour, "
+                  f"validation MAE {split['best_valid_mae']:.4f} "
+                  f"(binned once in {split['binning_seconds']:.2f}s)")
+
+    if args.feature_selection:
+        selection = benchmark_feature_selection()
+        print(f"feature selection @ {selection['n_lags']} lags, selected in {selection['selection_seconds']:.1f}s")
+        for name in ('all', 'selected'):
+            print(f"  {name:<8} : {selection[f'{name}_n_lags']} lags, "
+                  f"test MAE {selection[f'{name}_test_mae']:.4f}, "
+                  f"predict {selection[f'{name}_predict_seconds'] * 1000:.1f}ms, "
+                  f"features {selection[f'{name}_feature_mb']:.1f} MB")
+
+    if args.service:
+        for run in benchmark_prediction_service():
+            print(f"prediction service @ max batch {run['max_batch_size']} "
+                  f"(mean {run['mean_batch_size']:.1f} rows), {run['n_clients']} clients: "
+                  f"p50 {run['p50_seconds'] * 1000:.1f}ms, p99 {run['p99_seconds'] * 1000:.1f}ms, "
+                  f"{run['requests_per_second']:.0f} requests/s")
+
+    if args.forecast:
+        forecast = benchmark_forecast()
+        print(f"forecast @ {forecast['n_zones']} zones x {forecast['n_hours']} hours "
+              f"(max abs diff {forecast['max_abs_diff']:.2e})")
+        print(f"  single step        : {forecast['single_step_seconds'] * 1000:.1f}ms")
+        print(f"  recursive forecast : {forecast['forecast_seconds'] * 1000:.1f}ms "
+              f"({forecast['ratio_to_single_steps']:.2f}x of {forecast['n_hours']} single steps)")
+        print(f"  rebuilt frames     : {forecast['rebuild_seconds'] * 1000:.1f}ms")
+
+    if args.prediction_log:
+        log = benchmark_prediction_log()
+        print(f"prediction log @ {log['n_rows']:,} rows per run")
+        print(f"  csv write + read : {log['csv_seconds']:.2f}s, {log['csv_mb']:.1f} MB")
+        print(f"  log append + read: {log['log_seconds']:.2f}s, {log['log_mb_per_day']:.2f} MB per day")
+        print(f"  dashboard read   : {log['dashboard_rows']:,} rows of the last {log['dashboard_hours']} hours "
+              f"out of {log['n_days']} days in {log['dashboard_seconds'] * 1000:.0f}ms")
+
+    if args.memory_report:
+        print(benchmark_dtype_policy().to_string(index=False))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.threshold)
+        for r in regressions:
+            print(f"🔺 {r['case']} [{r['size']}, {r['n_zones']} zones] {r['metric']}: "
+                  f"{r['baseline']:.4f} -> {r['current']:.4f} ({r['ratio']:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f'✅ No regressions above {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# src/compiled_model.py
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# LightGBM treats |x| <= kZeroThreshold as zero
+ZERO_THRESHOLD = 1e-35
+
+# missing_type of a split, as stored in `CompiledEnsemble.missing_type`
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {'None': MISSING_NONE, 'Zero': MISSING_ZERO, 'NaN': MISSING_NAN}
+
+# objectives whose raw score goes through exp(), the rest are the identity
+EXP_OBJECTIVES = ('poisson', 'gamma', 'tweedie')
+
+# rows evaluated at once, to bound the (rows x trees) node array
+BATCH_SIZE = 4096
+
+
+@dataclass
+class CompiledEnsemble:
+    """
+    A LightGBM regression ensemble as flat node arrays, evaluated with NumPy
+    only. Node `i` of any tree splits on raw feature `feature[i]` at
+    `threshold[i]` (the scaler of the pipeline is already folded in), and
+    goes to `left[i]` or `right[i]`. Leaves point to themselves and hold
+    their output in `value`.
+    """
+    feature: np.ndarray
+    threshold: np.ndarray
+    zero_value: np.ndarray
+    missing_type: np.ndarray
+    default_left: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    value: np.ndarray
+    roots: np.ndarray
+    max_depth: int
+    feature_names: List[str]
+    objective: str = 'regression'
+    average_output: bool = False
+
+    def __post_init__(self):
+        is_leaf = self.left == np.arange(len(self.left))
+        # children[2 * i + go_left] is where node i goes, with leaves as ~index
+        self.children = np.stack([self.right, self.left], axis=1).ravel()
+        self.children = np.where(is_leaf[self.children], ~self.children, self.children)
+        self.start_nodes = np.where(is_leaf[self.roots], ~self.roots, self.roots)
+
+        # where NaN goes: NaN splits use default_left, other splits treat NaN
+        # as zero of the scaled feature (x == zero_value), and Zero splits
+        # then send that zero to default_left
+        self.nan_left = np.where(
+            self.missing_type == MISSING_NONE, self.zero_value <= self.threshold, self.default_left,
+        )
+        self.has_zero_splits = bool((self.missing_type == MISSING_ZERO).any())
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Predicts every row of X, a DataFrame with `feature_names` among its
+        columns or an array with the features in that order
+        """
+        if hasattr(X, 'columns'):
+            X = X[self.feature_names].to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+
+        raw = np.concatenate([
+            self._raw_score(X[start:start + BATCH_SIZE])
+            for start in range(0, len(X), BATCH_SIZE)
+        ]) if len(X) else np.empty(0)
+
+        if self.average_output:
+            raw /= len(self.roots)
+        if self.objective.split(' ')[0] in EXP_OBJECTIVES:
+            return np.exp(raw)
+        return raw
+
+    def _raw_score(self, X: np.ndarray) -> np.ndarray:
+        """
+        Walks all (row, tree) pairs down one level per step, vectorized over
+        the pairs that have not reached a leaf yet
+        """
+        n_rows, n_trees = len(X), len(self.roots)
+        leaves = np.tile(self.start_nodes, n_rows)
+        rows = np.repeat(np.arange(n_rows, dtype=np.int32), n_trees)
+
+        active = np.flatnonzero(leaves >= 0)
+        node, rows = leaves[active], rows[active]
+        while active.size:
+            x = X[rows, self.feature[node]]
+
+            go_left = x <= self.threshold[node]
+            is_nan = np.isnan(x)
+            if is_nan.any():
+                go_left[is_nan] = self.nan_left[node[is_nan]]
+            if self.has_zero_splits:
+                is_zero = (self.missing_type[node] == MISSING_ZERO) & (np.abs(x - self.zero_value[node]) <= ZERO_THRESHOLD)
+                go_left[is_zero] = self.default_left[node[is_zero]]
+
+            node = self.children[2 * node + go_left]
+            done = node < 0
+            if done.any():
+                leaves[active[done]] = node[done]
+                inner = ~done
+                active, node, rows = active[inner], node[inner], rows[inner]
+
+        return self.value[~leaves].reshape(n_rows, n_trees).sum(axis=1)
+
+    def save(self, path: Path) -> None:
+        """Saves the node arrays as an uncompressed .npz file"""
+        np.savez(
+            path,
+            feature=self.feature,
+            threshold=self.threshold,
+            zero_value=self.zero_value,
+            missing_type=self.missing_type,
+            default_left=self.default_left,
+            left=self.left,
+            right=self.right,
+            value=self.value,
+            roots=self.roots,
+            meta=np.array(json.dumps({
+                'max_depth': self.max_depth,
+                'feature_names': self.feature_names,
+                'objective': self.objective,
+                'average_output': self.average_output,
+            })),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> 'CompiledEnsemble':
+        with np.load(path) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            return cls(**{k: arrays[k] for k in arrays.files if k != 'meta'}, **meta)
+
+
+def _split_pipeline(pipeline) -> Tuple[Optional[object], object]:
+    """(scaler or None, LightGBM regressor) of a pipeline, or of a bare model"""
+    if not hasattr(pipeline, 'steps'):
+        return None, pipeline
+
+    *preprocessing, (_, model) = pipeline.steps
+    if len(preprocessing) > 1 or (
+        preprocessing and type(preprocessing[0][1]).__name__ != 'StandardScaler'
+    ):
+        raise ValueError(
+            '❌ Only a LightGBM model, optionally after a StandardScaler, can be compiled. '
+            f'Got steps {[name for name, _ in pipeline.steps]}'
+        )
+    return (preprocessing[0][1] if preprocessing else None), model
+
+
+def compile_pipeline(pipeline, feature_names: Optional[List[str]] = None) -> CompiledEnsemble:
+    """
+    Exports a fitted `Pipeline(StandardScaler, LGBMRegressor)`, or a bare
+    LightGBM regressor or booster, into a `CompiledEnsemble`.
+
+    The scaler maps x to (x - mean) / scale, so a split `scaled <= t` is the
+    split `x <= t * scale + mean` on the raw feature, and a zero of the
+    scaled feature is `x == mean`. Folding that into each node removes the
+    scaler from prediction.
+
+    Raises:
+        ValueError: if the pipeline has other steps or the model has
+        categorical splits
+    """
+    scaler, model = _split_pipeline(pipeline)
+    booster = model.booster_ if hasattr(model, 'booster_') else model
+    dump = booster.dump_model()
+
+    n_features = dump['max_feature_idx'] + 1
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    if scaler is not None:
+        if scaler.mean_ is not None:
+            mean = scaler.mean_.astype(np.float64)
+        if scaler.scale_ is not None:
+            scale = scaler.scale_.astype(np.float64)
+
+    if feature_names is None:
+        feature_names = list(getattr(pipeline, 'feature_names_in_', dump['feature_names']))
+
+    nodes = {name: [] for name in ('feature', 'threshold', 'zero_value', 'missing_type',
+                                   'default_left', 'left', 'right', 'value')}
+    roots = []
+    max_depth = 0
+
+    def add_node(node: dict, depth: int) -> int:
+        nonlocal max_depth
+        index = len(nodes['feature'])
+        for values in nodes.values():
+            values.append(0)
+
+        if 'leaf_value' in node:
+            max_depth = max(max_depth, depth)
+            nodes['threshold'][index] = np.inf
+            nodes['left'][index] = nodes['right'][index] = index
+            nodes['value'][index] = node['leaf_value']
+            return index
+
+        if node['decision_type'] != '<=':
+            raise ValueError('❌ Categorical splits cannot be compiled')
+
+        feature = node['split_feature']
+        nodes['feature'][index] = feature
+        nodes['threshold'][index] = node['threshold'] * scale[feature] + mean[feature]
+        nodes['zero_value'][index] = mean[feature]
+        nodes['missing_type'][index] = MISSING_TYPES[node['missing_type']]
+        nodes['default_left'][index] = node['default_left']
+        nodes['left'][index] = add_node(node['left_child'], depth + 1)
+        nodes['right'][index] = add_node(node['right_child'], depth + 1)
+        return index
+
+    for tree in dump['tree_info']:
+        roots.append(add_node(tree['tree_structure'], 0))
+
+    return CompiledEnsemble(
+        feature=np.array(nodes['feature'], dtype=np.int32),
+        threshold=np.array(nodes['threshold'], dtype=np.float64),
+        zero_value=np.array(nodes['zero_value'], dtype=np.float64),
+        missing_type=np.array(nodes['missing_type'], dtype=np.int8),
+        default_left=np.array(nodes['default_left'], dtype=bool),
+        left=np.array(nodes['left'], dtype=np.int32),
+        right=np.array(nodes['right'], dtype=np.int32),
+        value=np.array(nodes['value'], dtype=np.float64),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        feature_names=[str(name) for name in feature_names],
+        objective=dump.get('objective', 'regression'),
+        average_output=bool(dump.get('average_output', False)),
+    )
+
@@ -9,8 +9,14 @@ from pathlib import Path
 # Base data directory
 DATA_DIR = Path("data")  # You can change this to your preferred path
 DATA_DIR.mkdir(parents=True, exist_ok=True)  # Ensure it exists
-# ---- Predictions Path ----
-PREDICTIONS_PATH = str(DATA_DIR / "predictions.csv")
+# ---- Prediction log ----
+# also log the model input of every prediction in a sidecar dataset
+LOG_PREDICTION_FEATURES = False
+# hours of the prediction log the dashboards and monitoring read
+DASHBOARD_HOURS = 24 * 7
+# ---- Multi-horizon forecasts ----
+FORECAST_HOURS = 24
+FORECASTS_PATH = str(DATA_DIR / "forecasts.csv")
 
 # Load env vars
 load_dotenv(PARENT_DIR / ".env")
@@ -23,6 +29,10 @@ except KeyError:
         "Create an .env file at the project root with HOPSWORKS_PROJECT_NAME and HOPSWORKS_API_KEY"
     )
 
+# ---- Feature store session ----
+# a Hopsworks login and its feature group/view handles are reused for this long
+FEATURE_STORE_SESSION_TTL_SECONDS = 3600
+
 # ---- Feature Data (historical rides time-series) ----
 FEATURE_GROUP_METADATA = FeatureGroupConfig(
     name="time_series_hourly_feature_group",
@@ -81,3 +91,22 @@ MODEL_VERSION = 1
 N_FEATURES = 653
 N_HYPERPARAMETER_SEARCH_TRIALS = 1
 MAX_MAE = 30.0
+
+# training keeps the fewest lags whose validation MAE is within this
+# fraction of the MAE with all N_FEATURES lags
+FEATURE_SELECTION_MAE_TOLERANCE = 0.01
+
+# Trials run in N_SEARCH_WORKERS processes with N_THREADS_PER_TRIAL LightGBM
+# threads each. None uses every core: os.cpu_count() // N_THREADS_PER_TRIAL
+N_SEARCH_WORKERS = None
+N_THREADS_PER_TRIAL = 1
+
+# ---- Prediction service ----
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+# concurrent /predict requests are scored together, up to this many rows,
+# waiting at most this long for more to arrive
+MAX_BATCH_SIZE = 1024
+MAX_BATCH_WAIT_MS = 2.0
+# seconds between lag state refreshes from the feature store, 0 to disable
+SERVICE_REFRESH_SECONDS = 300
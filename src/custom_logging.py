@@ -2,6 +2,7 @@ import hopsworks
 import pandas as pd
 from datetime import datetime
 from src import config
+from src.dtype_policy import to_store_dtypes
 
 
 def log_predictions(preds_df: pd.DataFrame, current_date: datetime):
@@ -29,5 +30,5 @@ def log_predictions(preds_df: pd.DataFrame, current_date: datetime):
         description="Stores model predictions for taxi demand"
     )
 
-    predictions_fg.insert(preds_df)
+    predictions_fg.insert(to_store_dtypes(preds_df))
     print(f"✅ Logged {len(preds_df)} predictions to feature store")
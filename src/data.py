@@ -1,14 +1,30 @@
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Union
 from pdb import set_trace as stop
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import pandas as pd
-import requests
-from tqdm import tqdm
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from src.paths import RAW_DATA_DIR, TRANSFORMED_DATA_DIR
+from src.download import download_one_file, download_raw_data
+from src.month_cache import MonthCache
+from src.location_hour_matrix import LocationHourMatrix
+from src.dtype_policy import (
+    LOCATION_ID_DTYPE,
+    RIDES_DTYPE,
+    FEATURE_DTYPE,
+    compact_ts_data,
+)
+
+# raw NYC parquet columns we read, and the names we give them
+RAW_DATA_COLUMNS = {
+    'tpep_pickup_datetime': 'pickup_datetime',
+    'PULocationID': 'pickup_location_id',
+}
 
 
 def download_one_file_of_raw_data(year: int, month: int) -> Path:
@@ -16,15 +32,16 @@ def download_one_file_of_raw_data(year: int, month: int) -> Path:
     Downloads Parquet file with historical taxi rides for the given `year` and
     `month`
     """
-    URL = f'https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{year}-{month:02d}.parquet'
-    response = requests.get(URL)
+    return download_one_file(year, month)
 
-    if response.status_code == 200:
-        path = RAW_DATA_DIR / f'rides_{year}-{month:02d}.parquet'
-        open(path, "wb").write(response.content)
-        return path
-    else:
-        raise Exception(f'{URL} is not available')
+
+def get_month_range(year: int, month: int) -> Tuple[datetime, datetime]:
+    """
+    Returns the [start, end) datetimes of the given `year` and `month`
+    """
+    this_month_start = datetime(year, month, 1)
+    next_month_start = datetime(year, month + 1, 1) if month < 12 else datetime(year + 1, 1, 1)
+    return this_month_start, next_month_start
 
 
 def validate_raw_data(
@@ -36,8 +53,7 @@ def validate_raw_data(
     Removes rows with pickup_datetimes outside their valid range
     """
     # keep only rides for this month
-    this_month_start = f'{year}-{month:02d}-01'
-    next_month_start = f'{year}-{month+1:02d}-01' if month < 12 else f'{year+1}-01-01'
+    this_month_start, next_month_start = get_month_range(year, month)
     rides = rides[rides.pickup_datetime >= this_month_start]
     rides = rides[rides.pickup_datetime < next_month_start]
     
@@ -58,16 +74,15 @@ def fetch_ride_events_from_data_warehouse(
 
     if (from_date_.year == to_date_.year) and (from_date_.month == to_date_.month):
         # download 1 file of data only
-        rides = load_raw_data(year=from_date_.year, months=from_date_.month)
-        rides = rides[rides.pickup_datetime >= from_date_]
-        rides = rides[rides.pickup_datetime < to_date_]
+        rides = load_raw_data(year=from_date_.year, months=from_date_.month,
+                              from_date=from_date_, to_date=to_date_)
 
     else:
         # download 2 files from website
-        rides = load_raw_data(year=from_date_.year, months=from_date_.month)
-        rides = rides[rides.pickup_datetime >= from_date_]
-        rides_2 = load_raw_data(year=to_date_.year, months=to_date_.month)
-        rides_2 = rides_2[rides_2.pickup_datetime < to_date_]
+        rides = load_raw_data(year=from_date_.year, months=from_date_.month,
+                              from_date=from_date_, to_date=to_date_)
+        rides_2 = load_raw_data(year=to_date_.year, months=to_date_.month,
+                                from_date=from_date_, to_date=to_date_)
         rides = pd.concat([rides, rides_2])
 
     # shift the pickup_datetime back 1 year ahead, to simulate production data
@@ -79,9 +94,103 @@ def fetch_ride_events_from_data_warehouse(
     return rides
 
 
+def load_hourly_rides_one_month(year: int, month: int) -> pd.DataFrame:
+    """
+    Loads the raw rides of `year` and `month` and counts them per pickup_hour
+    and pickup_location_id. Hours without rides are not included.
+    """
+    rides = load_raw_data(year=year, months=month)
+    if rides.empty:
+        return pd.DataFrame({
+            'pickup_hour': pd.Series(dtype='datetime64[us]'),
+            'pickup_location_id': pd.Series(dtype=LOCATION_ID_DTYPE),
+            'rides': pd.Series(dtype=RIDES_DTYPE),
+        })
+
+    agg_rides = (
+        rides.groupby([rides['pickup_datetime'].dt.floor('H').rename('pickup_hour'),
+                       'pickup_location_id'])
+        .size()
+        .rename('rides')
+        .reset_index()
+    )
+    return compact_ts_data(agg_rides)
+
+
+# hourly ride counts per month, shared by every call in this process
+_month_cache = MonthCache(load_month=load_hourly_rides_one_month)
+
+
+def fetch_ts_data_from_data_warehouse(
+    from_date: datetime,
+    to_date: datetime
+) -> pd.DataFrame:
+    """
+    Same simulation as `fetch_ride_events_from_data_warehouse`, but returns
+    hourly ride counts instead of individual ride events. Months are read
+    once and kept in a memory and disk cache, so overlapping windows are
+    answered by slicing the cached months.
+
+    Returns:
+        pd.DataFrame: DataFrame with the following columns, for the hours with
+        at least one ride and `from_date` <= pickup_hour < `to_date`:
+            - pickup_hour
+            - pickup_location_id
+            - rides
+    """
+    from_date_ = from_date - timedelta(days=7*52)
+    to_date_ = to_date - timedelta(days=7*52)
+    print(f'Fetching hourly rides from {from_date} to {to_date}')
+
+    ts_data = _month_cache.query(from_date_, to_date_)
+
+    # shift the pickup_hour back 1 year ahead, to simulate production data
+    # using its 7*52-days-ago value
+    ts_data['pickup_hour'] += timedelta(days=7*52)
+
+    ts_data.sort_values(by=['pickup_location_id', 'pickup_hour'], inplace=True)
+
+    return ts_data
+
+
+def read_raw_data_file(
+    path: Path,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """
+    Reads only the pickup time and location columns of a raw NYC parquet file,
+    pushing the [`from_date`, `to_date`) filter down to the parquet row groups
+
+    Returns:
+        pd.DataFrame: DataFrame with the following columns:
+            - pickup_datetime: datetime64[us] of the pickup
+            - pickup_location_id: int16 ID of the pickup location
+    """
+    filters = []
+    if from_date is not None:
+        filters.append(('tpep_pickup_datetime', '>=', pd.Timestamp(from_date).to_pydatetime()))
+    if to_date is not None:
+        filters.append(('tpep_pickup_datetime', '<', pd.Timestamp(to_date).to_pydatetime()))
+
+    table = pq.read_table(
+        path,
+        columns=list(RAW_DATA_COLUMNS),
+        filters=filters or None,
+    )
+    table = table.cast(pa.schema([
+        ('tpep_pickup_datetime', pa.timestamp('us')),
+        ('PULocationID', pa.from_numpy_dtype(LOCATION_ID_DTYPE)),
+    ]))
+
+    return table.to_pandas().rename(columns=RAW_DATA_COLUMNS)
+
+
 def load_raw_data(
     year: int,
-    months: Optional[List[int]] = None
+    months: Optional[List[int]] = None,
+    from_date: Optional[datetime] = None,
+    to_date: Optional[datetime] = None,
 ) -> pd.DataFrame:
     """
     Loads raw data from local storage or downloads it from the NYC website, and
@@ -90,13 +199,15 @@ def load_raw_data(
     Args:
         year: year of the data to download
         months: months of the data to download. If `None`, download all months
+        from_date: if given, only rides with pickup_datetime >= `from_date` are read
+        to_date: if given, only rides with pickup_datetime < `to_date` are read
 
     Returns:
         pd.DataFrame: DataFrame with the following columns:
             - pickup_datetime: datetime of the pickup
             - pickup_location_id: ID of the pickup location
     """  
-    rides = pd.DataFrame()
+    rides = []
     
     if months is None:
         # download data for the entire year (all months)
@@ -105,162 +216,180 @@ def load_raw_data(
         # download data only for the month specified by the int `month`
         months = [months]
 
+    # fetch all missing months concurrently before reading them
+    local_files = download_raw_data([(year, month) for month in months])
+
     for month in months:
-        
-        local_file = RAW_DATA_DIR / f'rides_{year}-{month:02d}.parquet'
-        if not local_file.exists():
-            try:
-                # download the file from the NYC website
-                print(f'Downloading file {year}-{month:02d}')
-                download_one_file_of_raw_data(year, month)
-            except:
-                print(f'{year}-{month:02d} file is not available')
-                continue
-        else:
-            print(f'File {year}-{month:02d} was already in local storage') 
-
-        # load the file into Pandas
-        rides_one_month = pd.read_parquet(local_file)
-
-        # rename columns
-        rides_one_month = rides_one_month[['tpep_pickup_datetime', 'PULocationID']]
-        rides_one_month.rename(columns={
-            'tpep_pickup_datetime': 'pickup_datetime',
-            'PULocationID': 'pickup_location_id',
-        }, inplace=True)
+
+        local_file = local_files[(year, month)]
+        if local_file is None:
+            continue
+
+        # read only the rides of this month that fall inside [from_date, to_date)
+        this_month_start, next_month_start = get_month_range(year, month)
+        rides_one_month = read_raw_data_file(
+            local_file,
+            from_date=max(this_month_start, from_date) if from_date else this_month_start,
+            to_date=min(next_month_start, to_date) if to_date else next_month_start,
+        )
 
         # validate the file
         rides_one_month = validate_raw_data(rides_one_month, year, month)
 
         # append to existing data
-        rides = pd.concat([rides, rides_one_month])
+        rides.append(rides_one_month)
 
-    if rides.empty:
+    if not rides:
         # no data, so we return an empty dataframe
         return pd.DataFrame()
+
+    rides = pd.concat(rides)
+    if rides.empty:
+        return pd.DataFrame()
     else:
         # keep only time and origin of the ride
         rides = rides[['pickup_datetime', 'pickup_location_id']]
         return rides
 
 
-def add_missing_slots(ts_data: pd.DataFrame) -> pd.DataFrame:
+def add_missing_slots(
+    ts_data: pd.DataFrame,
+    full_range: Optional[pd.DatetimeIndex] = None,
+    n_locations: Optional[int] = None,
+) -> pd.DataFrame:
     """
     Add necessary rows to the input 'ts_data' to make sure the output
     has a complete list of
     - pickup_hours
     - pickup_location_ids
-    """
-    #location_ids = range(1, ts_data['pickup_location_id'].max() + 1)
-    location_ids = range(1, int(ts_data['pickup_location_id'].max()) + 1)
 
+    The full (pickup_location_id x pickup_hour) grid is built in a single pass
+    by scattering the observed rides into a `LocationHourMatrix`, instead of
+    filtering and reindexing the frame once per location.
 
-    full_range = pd.date_range(ts_data['pickup_hour'].min(),
-                               ts_data['pickup_hour'].max(),
-                               freq='H')
-    output = pd.DataFrame()
-    for location_id in tqdm(location_ids):
+    Args:
+        ts_data: DataFrame with columns `pickup_hour`, `rides` and
+            `pickup_location_id`
+        full_range: consecutive hours of the grid. Defaults to every hour
+            between the first and last `pickup_hour` in `ts_data`
+        n_locations: locations of the grid are 1..`n_locations`. Defaults to
+            the largest `pickup_location_id` in `ts_data`
+    """
+    if n_locations is None:
+        n_locations = int(ts_data['pickup_location_id'].max())
 
-        # keep only rides for this 'location_id'
-        ts_data_i = ts_data.loc[ts_data.pickup_location_id == location_id, ['pickup_hour', 'rides']]
-        
-        if ts_data_i.empty:
-            # add a dummy entry with a 0
-            ts_data_i = pd.DataFrame.from_dict([
-                {'pickup_hour': ts_data['pickup_hour'].max(), 'rides': 0}
-            ])
-
-        # quick way to add missing dates with 0 in a Series
-        # taken from https://stackoverflow.com/a/19324591
-        ts_data_i.set_index('pickup_hour', inplace=True)
-        ts_data_i.index = pd.DatetimeIndex(ts_data_i.index)
-        ts_data_i = ts_data_i.reindex(full_range, fill_value=0)
-        
-        # add back `location_id` columns
-        ts_data_i['pickup_location_id'] = location_id
+    matrix = LocationHourMatrix.from_ts_data(
+        ts_data,
+        location_ids=np.arange(1, n_locations + 1, dtype=LOCATION_ID_DTYPE),
+        hours=full_range,
+        fill_value=0,
+        dtype=ts_data['rides'].dtype,
+    )
 
-        output = pd.concat([output, ts_data_i])
-    
-    # move the pickup_hour from the index to a dataframe column
-    output = output.reset_index().rename(columns={'index': 'pickup_hour'})
-    
-    return output
+    # rows are ordered by location first, then by pickup_hour
+    return matrix.to_ts_data()
 
 
 def transform_raw_data_into_ts_data(
     rides: pd.DataFrame
 ) -> pd.DataFrame:
-    """"""
-    # sum rides per location and pickup_hour
-    rides['pickup_hour'] = rides['pickup_datetime'].dt.floor('H')
-    agg_rides = rides.groupby(['pickup_hour', 'pickup_location_id']).size().reset_index()
-    agg_rides.rename(columns={0: 'rides'}, inplace=True)
-
-    # add rows for (locations, pickup_hours)s with 0 rides
-    agg_rides_all_slots = add_missing_slots(agg_rides)
-
-    return agg_rides_all_slots
+    """
+    Counts rides per location and pickup_hour, with 0 for every
+    (location, pickup_hour) slot without rides
+    """
+    matrix = LocationHourMatrix.from_rides(rides)
+    return matrix.to_ts_data()
 
 
 def transform_ts_data_into_features_and_target(
     ts_data: pd.DataFrame,
     input_seq_len: int,
-    step_size: int
-) -> Tuple[pd.DataFrame, pd.Series]:
+    step_size: int,
+    output: str = 'dataframe',
+) -> Tuple[Union[pd.DataFrame, np.ndarray], Union[pd.Series, np.ndarray]]:
     """
     Slices and transposes data from time-series format into a (features, target)
     format that we can use to train Supervised ML models
-    """
-    assert set(ts_data.columns) == {'pickup_hour', 'rides', 'pickup_location_id'}
 
-    location_ids = ts_data['pickup_location_id'].unique()
-    features = pd.DataFrame()
-    targets = pd.DataFrame()
-    
-    for location_id in tqdm(location_ids):
-        
-        # keep only ts data for this `location_id`
-        ts_data_one_location = ts_data.loc[
-            ts_data.pickup_location_id == location_id, 
-            ['pickup_hour', 'rides']
-        ].sort_values(by=['pickup_hour'])
-
-        # pre-compute cutoff indices to split dataframe rows
-        indices = get_cutoff_indices_features_and_target(
-            ts_data_one_location,
-            input_seq_len,
-            step_size
-        )
+    Windows are taken with `numpy.lib.stride_tricks.sliding_window_view` over
+    the rides of all locations, sorted by (location, pickup_hour), so no
+    per-window indexing happens in Python.
 
-        # slice and transpose data into numpy arrays for features and targets
-        n_examples = len(indices)
-        x = np.ndarray(shape=(n_examples, input_seq_len), dtype=np.float32)
-        y = np.ndarray(shape=(n_examples), dtype=np.float32)
-        pickup_hours = []
-        for i, idx in enumerate(indices):
-            x[i, :] = ts_data_one_location.iloc[idx[0]:idx[1]]['rides'].values
-            y[i] = ts_data_one_location.iloc[idx[1]:idx[2]]['rides'].values[0]
-            pickup_hours.append(ts_data_one_location.iloc[idx[1]]['pickup_hour'])
-
-        # numpy -> pandas
-        features_one_location = pd.DataFrame(
-            x,
-            columns=[f'rides_previous_{i+1}_hour' for i in reversed(range(input_seq_len))]
-        )
-        features_one_location['pickup_hour'] = pickup_hours
-        features_one_location['pickup_location_id'] = location_id
+    Args:
+        ts_data: DataFrame with columns `pickup_hour`, `rides` and
+            `pickup_location_id`
+        input_seq_len: number of past hours used as features
+        step_size: number of hours between consecutive windows
+        output: one of
+            - 'dataframe': (features DataFrame, target Series), as before
+            - 'array': (x, y) float32 ndarrays of shape (n_examples, input_seq_len)
+              and (n_examples,), with rows in the same order as 'dataframe'
+            - 'view': (x, y) zero-copy views of shape
+              (n_locations, n_windows, input_seq_len) and (n_locations, n_windows)
+              over one float32 copy of the rides. Requires the same number of
+              hours for every location, e.g. the output of `add_missing_slots`
+
+    Returns:
+        Tuple with features and target
+    """
+    assert set(ts_data.columns) == {'pickup_hour', 'rides', 'pickup_location_id'}
+    if output not in ('dataframe', 'array', 'view'):
+        raise ValueError(f"output must be 'dataframe', 'array' or 'view', got {output!r}")
+
+    # sort rows by location (in order of appearance) and then by pickup_hour
+    location_codes, location_ids = pd.factorize(ts_data['pickup_location_id'])
+    pickup_hours = pd.DatetimeIndex(ts_data['pickup_hour'])
+    order = np.lexsort((pickup_hours.asi8, location_codes))
+    rides = ts_data['rides'].to_numpy(dtype=FEATURE_DTYPE)[order]
+
+    n_locations = len(location_ids)
+    lengths = np.bincount(location_codes, minlength=n_locations)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+    # same windows as `get_cutoff_indices_features_and_target`
+    n_windows = np.where(
+        lengths - input_seq_len - 2 >= 0,
+        (lengths - input_seq_len - 2) // step_size + 1,
+        0,
+    )
+
+    if output == 'view':
+        if n_locations == 0 or (lengths != lengths[0]).any():
+            raise ValueError("output='view' requires the same number of hours for every location")
+        windows = sliding_window_view(
+            rides.reshape(n_locations, lengths[0]), input_seq_len + 1, axis=1
+        )[:, ::step_size][:, :n_windows[0]]
+        return windows[..., :input_seq_len], windows[..., input_seq_len]
+
+    # start position of every window in the sorted rides array
+    n_examples = int(n_windows.sum())
+    window_location = np.repeat(np.arange(n_locations), n_windows)
+    first_window = np.concatenate([[0], np.cumsum(n_windows)[:-1]])
+    starts = (
+        offsets[window_location]
+        + step_size * (np.arange(n_examples) - first_window[window_location])
+    )
+
+    if n_examples > 0:
+        x = sliding_window_view(rides, input_seq_len)[starts]
+    else:
+        x = np.empty(shape=(0, input_seq_len), dtype=FEATURE_DTYPE)
+    y = rides[starts + input_seq_len]
 
-        # numpy -> pandas
-        targets_one_location = pd.DataFrame(y, columns=[f'target_rides_next_hour'])
+    if output == 'array':
+        return x, y
 
-        # concatenate results
-        features = pd.concat([features, features_one_location])
-        targets = pd.concat([targets, targets_one_location])
+    # numpy -> pandas
+    features = pd.DataFrame(
+        x,
+        columns=[f'rides_previous_{i+1}_hour' for i in reversed(range(input_seq_len))]
+    )
+    features['pickup_hour'] = pickup_hours[order[starts + input_seq_len]]
+    features['pickup_location_id'] = np.asarray(location_ids)[window_location]
 
-    features.reset_index(inplace=True, drop=True)
-    targets.reset_index(inplace=True, drop=True)
+    targets = pd.Series(y, name='target_rides_next_hour')
 
-    return features, targets['target_rides_next_hour']
+    return features, targets
 
 
 def get_cutoff_indices_features_and_target(
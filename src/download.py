@@ -0,0 +1,256 @@
+# src/download.py
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from src.paths import RAW_DATA_DIR
+
+RAW_DATA_URL = 'https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{year}-{month:02d}.parquet'
+MANIFEST_FILE_NAME = 'manifest.json'
+MANIFEST_LOCK_FILE_NAME = 'manifest.json.lock'
+CHUNK_SIZE = 64 * 1024
+
+_manifest_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    """A raw data file could not be downloaded"""
+
+
+def get_raw_data_file_name(year: int, month: int) -> str:
+    return f'rides_{year}-{month:02d}.parquet'
+
+
+def file_checksum(path: Path) -> str:
+    """
+    Returns the sha256 hex digest of the file at `path`, reading it in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(raw_data_dir: Path = RAW_DATA_DIR) -> dict:
+    """
+    Loads the manifest of downloaded raw files, keyed by file name, with the
+    `size`, `sha256` and `fetched_at` of each file
+    """
+    path = Path(raw_data_dir) / MANIFEST_FILE_NAME
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, raw_data_dir: Path = RAW_DATA_DIR) -> None:
+    """
+    Writes the manifest to a temporary file and renames it atomically. The
+    temporary file is unique to the process and thread, since backfill
+    workers write the same manifest.
+    """
+    path = Path(raw_data_dir) / MANIFEST_FILE_NAME
+    tmp_path = path.with_suffix(f'.json.{os.getpid()}-{threading.get_ident()}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _manifest_locked(raw_data_dir: Path):
+    """
+    Holds the manifest lock of this process, and a file lock shared with the
+    backfill worker processes where `fcntl` is available
+    """
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(Path(raw_data_dir) / MANIFEST_LOCK_FILE_NAME, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_manifest(local_file: Path, raw_data_dir: Path = RAW_DATA_DIR) -> dict:
+    """
+    Records size, checksum and fetch time of `local_file` in the manifest
+    """
+    entry = {
+        'size': local_file.stat().st_size,
+        'sha256': file_checksum(local_file),
+        'fetched_at': datetime.now(timezone.utc).isoformat(),
+    }
+    with _manifest_locked(raw_data_dir):
+        manifest = load_manifest(raw_data_dir)
+        manifest[local_file.name] = entry
+        save_manifest(manifest, raw_data_dir)
+    return entry
+
+
+def is_valid_cached_file(
+    local_file: Path,
+    raw_data_dir: Path = RAW_DATA_DIR,
+    verify_checksum: bool = False,
+) -> bool:
+    """
+    Checks `local_file` against the size in its manifest entry, and against
+    its checksum with `verify_checksum`. Files downloaded before the manifest
+    existed are trusted and added to it.
+    """
+    if not local_file.exists():
+        return False
+
+    entry = load_manifest(raw_data_dir).get(local_file.name)
+    if entry is None:
+        update_manifest(local_file, raw_data_dir)
+        return True
+
+    if local_file.stat().st_size != entry['size']:
+        return False
+    if verify_checksum and file_checksum(local_file) != entry['sha256']:
+        return False
+    return True
+
+
+def _content_range_total(response: requests.Response) -> Optional[int]:
+    """Full size of the remote file from a `Content-Range` header, if given"""
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+def download_file(
+    url: str,
+    local_file: Path,
+    max_retries: int = 3,
+    backoff_seconds: float = 1.0,
+    timeout: float = 60.0,
+) -> Path:
+    """
+    Streams `url` into `local_file`.
+
+    The body is written in chunks to `<local_file>.part`, which is renamed to
+    `local_file` only once complete. If a previous attempt left a partial
+    file, the download resumes from its end with an HTTP Range request.
+    Connection errors, truncated bodies and 5xx responses are retried with
+    exponential backoff; other responses fail at once.
+
+    Raises:
+        DownloadError: if the file is not available or every attempt failed
+    """
+    local_file = Path(local_file)
+    part_file = local_file.with_name(local_file.name + '.part')
+
+    for attempt in range(max_retries + 1):
+        offset = part_file.stat().st_size if part_file.exists() else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # a part file that is already whole, left by a crash
+                    # before the rename, is answered with `bytes */<size>`
+                    if _content_range_total(response) == offset:
+                        os.replace(part_file, local_file)
+                        return local_file
+                    # otherwise it is not a prefix of the remote file
+                    part_file.unlink()
+                    raise requests.RequestException(f'{url} rejected range bytes={offset}-')
+                if response.status_code >= 500:
+                    raise requests.RequestException(f'{url} answered {response.status_code}')
+                if response.status_code not in (200, 206):
+                    raise DownloadError(f'{url} is not available ({response.status_code})')
+
+                # servers that ignore Range send the whole body again
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                expected_size = response.headers.get('Content-Length')
+                expected_size = int(expected_size) if expected_size is not None else None
+
+                written = 0
+                with open(part_file, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+                        written += len(chunk)
+
+                if expected_size is not None and written != expected_size:
+                    raise requests.RequestException(
+                        f'{url} ended after {written} of {expected_size} bytes'
+                    )
+
+            os.replace(part_file, local_file)
+            return local_file
+
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                raise DownloadError(f'{url} is not available') from e
+            print(f'Retrying {url} ({e})')
+            time.sleep(backoff_seconds * 2 ** attempt)
+
+
+def download_one_file(
+    year: int,
+    month: int,
+    base_url: str = RAW_DATA_URL,
+    raw_data_dir: Path = RAW_DATA_DIR,
+    verify_checksum: bool = False,
+) -> Path:
+    """
+    Downloads the raw file for `year` and `month` unless a valid copy is
+    already in `raw_data_dir`, and records it in the manifest. The checksum
+    is computed once after the download; cached copies are only re-hashed
+    with `verify_checksum`.
+    """
+    local_file = Path(raw_data_dir) / get_raw_data_file_name(year, month)
+    if is_valid_cached_file(local_file, raw_data_dir, verify_checksum):
+        print(f'File {year}-{month:02d} was already in local storage')
+        return local_file
+
+    print(f'Downloading file {year}-{month:02d}')
+    download_file(base_url.format(year=year, month=month), local_file)
+    update_manifest(local_file, raw_data_dir)
+    return local_file
+
+
+def download_raw_data(
+    year_months: List[Tuple[int, int]],
+    max_workers: int = 4,
+    base_url: str = RAW_DATA_URL,
+    raw_data_dir: Path = RAW_DATA_DIR,
+    verify_checksum: bool = False,
+) -> Dict[Tuple[int, int], Optional[Path]]:
+    """
+    Downloads the raw files for all `(year, month)` pairs concurrently, in a
+    pool of at most `max_workers` threads.
+
+    Returns:
+        Dict mapping each `(year, month)` to its local file, or `None` if the
+        file is not available
+    """
+    def _download(year_month: Tuple[int, int]) -> Optional[Path]:
+        year, month = year_month
+        try:
+            return download_one_file(year, month, base_url, raw_data_dir, verify_checksum)
+        except DownloadError as e:
+            print(f'{year}-{month:02d} file is not available ({e})')
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = list(executor.map(_download, year_months))
+
+    return dict(zip(year_months, paths))
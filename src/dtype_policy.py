@@ -0,0 +1,130 @@
+# src/dtype_policy.py
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+# one dtype per kind of column, shared by the data, feature, training and
+# inference pipelines
+LOCATION_ID_DTYPE = np.int16
+RIDES_DTYPE = np.uint16
+FEATURE_DTYPE = np.float32
+
+LOCATION_ID_COLUMNS = ('pickup_location_id',)
+RIDES_COLUMNS = ('rides',)
+FEATURE_COLUMN_PREFIXES = ('lag_', 'rides_previous_')
+
+TIMESTAMP_COLUMNS = ('pickup_ts', 'pickup_hour')
+
+# integer timestamps from here on are epoch milliseconds, as the feature
+# pipeline writes `pickup_ts`; as epoch seconds they would be past year 5000
+EPOCH_MS_MIN = 10**11
+
+
+def is_feature_column(column: str) -> bool:
+    """Lag columns, which make up almost all of the feature matrix"""
+    return column.startswith(FEATURE_COLUMN_PREFIXES)
+
+
+def get_feature_columns(columns: Iterable[str]) -> list:
+    return [c for c in columns if is_feature_column(c)]
+
+
+def to_datetime_utc(values: pd.Series) -> pd.Series:
+    """
+    `datetime64[ns, UTC]` of a timestamp column: datetimes (naive ones are
+    taken as UTC), epoch milliseconds or epoch seconds, the unit told apart
+    with `EPOCH_MS_MIN`
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = values.dt.tz_localize('UTC') if values.dt.tz is None else values.dt.tz_convert('UTC')
+        return values.dt.as_unit('ns')
+    unit = 'ms' if values.abs().max() >= EPOCH_MS_MIN else 's'
+    return pd.to_datetime(values, unit=unit, utc=True)
+
+
+def compact_ts_data(ts_data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the location id and ride count columns of `ts_data` to their
+    compact dtypes. Ride counts that do not fit in `RIDES_DTYPE`, or that
+    contain NaNs, are stored as `FEATURE_DTYPE` instead.
+    """
+    casts = {}
+    for col in LOCATION_ID_COLUMNS:
+        if col in ts_data.columns:
+            casts[col] = LOCATION_ID_DTYPE
+    for col in RIDES_COLUMNS:
+        if col in ts_data.columns:
+            rides = ts_data[col]
+            fits = (
+                not rides.isna().any()
+                and (rides.empty or (rides.min() >= 0 and rides.max() <= np.iinfo(RIDES_DTYPE).max))
+            )
+            casts[col] = RIDES_DTYPE if fits else FEATURE_DTYPE
+
+    casts = {col: dtype for col, dtype in casts.items() if ts_data[col].dtype != dtype}
+    if not casts:
+        return ts_data
+
+    # a few narrow columns, so replace them in a shallow copy instead of
+    # letting astype copy every other column of a wide frame
+    ts_data = ts_data.copy(deep=False)
+    for col, dtype in casts.items():
+        ts_data[col] = ts_data[col].astype(dtype)
+    return ts_data
+
+
+def compact_features(features: pd.DataFrame) -> pd.DataFrame:
+    """
+    Applies `compact_ts_data` and casts every lag column to `FEATURE_DTYPE`.
+    Timestamps and calendar columns keep their dtypes.
+    """
+    features = compact_ts_data(features)
+    casts = {c: FEATURE_DTYPE for c in get_feature_columns(features.columns)
+             if features[c].dtype != FEATURE_DTYPE}
+    return features.astype(casts) if casts else features
+
+
+def to_store_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the compact columns of `df` back to int64 / float64 before they
+    are inserted into a Hopsworks feature group, whose columns were created
+    as bigint and double. Compact dtypes are for memory only.
+    """
+    casts = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_integer_dtype(dtype) and dtype != np.int64:
+            casts[col] = np.int64
+        elif dtype == FEATURE_DTYPE:
+            casts[col] = np.float64
+    return df.astype(casts) if casts else df
+
+
+def from_store_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the timestamp columns of a frame read from Hopsworks, where
+    `pickup_ts` is stored as epoch milliseconds, to `datetime64[ns, UTC]`,
+    so every pipeline gets the same dtype whatever the feature group holds
+    """
+    casts = {col: to_datetime_utc(df[col]) for col in TIMESTAMP_COLUMNS
+             if col in df.columns and df[col].dtype != 'datetime64[ns, UTC]'}
+    return df.assign(**casts) if casts else df
+
+
+def memory_report(dfs: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Returns the memory used by each DataFrame in `dfs`, in megabytes, before
+    and after `compact_features`
+    """
+    rows = []
+    for name, df in dfs.items():
+        before = df.memory_usage(deep=True).sum() / 1024**2
+        after = compact_features(df).memory_usage(deep=True).sum() / 1024**2
+        rows.append({
+            'data': name,
+            'shape': df.shape,
+            'before_mb': round(before, 1),
+            'after_mb': round(after, 1),
+            'reduction': round(before / after, 2),
+        })
+    return pd.DataFrame(rows)
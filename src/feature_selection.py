@@ -0,0 +1,172 @@
+# src/feature_selection.py
+import re
+from typing import List, Optional
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from src.config import FEATURE_SELECTION_MAE_TOLERANCE
+from src.logger import get_logger
+
+logger = get_logger()
+
+LAG_PATTERN = re.compile(r'^lag_(\d+)$')
+
+# fixed parameters of the models fit to rank and compare lag sets, before
+# the hyperparameter search
+SELECTION_PARAMS = {
+    'objective': 'regression',
+    'metric': 'mae',
+    'verbosity': -1,
+    'num_leaves': 63,
+    'feature_fraction': 0.8,
+    'learning_rate': 0.1,
+}
+SELECTION_ROUNDS = 300
+SELECTION_EARLY_STOPPING_ROUNDS = 30
+
+
+def get_lag_columns(columns) -> List[str]:
+    """`lag_k` columns of `columns`, in their order"""
+    return [col for col in columns if LAG_PATTERN.match(str(col))]
+
+
+def required_lags(expected_features: List[str], default: int = 0) -> int:
+    """Largest `k` among the `lag_k` features, i.e. hours of history a model needs"""
+    lags = [int(LAG_PATTERN.match(col).group(1)) for col in get_lag_columns(expected_features)]
+    return max(lags, default=default)
+
+
+def _fit(X_fit: pd.DataFrame, y_fit, X_valid: pd.DataFrame, y_valid) -> lgb.Booster:
+    train_set = lgb.Dataset(X_fit, y_fit, params={'verbosity': -1})
+    valid_set = lgb.Dataset(X_valid, y_valid, reference=train_set)
+    return lgb.train(
+        SELECTION_PARAMS,
+        train_set,
+        num_boost_round=SELECTION_ROUNDS,
+        valid_sets=[valid_set],
+        callbacks=[lgb.early_stopping(SELECTION_EARLY_STOPPING_ROUNDS, verbose=False)],
+    )
+
+
+def _mae(booster: lgb.Booster, X: np.ndarray, y: np.ndarray) -> float:
+    return float(np.mean(np.abs(y - booster.predict(X, num_iteration=booster.best_iteration))))
+
+
+def gain_importance(booster: lgb.Booster) -> pd.Series:
+    """Total split gain of every feature"""
+    return pd.Series(booster.feature_importance('gain'), index=booster.feature_name(), dtype=np.float64)
+
+
+def permutation_importance(
+    booster: lgb.Booster,
+    X_valid: pd.DataFrame,
+    y_valid,
+    columns: Optional[List[str]] = None,
+    n_repeats: int = 2,
+    seed: int = 42,
+) -> pd.Series:
+    """
+    Mean increase of the validation MAE when a column of `columns` is
+    shuffled, the others kept. Shuffles one column of a float32 copy in
+    place, then restores it.
+    """
+    rng = np.random.default_rng(seed)
+    X = X_valid.to_numpy(dtype=np.float32, copy=True)
+    y = np.asarray(y_valid, dtype=np.float64)
+    base_mae = _mae(booster, X, y)
+
+    importance = {}
+    for col in columns if columns is not None else X_valid.columns:
+        j = X_valid.columns.get_loc(col)
+        original = X[:, j].copy()
+        increases = []
+        for _ in range(n_repeats):
+            X[:, j] = rng.permutation(original)
+            increases.append(_mae(booster, X, y) - base_mae)
+        X[:, j] = original
+        importance[col] = float(np.mean(increases))
+
+    return pd.Series(importance, dtype=np.float64)
+
+
+def rank_lags(booster: lgb.Booster, X_valid: pd.DataFrame, y_valid) -> pd.DataFrame:
+    """
+    Lag columns by permutation importance on the validation hours, ties by
+    gain. Lags the model never splits on have no permutation importance, so
+    only the ones with gain are shuffled.
+    """
+    gain = gain_importance(booster)
+    lags = get_lag_columns(X_valid.columns)
+    used = [lag for lag in lags if gain.get(lag, 0.0) > 0]
+
+    ranking = pd.DataFrame({'gain': gain.reindex(lags).fillna(0.0)})
+    ranking['permutation'] = permutation_importance(booster, X_valid, y_valid, used).reindex(lags).fillna(0.0)
+    return ranking.sort_values(['permutation', 'gain'], ascending=False)
+
+
+def candidate_sizes(n_lags: int) -> List[int]:
+    """1, 2, 4, ... lags, up to all of them"""
+    sizes = [2 ** i for i in range(int(np.log2(max(n_lags, 1))) + 1)]
+    return sorted(set(sizes + [n_lags]))
+
+
+def select_lag_features(
+    X_fit: pd.DataFrame,
+    y_fit,
+    X_valid: pd.DataFrame,
+    y_valid,
+    mae_tolerance: float = FEATURE_SELECTION_MAE_TOLERANCE,
+    X_holdout: Optional[pd.DataFrame] = None,
+    y_holdout=None,
+) -> List[str]:
+    """
+    Smallest set of top-ranked lags whose model is within `mae_tolerance`
+    (relative) of the validation MAE with every lag. Lags are ranked on a
+    model with all of them, then sets of 1, 2, 4, ... top lags are refit
+    until one is close enough. Columns that are not lags are always kept.
+
+    With `X_holdout`, hours used neither to rank lags nor to stop boosting,
+    a set must also be within `mae_tolerance` of the holdout MAE with every
+    lag, so the tolerance holds on hours the selection never saw.
+
+    Returns:
+        List[str]: the kept columns, in the order of `X_fit`
+    """
+    lags = get_lag_columns(X_fit.columns)
+    if not lags:
+        return X_fit.columns.tolist()
+
+    def holdout_mae(booster: lgb.Booster, columns: List[str]) -> float:
+        return _mae(booster, X_holdout[columns].to_numpy(dtype=np.float32), np.asarray(y_holdout, dtype=np.float64))
+
+    booster = _fit(X_fit, y_fit, X_valid, y_valid)
+    full_mae = _mae(booster, X_valid.to_numpy(dtype=np.float32), np.asarray(y_valid, dtype=np.float64))
+    full_holdout_mae = holdout_mae(booster, X_fit.columns.tolist()) if X_holdout is not None else None
+    ranking = rank_lags(booster, X_valid, y_valid)
+    others = [col for col in X_fit.columns if col not in set(lags)]
+    logger.info(f"🏅 Ranked {len(lags)} lags, validation MAE with all of them {full_mae:.4f}"
+                + (f", holdout MAE {full_holdout_mae:.4f}" if full_holdout_mae is not None else ""))
+
+    for size in candidate_sizes(len(lags)):
+        kept = set(others) | set(ranking.index[:size])
+        columns = [col for col in X_fit.columns if col in kept]
+        if size == len(lags):
+            break
+        booster = _fit(X_fit[columns], y_fit, X_valid[columns], y_valid)
+        mae = _mae(booster, X_valid[columns].to_numpy(dtype=np.float32), np.asarray(y_valid, dtype=np.float64))
+        if mae > full_mae * (1 + mae_tolerance):
+            logger.info(f"   top {size} lags: validation MAE {mae:.4f}")
+            continue
+        if full_holdout_mae is None:
+            logger.info(f"   top {size} lags: validation MAE {mae:.4f}")
+            break
+        mae_holdout = holdout_mae(booster, columns)
+        logger.info(f"   top {size} lags: validation MAE {mae:.4f}, holdout MAE {mae_holdout:.4f}")
+        if mae_holdout <= full_holdout_mae * (1 + mae_tolerance):
+            break
+
+    logger.info(f"✂️ Kept {len(columns) - len(others)} of {len(lags)} lags "
+                f"(up to lag_{required_lags(columns)})")
+    return columns
@@ -1,58 +1,239 @@
 # src/feature_store_api.py
+import hashlib
 import pandas as pd
 import hopsworks
 import hsfs
-from typing import Optional, List
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, List, Tuple, TypeVar
 from src import config
 from src.logger import get_logger
+from src.dtype_policy import compact_ts_data, from_store_dtypes, to_store_dtypes
+from src.lag_state import LagState, lag_block_from_latest_rows
 from src.feature_metadata import FeatureGroupConfig, FeatureViewConfig
-from src.config import FEATURE_VIEW_METADATA
+from src.config import FEATURE_STORE_SESSION_TTL_SECONDS, FEATURE_VIEW_METADATA
 import os
 import joblib
+import numpy as np
 
 logger = get_logger()
 
+T = TypeVar("T")
 
-def get_feature_store() -> hsfs.feature_store.FeatureStore:
-    project = hopsworks.login(
+# HTTP statuses of an expired or rejected Hopsworks session
+AUTH_ERROR_STATUSES = (401, 403)
+
+
+def hopsworks_login():
+    return hopsworks.login(
         project=config.HOPSWORKS_PROJECT_NAME,
         api_key_value=config.HOPSWORKS_API_KEY,
     )
-    return project.get_feature_store()
+
+
+def is_auth_error(error: Exception) -> bool:
+    """Whether `error` comes from an expired or rejected login"""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", getattr(error, "status_code", None))
+    if status is not None:
+        return status in AUTH_ERROR_STATUSES
+    message = str(error).lower()
+    return "unauthorized" in message or "token expired" in message
+
+
+class FeatureStoreSession:
+    """
+    Process-wide Hopsworks login, its feature store and the feature group and
+    feature view handles looked up through it, memoized by (kind, name,
+    version). All of them are dropped after `ttl_seconds`, or when a call
+    fails with an auth error, and rebuilt on the next use.
+
+    `login` returns a Hopsworks project (anything with `get_feature_store()`),
+    so a fake client can stand in for Hopsworks. `stats` counts the logins,
+    the handle lookups that reached the feature store and the ones served
+    from the cache.
+    """
+    def __init__(
+        self,
+        login: Callable[[], Any] = hopsworks_login,
+        ttl_seconds: float = FEATURE_STORE_SESSION_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.login = login
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        self._feature_store = None
+        self._logged_in_at = None
+        self._handles: Dict[Tuple[str, str, int], Any] = {}
+        self._lock = threading.RLock()
+        self.stats = {"logins": 0, "reconnects": 0, "handle_lookups": 0, "handle_hits": 0}
+
+    def _is_expired(self) -> bool:
+        return self._feature_store is None or self.clock() - self._logged_in_at >= self.ttl_seconds
+
+    def feature_store(self) -> hsfs.feature_store.FeatureStore:
+        """The feature store of the current login, logging in when there is none or it expired"""
+        with self._lock:
+            if self._is_expired():
+                self.invalidate()
+                logger.info("🔑 Logging in to Hopsworks...")
+                self._feature_store = self.login().get_feature_store()
+                self._logged_in_at = self.clock()
+                self.stats["logins"] += 1
+            return self._feature_store
+
+    def invalidate(self) -> None:
+        """Drops the login and every handle, the next call logs in again"""
+        with self._lock:
+            self._feature_store = None
+            self._logged_in_at = None
+            self._handles.clear()
+
+    def run(self, fn: Callable[[], T]) -> T:
+        """Runs `fn`, logging in again and retrying once if it fails with an auth error"""
+        try:
+            return fn()
+        except Exception as e:
+            if not is_auth_error(e):
+                raise
+            logger.warning(f"⚠️ Hopsworks session rejected ({e}), logging in again")
+            self.invalidate()
+            self.stats["reconnects"] += 1
+            return fn()
+
+    def handle(self, kind: str, name: str, version: int, lookup: Callable[[hsfs.feature_store.FeatureStore], T]) -> T:
+        """Memoized `lookup(feature_store)` for the (kind, name, version) handle"""
+        key = (kind, name, version)
+        with self._lock:
+            if not self._is_expired() and key in self._handles:
+                self.stats["handle_hits"] += 1
+                return self._handles[key]
+
+            handle = self.run(lambda: lookup(self.feature_store()))
+            self._handles[key] = handle
+            self.stats["handle_lookups"] += 1
+            return handle
+
+    def log_stats(self) -> None:
+        logger.info(
+            f"🔑 Feature store session: {self.stats['logins']} logins ({self.stats['reconnects']} after auth errors), "
+            f"{self.stats['handle_lookups']} handle lookups, {self.stats['handle_hits']} served from cache"
+        )
+
+
+_session: Optional[FeatureStoreSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> FeatureStoreSession:
+    """The process-wide `FeatureStoreSession`, created on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = FeatureStoreSession()
+        return _session
+
+
+def set_session(session: FeatureStoreSession) -> FeatureStoreSession:
+    """Replaces the process-wide session, e.g. with one on a fake client"""
+    global _session
+    with _session_lock:
+        _session = session
+        return session
+
+
+def get_feature_store() -> hsfs.feature_store.FeatureStore:
+    return get_session().feature_store()
 
 
 def get_feature_group(metadata: FeatureGroupConfig) -> hsfs.feature_group.FeatureGroup:
-    fs = get_feature_store()
-    return fs.get_feature_group(name=metadata.name, version=metadata.version)
+    return get_session().handle(
+        "feature_group", metadata.name, metadata.version,
+        lambda fs: fs.get_feature_group(name=metadata.name, version=metadata.version),
+    )
 
 
 def get_or_create_feature_group(metadata: FeatureGroupConfig) -> hsfs.feature_group.FeatureGroup:
-    return get_feature_store().get_or_create_feature_group(
-        name=metadata.name,
-        version=metadata.version,
-        description=metadata.description,
-        primary_key=metadata.primary_key,
-        event_time=metadata.event_time,
-        online_enabled=metadata.online_enabled,
+    return get_session().handle(
+        "feature_group", metadata.name, metadata.version,
+        lambda fs: fs.get_or_create_feature_group(
+            name=metadata.name,
+            version=metadata.version,
+            description=metadata.description,
+            primary_key=metadata.primary_key,
+            event_time=metadata.event_time,
+            online_enabled=metadata.online_enabled,
+        ),
+    )
+
+
+def get_feature_view(metadata: FeatureViewConfig) -> hsfs.feature_view.FeatureView:
+    return get_session().handle(
+        "feature_view", metadata.name, metadata.version,
+        lambda fs: fs.get_feature_view(name=metadata.name, version=metadata.version),
     )
 
 
 def get_or_create_feature_view(metadata: FeatureViewConfig) -> hsfs.feature_view.FeatureView:
-    fs = get_feature_store()
-    try:
-        return fs.get_feature_view(name=metadata.name, version=metadata.version)
-    except Exception:
-        logger.info(
-            f"Feature view '{metadata.name}' v{metadata.version} not found. "
-            f"Creating from feature group '{metadata.feature_group.name}'."
-        )
-        fg = get_or_create_feature_group(metadata.feature_group)
-        query = fg.select_all()
-        return fs.create_feature_view(
-            name=metadata.name,
-            version=metadata.version,
-            query=query,
-        )
+    def lookup(fs: hsfs.feature_store.FeatureStore) -> hsfs.feature_view.FeatureView:
+        try:
+            return fs.get_feature_view(name=metadata.name, version=metadata.version)
+        except Exception as e:
+            if is_auth_error(e):
+                raise
+            logger.info(
+                f"Feature view '{metadata.name}' v{metadata.version} not found. "
+                f"Creating from feature group '{metadata.feature_group.name}'."
+            )
+            fg = get_or_create_feature_group(metadata.feature_group)
+            query = fg.select_all()
+            return fs.create_feature_view(
+                name=metadata.name,
+                version=metadata.version,
+                query=query,
+            )
+
+    return get_session().handle("feature_view", metadata.name, metadata.version, lookup)
+
+
+def get_or_create_projected_feature_view(metadata: FeatureViewConfig, columns: List[str]) -> hsfs.feature_view.FeatureView:
+    """
+    Feature view on `fg.select(columns)`, so its batch reads only transfer
+    those columns. Columns the feature group lacks (e.g. lags built locally)
+    are left out, its primary key and event time are always kept. There is
+    one view per column set, named after a digest of the columns.
+    """
+    fg = get_or_create_feature_group(metadata.feature_group)
+    keys = [*metadata.feature_group.primary_key, metadata.feature_group.event_time]
+    available = {feature.name for feature in fg.features}
+    columns = [col for col in dict.fromkeys([*keys, *columns]) if col in available]
+    name = f"{metadata.name}_{hashlib.sha1(','.join(sorted(columns)).encode()).hexdigest()[:8]}"
+
+    def lookup(fs: hsfs.feature_store.FeatureStore) -> hsfs.feature_view.FeatureView:
+        try:
+            return fs.get_feature_view(name=name, version=metadata.version)
+        except Exception as e:
+            if is_auth_error(e):
+                raise
+            logger.info(f"Feature view '{name}' v{metadata.version} not found. Creating it on {columns}.")
+            return fs.create_feature_view(name=name, version=metadata.version, query=fg.select(columns))
+
+    return get_session().handle("feature_view", name, metadata.version, lookup)
+
+
+def get_batch_data(metadata: FeatureViewConfig, columns: Optional[List[str]] = None, **kwargs) -> pd.DataFrame:
+    """
+    `get_batch_data(**kwargs)` of the feature view, logging in again on auth
+    errors, with `pickup_ts` as a UTC datetime. With `columns`, it is read
+    from a view on only those columns.
+    """
+    def read() -> pd.DataFrame:
+        if columns is None:
+            return get_or_create_feature_view(metadata).get_batch_data(**kwargs)
+        return get_or_create_projected_feature_view(metadata, columns).get_batch_data(**kwargs)
+
+    return from_store_dtypes(get_session().run(read))
 
 
 def load_fallback_features() -> pd.DataFrame:
@@ -71,16 +252,12 @@ def load_fallback_features() -> pd.DataFrame:
     if "pickup_hour" in df.columns:
         df = df.rename(columns={"pickup_hour": "pickup_ts"})
 
-    return df
+    return compact_ts_data(df)
 
 
 def load_batch_of_features_from_store(feature_view_metadata: FeatureViewConfig, n_features: int) -> pd.DataFrame:
-    fs = get_feature_store()
-    fv = fs.get_feature_view(
-        name=feature_view_metadata.name,
-        version=feature_view_metadata.version,
-    )
-    df = fv.get_batch_data().sort_values("pickup_ts")
+    df = get_session().run(lambda: get_feature_view(feature_view_metadata).get_batch_data())
+    df = from_store_dtypes(df).sort_values("pickup_ts")
 
     if df.empty:
         logger.warning("⚠️ No features found in feature store")
@@ -94,22 +271,102 @@ def load_batch_of_features_from_store(feature_view_metadata: FeatureViewConfig,
     return features_now
 
 
-def load_predictions_from_store(from_pickup_hour=None, to_pickup_hour=None) -> pd.DataFrame:
-    fs = get_feature_store()
-    fg = fs.get_or_create_feature_group(
-        name=config.FEATURE_GROUP_PREDICTIONS_METADATA.name,
-        version=config.FEATURE_GROUP_PREDICTIONS_METADATA.version,
+# the only columns a lag state is built from
+LAG_STATE_COLUMNS = ["pickup_ts", "pickup_location_id", "rides"]
+
+
+def rebuild_lag_state_from_store(
+    feature_view_metadata: FeatureViewConfig,
+    lag_state: LagState,
+) -> LagState:
+    """
+    Fallback that refills `lag_state` from the whole feature view, e.g. on the
+    first run or after an interrupted update.
+    """
+    logger.info("🔁 Rebuilding lag state from the feature store...")
+    features = get_batch_data(feature_view_metadata, columns=LAG_STATE_COLUMNS)
+    lag_state.reset()
+    lag_state.update(features)
+    logger.info(f"✅ Lag state rebuilt up to {lag_state.last_hour}")
+    return lag_state
+
+
+def load_lag_state_from_store(
+    feature_view_metadata: FeatureViewConfig,
+    n_features: int,
+    lag_state: Optional[LagState] = None,
+) -> LagState:
+    """
+    Brings the local lag state up to date, reading only the hours after its
+    last hour from the feature view. Falls back to a full rebuild when the
+    state is missing or was left incomplete.
+    """
+    lag_state = lag_state or LagState(n_lags=n_features)
+    if not lag_state.is_valid():
+        return rebuild_lag_state_from_store(feature_view_metadata, lag_state)
+
+    newest = get_batch_data(
+        feature_view_metadata, columns=LAG_STATE_COLUMNS, start_time=lag_state.last_hour + pd.Timedelta(hours=1),
     )
+    n_hours = lag_state.update(newest)
+    logger.info(f"🕐 Lag state updated with {n_hours} new hours, up to {lag_state.last_hour}")
+    return lag_state
+
+
+def load_lag_features_from_store(feature_view_metadata: FeatureViewConfig, n_features: int) -> pd.DataFrame:
+    """
+    Model input row of the newest hour for every location (`rides`,
+    calendar features and lags, as in training), from the local lag state
+    instead of a full scan of the feature view.
+    """
+    return load_lag_state_from_store(feature_view_metadata, n_features).to_features()
+
+
+def check_lag_state_consistency(
+    feature_view_metadata: FeatureViewConfig,
+    n_features: int,
+    lag_state: Optional[LagState] = None,
+) -> bool:
+    """
+    Compares the lags in `lag_state` with the ones built from
+    `load_batch_of_features_from_store`, and logs how many differ.
+    """
+    lag_state = lag_state or load_lag_state_from_store(feature_view_metadata, n_features)
+    features_now = load_batch_of_features_from_store(feature_view_metadata, lag_state.n_hours)
+    expected = lag_block_from_latest_rows(features_now, lag_state.n_hours, lag_state.location_ids)
+
+    mismatches = ~np.isclose(lag_state.history_block(), expected, equal_nan=True)
+    if mismatches.any():
+        logger.warning(
+            f"⚠️ Lag state differs from the feature store in {int(mismatches.sum())} "
+            f"lags of {int(mismatches.any(axis=1).sum())} locations"
+        )
+        return False
+
+    logger.info("✅ Lag state matches the feature store")
+    return True
+
+
+def get_predictions_feature_group() -> hsfs.feature_group.FeatureGroup:
+    metadata = config.FEATURE_GROUP_PREDICTIONS_METADATA
+    return get_session().handle(
+        "feature_group", metadata.name, metadata.version,
+        lambda fs: fs.get_or_create_feature_group(name=metadata.name, version=metadata.version),
+    )
+
+
+def load_predictions_from_store(from_pickup_hour=None, to_pickup_hour=None) -> pd.DataFrame:
+    session = get_session()
 
     df = pd.DataFrame()
     try:
         print("🔎 Trying offline store read...")
-        df = fg.read()
+        df = session.run(lambda: get_predictions_feature_group().read())
         print(f"✅ Loaded predictions from OFFLINE store, shape={df.shape}")
     except Exception as e:
         print(f"⚠️ Offline store read failed ({e}), trying online store...")
         try:
-            df = fg.read(read_options={"use_hive": False})
+            df = session.run(lambda: get_predictions_feature_group().read(read_options={"use_hive": False}))
             print(f"✅ Loaded predictions from ONLINE store, shape={df.shape}")
         except Exception as e2:
             print(f"❌ Could not read from online store either: {e2}")
@@ -141,22 +398,19 @@ def log_predictions_to_store(predictions_df: pd.DataFrame):
     print("Columns:", predictions_df.columns.tolist())
     print(predictions_df.head(5))
 
-    fs = get_feature_store()
-    fg = fs.get_or_create_feature_group(
-        name=config.FEATURE_GROUP_PREDICTIONS_METADATA.name,
-        version=config.FEATURE_GROUP_PREDICTIONS_METADATA.version,
-    )
-
     # Insert into feature group (online + offline)
-    fg.insert(predictions_df, write_options={"wait_for_job": False})
+    store_df = to_store_dtypes(predictions_df)
+    get_session().run(
+        lambda: get_predictions_feature_group().insert(store_df, write_options={"wait_for_job": False})
+    )
     print("✅ Inserted predictions into feature group.")
 
     if "pickup_hour" in predictions_df.columns:
         try:
-            fg.materialize(
+            get_session().run(lambda: get_predictions_feature_group().materialize(
                 start_time=predictions_df["pickup_hour"].min(),
                 end_time=predictions_df["pickup_hour"].max(),
-            )
+            ))
             print("✅ Materialized predictions to OFFLINE store.")
         except Exception as e:
             print(f"⚠️ Auto-materialization failed: {e}")
@@ -181,3 +435,5 @@ if __name__ == "__main__":
         print(f"✅ Feature View available: {fv.name} v{fv.version}")
     except Exception as e:
         print(f"❌ Feature View issue: {e}")
+
+    get_session().log_stats()
@@ -3,14 +3,81 @@ from src import config
 from src.data import transform_raw_data_into_ts_data
 
 # src/features.py
+from typing import Tuple, Union
+
 import numpy as np
 import pandas as pd
+from src.dtype_policy import compact_features
+from src.location_hour_matrix import LocationHourMatrix
+
+
+def add_lag_features_and_target(
+    df: pd.DataFrame,
+    n_lags: int,
+    return_lag_block: bool = False,
+    time_col: str = "pickup_ts",
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, np.ndarray]]:
+    """
+    Adds `lag_1`..`lag_{n_lags}` and `target_rides_next_hour` and drops rows
+    with NaNs. Only the rows that survive are ever materialized.
+
+    Lags are read by timestamp from a `LocationHourMatrix` of `rides`, so
+    `lag_k` is the value exactly `k` hours before the row of the same
+    `pickup_location_id`. Rows whose lags or target fall on an hour missing
+    from `df` are dropped, instead of shifting over the gap.
+    """
+    matrix = LocationHourMatrix.from_ts_data(df, time_col=time_col, value_col="rides")
+    rows, cols = matrix.locate(df["pickup_location_id"].to_numpy(), df[time_col])
+    target = matrix.shifted(rows, cols, hours=1)
+
+    keep = (
+        (rows >= 0)
+        & (cols >= n_lags)
+        & ~np.isnan(target)
+        & df.notna().all(axis=1).to_numpy()
+    )
+    kept = np.flatnonzero(keep)
+    lag_block = matrix.lag_block(rows[kept], cols[kept], n_lags)
+
+    # missing hours and NaN rides show up as NaN lags, which drops those rows
+    complete = ~np.isnan(lag_block).any(axis=1)
+    if not complete.all():
+        kept, lag_block = kept[complete], lag_block[complete]
+
+    base = df.iloc[kept].reset_index(drop=True)
+    if return_lag_block:
+        base["target_rides_next_hour"] = target[kept]
+        return compact_features(base), lag_block
+
+    lag_df = pd.DataFrame(lag_block, columns=[f"lag_{lag}" for lag in range(1, n_lags + 1)])
+    df = pd.concat([base, lag_df], axis=1)
+    df["target_rides_next_hour"] = target[kept]
+
+    return compact_features(df)
 
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
+
+def build_features(
+    df: pd.DataFrame,
+    n_lags: int = config.N_FEATURES,
+    return_lag_block: bool = False,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, np.ndarray]]:
     """
     Build features for taxi demand prediction.
     - Keeps a separate datetime column for train/test splitting.
     - Generates time-based and lag features efficiently.
+
+    Lags are read by timestamp from one dense locations x hours matrix with a
+    strided view, instead of one groupby shift per lag.
+
+    Args:
+        df: DataFrame with `pickup_ts`, `pickup_location_id` and `rides`
+        n_lags: number of lag features `lag_1`..`lag_{n_lags}`
+        return_lag_block: if True, return the lag features separately as a
+            C-contiguous float32 array of shape (n_rows, n_lags), whose column
+            `lag - 1` is `lag_{lag}`, next to the DataFrame without them
+
+    Returns:
+        DataFrame with features and target, or (DataFrame, lag block)
     """
     # Ensure pickup_ts is datetime
     if not pd.api.types.is_datetime64_any_dtype(df["pickup_ts"]):
@@ -24,31 +91,30 @@ def build_features(df: pd.DataFrame) -> pd.DataFrame:
     df["day_of_week"] = df["pickup_ts"].dt.dayofweek
     df["month"] = df["pickup_ts"].dt.month
 
-    # Efficient lag features
-    lag_features = [
-        df.groupby("pickup_location_id")["rides"].shift(lag).rename(f"lag_{lag}")
-        for lag in range(1, config.N_FEATURES + 1)
-    ]
-    lag_df = pd.concat(lag_features, axis=1)
-    df = pd.concat([df, lag_df], axis=1)
-
-    # Target column
-    df["target_rides_next_hour"] = df.groupby("pickup_location_id")["rides"].shift(-1)
-
-    # Drop rows with NaNs created by shifting
-    df = df.dropna().reset_index(drop=True)
-
-    return df
+    # Lag features, target column, and drop rows with NaNs created by shifting
+    return add_lag_features_and_target(df, n_lags, return_lag_block)
 
 def build_lag_features(df: pd.DataFrame, lags: int = 653) -> pd.DataFrame:
     """
     Add lag features for demand prediction.
-    Assumes df has ['pickup_ts', 'rides'].
+    Assumes df has ['pickup_ts', 'rides'], and optionally
+    'pickup_location_id' to lag each location separately.
+    Lags are taken by timestamp, so hours missing from df give NaN lags.
     """
-    df = df.sort_values("pickup_ts").copy()
-    for lag in range(1, lags + 1):
-        df[f"lag_{lag}"] = df["rides"].shift(lag)
+    df = df.sort_values("pickup_ts").reset_index(drop=True)
+    location_col = "pickup_location_id" if "pickup_location_id" in df.columns else None
+    matrix = LocationHourMatrix.from_ts_data(
+        df, time_col="pickup_ts", value_col="rides", location_col=location_col
+    )
+    locations = df[location_col].to_numpy() if location_col else np.zeros(len(df), dtype=np.int64)
+    rows, cols = matrix.locate(locations, df["pickup_ts"])
+
+    lag_df = pd.DataFrame(
+        matrix.lag_block(rows, cols, lags),
+        columns=[f"lag_{lag}" for lag in range(1, lags + 1)],
+    )
+    df = pd.concat([df, lag_df], axis=1)
 
     # drop rows with NaNs introduced by shifting
     df = df.dropna().reset_index(drop=True)
-    return df
+    return compact_features(df)
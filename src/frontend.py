@@ -2,7 +2,8 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-from src.config import PREDICTIONS_PATH
+from src.config import DASHBOARD_HOURS
+from src.prediction_log import read_last_hours
 from src.logger import get_logger
 
 logger = get_logger()
@@ -11,24 +12,15 @@ logger = get_logger()
 # Data loader
 # -----------------------
 @st.cache_data
-def load_predictions(path: str = PREDICTIONS_PATH) -> pd.DataFrame:
-    """Load predictions from CSV, normalize columns, and cleanup for UI."""
+def load_predictions(n_hours: int = DASHBOARD_HOURS) -> pd.DataFrame:
+    """Load the last `n_hours` hours of the prediction log, normalize columns for UI."""
     try:
-        df = pd.read_csv(path)
+        df = read_last_hours(n_hours)
 
         # Rename predicted column for consistency
         if "predicted_rides_next_hour" in df.columns:
             df = df.rename(columns={"predicted_rides_next_hour": "predicted_demand"})
 
-        # Convert pickup_ts → datetime
-        if "pickup_ts" in df.columns:
-            df["pickup_ts"] = pd.to_datetime(df["pickup_ts"], unit="ms", errors="coerce")
-            df["pickup_ts"] = df["pickup_ts"].dt.floor("h")
-
-        # Drop pickup_hour (not user-friendly)
-        if "pickup_hour" in df.columns:
-            df = df.drop(columns=["pickup_hour"])
-
         # Reorder columns for clarity
         cols = ["pickup_location_id", "pickup_ts", "rides", "predicted_demand"]
         df = df[[c for c in cols if c in df.columns]]
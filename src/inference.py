@@ -1,11 +1,19 @@
 # src/inference.py
 import os
 import joblib
+import numpy as np
 import pandas as pd
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from src.config import MODEL_NAME, MODEL_VERSION, PREDICTIONS_PATH
-from src.feature_store_api import get_feature_store, get_or_create_feature_view
+from typing import List, Optional, Tuple
+from src.config import FORECAST_HOURS, FORECASTS_PATH, LOG_PREDICTION_FEATURES, MODEL_NAME, MODEL_VERSION, N_FEATURES
+from src.feature_store_api import get_batch_data, get_session, load_lag_features_from_store
 from src.config import FEATURE_VIEW_METADATA
+from src.dtype_policy import FEATURE_DTYPE, compact_features, to_datetime_utc
+from src.compiled_model import CompiledEnsemble, compile_pipeline
+from src.location_hour_matrix import CALENDAR_FEATURES, LocationHourMatrix
+from src.prediction_log import append_predictions, unlogged_rows
 
 from src.logger import get_logger
 
@@ -28,30 +36,360 @@ def load_model():
 
 
 
-def load_features_for_inference() -> pd.DataFrame:
-    """Load latest features from Hopsworks Feature Store."""
+def load_compiled_model():
+    """
+    Load the NumPy-only export of the trained model, which needs neither
+    sklearn nor LightGBM. It is (re)built from the model bundle when missing
+    or older than the bundle; models that cannot be compiled are served by
+    the joblib pipeline instead.
+    """
+    model_path = f"models/{MODEL_NAME}_v{MODEL_VERSION}.pkl"
+    compiled_path = f"models/{MODEL_NAME}_v{MODEL_VERSION}_compiled.npz"
+
+    if not os.path.exists(compiled_path) or os.path.getmtime(compiled_path) < os.path.getmtime(model_path):
+        logger.info("🛠️ Compiling model bundle...")
+        model, feature_names = load_model()
+        try:
+            compile_pipeline(model, feature_names).save(compiled_path)
+        except ValueError as e:
+            logger.warning(f"{e}. ⚠️ Using the joblib pipeline instead")
+            return model, feature_names
+
+    compiled = CompiledEnsemble.load(compiled_path)
+    logger.info(f"✅ Compiled model loaded with {len(compiled.roots)} trees.")
+    return compiled, compiled.feature_names
+
+
+def load_features_for_inference(expected_features: Optional[list] = None) -> pd.DataFrame:
+    """
+    Load latest features from Hopsworks Feature Store. With
+    `expected_features`, only those columns and the ones lags are built
+    from are read.
+    """
     logger.info("📊 Loading features for inference...")
-    fv = get_or_create_feature_view(FEATURE_VIEW_METADATA)
-    features = fv.get_batch_data()
+    columns = None
+    if expected_features is not None:
+        columns = list(dict.fromkeys(["pickup_ts", "pickup_location_id", "rides", *expected_features]))
+    features = get_batch_data(FEATURE_VIEW_METADATA, columns=columns)
     logger.info(f"➡️ Features shape before preprocessing: {features.shape}")
     return features
 
 
+def load_latest_features(expected_features: list) -> pd.DataFrame:
+    """
+    Model input row of the newest hour for every location, from the local
+    lag state: only the hours after its last hour are read from the feature
+    view, which is scanned whole only when the state is rebuilt. Falls back
+    to that scan when the model expects columns the lag state does not hold.
+    """
+    n_lags = max((lag for lag in map(_lag, expected_features) if lag is not None), default=N_FEATURES)
+    features = load_lag_features_from_store(FEATURE_VIEW_METADATA, n_lags)
+    missing = [col for col in expected_features if col not in features.columns]
+    if not missing:
+        return features
+
+    logger.warning(f"⚠️ Lag state lacks {len(missing)} expected features {missing[:10]}, scanning the feature view")
+    # every lag up to the largest one, which the forecast shifts through
+    features = load_features_for_inference(expected_features)
+    all_lags = [f"lag_{lag}" for lag in range(1, n_lags + 1)]
+    return latest_rows(add_missing_lag_features(features, [*expected_features, *all_lags]))
+
+
+def add_missing_lag_features(
+    features: pd.DataFrame,
+    expected_features: list,
+    time_col: str = "pickup_ts",
+) -> pd.DataFrame:
+    """
+    Adds the `lag_k` columns in `expected_features` that `features` lacks,
+    read by timestamp from a `LocationHourMatrix` of its `rides`. Lags that
+    fall before the first hour, or on an hour missing from `features`, are NaN.
+    """
+    lags = sorted({
+        int(col[len("lag_"):]) for col in expected_features
+        if col.startswith("lag_") and col[len("lag_"):].isdigit() and col not in features.columns
+    })
+    if not lags or time_col not in features.columns:
+        return features
+
+    matrix = LocationHourMatrix.from_ts_data(features, time_col=time_col, value_col="rides")
+    rows, cols = matrix.locate(features["pickup_location_id"].to_numpy(), features[time_col])
+    lag_block = matrix.lag_block(rows, cols, max(lags))
+
+    lag_df = pd.DataFrame(
+        lag_block[:, np.array(lags) - 1],
+        columns=[f"lag_{lag}" for lag in lags],
+        index=features.index,
+    )
+    logger.info(f"🧮 Built {len(lags)} lag features from {matrix.n_hours} hours of rides")
+    return pd.concat([features, lag_df], axis=1)
+
+
+def epoch_seconds(values: pd.Series) -> np.ndarray:
+    """int64 epoch seconds of a datetime column, whatever its unit"""
+    return values.array.as_unit("s").asi8
+
+
+# above this many runs of adjacent columns, one gather is faster than slices
+MAX_RUNS = 16
+
+
+@dataclass(frozen=True)
+class AlignmentPlan:
+    """
+    How to build the float32 model input of `expected_features` from frames
+    with one input schema: which input columns go to which slots (copied as
+    slices when they form a few runs of adjacent columns), which are
+    datetimes cast to epoch seconds, and which slots have no input and are
+    filled with 0. Compiled once per (schema, expected features) pair.
+
+    Epoch seconds are rounded to 128s steps in float32, far below the hourly
+    grid the trees split on.
+    """
+    expected_features: Tuple[str, ...]
+    source_idx: np.ndarray
+    target_idx: np.ndarray
+    runs: Optional[Tuple[Tuple[int, int, int], ...]]
+    datetime_source_idx: np.ndarray
+    datetime_target_idx: np.ndarray
+    fill_idx: np.ndarray
+
+    @property
+    def missing_features(self) -> List[str]:
+        return [self.expected_features[i] for i in self.fill_idx]
+
+    def apply(self, features: pd.DataFrame) -> np.ndarray:
+        """(len(features), len(expected_features)) float32 array, one write per slot"""
+        out = np.empty((len(features), len(self.expected_features)), dtype=FEATURE_DTYPE)
+        if self.runs is not None:
+            for source, target, length in self.runs:
+                out[:, target:target + length] = features.iloc[:, source:source + length].to_numpy(dtype=FEATURE_DTYPE)
+        elif len(self.source_idx):
+            out[:, self.target_idx] = features.iloc[:, self.source_idx].to_numpy(dtype=FEATURE_DTYPE)
+        for source, target in zip(self.datetime_source_idx, self.datetime_target_idx):
+            out[:, target] = epoch_seconds(features.iloc[:, source])
+        out[:, self.fill_idx] = 0
+        return out
+
+    def to_frame(self, matrix: np.ndarray) -> pd.DataFrame:
+        """DataFrame view of an aligned array, as the model was fit on one"""
+        return pd.DataFrame(matrix, columns=list(self.expected_features), copy=False)
+
+    def to_output_frame(self, features: pd.DataFrame) -> pd.DataFrame:
+        """
+        `features` in the order of `expected_features` with their own dtypes,
+        datetimes as epoch seconds and missing columns as 0. The caller's
+        frame is left as is.
+        """
+        output = features.reindex(columns=list(self.expected_features), fill_value=0)
+        for target in self.datetime_target_idx:
+            col = self.expected_features[target]
+            output[col] = epoch_seconds(output[col])
+        return compact_features(output)
+
+
+def _runs(sources: List[int], targets: List[int], dtypes: List[str]) -> Tuple[Tuple[int, int, int], ...]:
+    """
+    (source, target, length) runs where both positions go up by one and the
+    dtype does not change, so each run is read from one pandas block
+    """
+    runs = []
+    for source, target in zip(sources, targets):
+        if (runs and runs[-1][0] + runs[-1][2] == source and runs[-1][1] + runs[-1][2] == target
+                and dtypes[source] == dtypes[source - 1]):
+            runs[-1][2] += 1
+        else:
+            runs.append([source, target, 1])
+    return tuple(tuple(run) for run in runs)
+
+
+@lru_cache(maxsize=32)
+def compile_alignment_plan(schema: Tuple[Tuple[str, str], ...], expected_features: Tuple[str, ...]) -> AlignmentPlan:
+    """
+    Plan for input frames whose (column, dtype) pairs are `schema`. Columns
+    not in `expected_features` are ignored.
+    """
+    positions = {col: i for i, (col, _) in enumerate(schema)}
+    is_datetime = {col: dtype.startswith("datetime64") for col, dtype in schema}
+
+    sources, targets, datetime_sources, datetime_targets, fills = [], [], [], [], []
+    for target, col in enumerate(expected_features):
+        if col not in positions:
+            fills.append(target)
+        elif is_datetime[col]:
+            datetime_sources.append(positions[col])
+            datetime_targets.append(target)
+        else:
+            sources.append(positions[col])
+            targets.append(target)
+
+    runs = _runs(sources, targets, [dtype for _, dtype in schema])
+    return AlignmentPlan(
+        expected_features=expected_features,
+        source_idx=np.array(sources, dtype=np.intp),
+        target_idx=np.array(targets, dtype=np.intp),
+        runs=runs if len(runs) <= MAX_RUNS else None,
+        datetime_source_idx=np.array(datetime_sources, dtype=np.intp),
+        datetime_target_idx=np.array(datetime_targets, dtype=np.intp),
+        fill_idx=np.array(fills, dtype=np.intp),
+    )
+
+
+def get_alignment_plan(features: pd.DataFrame, expected_features: list) -> AlignmentPlan:
+    """Cached `AlignmentPlan` for the schema of `features`"""
+    schema = tuple(zip(features.columns, map(str, features.dtypes)))
+    return compile_alignment_plan(schema, tuple(expected_features))
+
+
+def align_features(features: pd.DataFrame, expected_features: list) -> Tuple[np.ndarray, AlignmentPlan]:
+    """Model input array of `features`, reporting the expected features it lacks"""
+    plan = get_alignment_plan(features, expected_features)
+    missing = plan.missing_features
+    if missing:
+        logger.warning(
+            f"⚠️ {len(missing)} of {len(expected_features)} expected features missing, filled with 0: "
+            f"{missing[:10]}{' ...' if len(missing) > 10 else ''}"
+        )
+    return plan.apply(features), plan
+
+
+def prepare_features(features: pd.DataFrame, expected_features: list) -> pd.DataFrame:
+    """Model input from feature store rows, same preprocessing as training."""
+    # Lags the model expects but the feature store does not serve
+    features = add_missing_lag_features(features, expected_features)
+    matrix, plan = align_features(features, expected_features)
+    return plan.to_frame(matrix)
+
+
 def run_inference(model, features: pd.DataFrame, expected_features: list) -> pd.DataFrame:
     """Run inference with trained model pipeline."""
-    # Preprocess datetime columns (same as training)
-    datetime_cols = features.select_dtypes(include=["datetime64[ns, UTC]", "datetime64[ns]"]).columns
-    for col in datetime_cols:
-        features[col] = features[col].astype("int64") // 10**9
+    features = add_missing_lag_features(features, expected_features)
+    matrix, plan = align_features(features, expected_features)
 
-    # Align columns
-    features = features.reindex(columns=expected_features, fill_value=0)
+    # Predict, and free the model input before the output frame is built
+    preds = model.predict(plan.to_frame(matrix))
+    del matrix
+
+    predictions = plan.to_output_frame(features)
+    predictions["predicted_rides_next_hour"] = preds
+    return predictions
+
+
+def _lag(col: str) -> Optional[int]:
+    """`k` of a `lag_k` column, else None"""
+    return int(col[len("lag_"):]) if col.startswith("lag_") and col[len("lag_"):].isdigit() else None
 
-    # Predict
-    preds = model.predict(features)
-    features["predicted_rides_next_hour"] = preds
-    return features
 
+def latest_rows(features: pd.DataFrame, time_col: str = "pickup_ts") -> pd.DataFrame:
+    """Last row of every location, ordered by location id"""
+    location_ids = features["pickup_location_id"].to_numpy()
+    times = features[time_col]
+    order = np.lexsort((times.array.asi8 if pd.api.types.is_datetime64_any_dtype(times) else times.to_numpy(),
+                        location_ids))
+    ids = location_ids[order]
+    is_last = np.append(ids[1:] != ids[:-1], True)
+    return features.iloc[order[is_last]]
+
+
+def history_block(
+    features: pd.DataFrame,
+    latest: pd.DataFrame,
+    n_lags: int,
+    time_col: str = "pickup_ts",
+) -> np.ndarray:
+    """
+    float32 (len(latest), n_lags + 1) array whose column `j` holds the rides
+    `j` hours before each row of `latest`: its `rides`, then `lag_1`..`lag_n`.
+    Lag columns of `latest` are used as they are, the others are read from a
+    `LocationHourMatrix` of the rides in `features` (NaN when unknown).
+    """
+    history = np.full((len(latest), n_lags + 1), np.nan, dtype=FEATURE_DTYPE)
+    if "rides" not in features.columns:
+        return history
+    history[:, 0] = latest["rides"].to_numpy(dtype=FEATURE_DTYPE)
+
+    lag_columns = {f"lag_{lag}": lag for lag in range(1, n_lags + 1) if f"lag_{lag}" in latest.columns}
+    if len(lag_columns) < n_lags:
+        matrix = LocationHourMatrix.from_ts_data(features, time_col=time_col, value_col="rides")
+        rows, cols = matrix.locate(latest["pickup_location_id"].to_numpy(), latest[time_col])
+        history[:, 1:] = matrix.lag_block(rows, cols, n_lags)
+    if lag_columns:
+        history[:, list(lag_columns.values())] = latest[list(lag_columns)].to_numpy(dtype=FEATURE_DTYPE)
+    return history
+
+
+def forecast_next_hours(
+    model,
+    features: pd.DataFrame,
+    expected_features: list,
+    n_hours: int = FORECAST_HOURS,
+    time_col: str = "pickup_ts",
+) -> pd.DataFrame:
+    """
+    Recursive forecast of the `n_hours` hours after the last hour of every
+    location. The model input of the last rows is aligned once; then at each
+    step all locations are predicted in one call, their ride history is
+    shifted by one hour in place with the predictions as the newest hour,
+    and the rides/lag, datetime and calendar slots of the input are
+    rewritten from it.
+
+    Returns:
+        pd.DataFrame: one row per (pickup_location_id, pickup_hour), with the
+        `horizon` in hours after the last known hour and the `prediction`
+    """
+    if time_col not in features.columns:
+        raise ValueError(f"❌ Forecasting needs the `{time_col}` column to know the hours ahead")
+    if not pd.api.types.is_datetime64_any_dtype(features[time_col]):
+        # e.g. epoch milliseconds, as the feature group stores `pickup_ts`
+        features = features.assign(**{time_col: to_datetime_utc(features[time_col])})
+
+    latest = latest_rows(features, time_col)
+    lags = {col: _lag(col) for col in expected_features if _lag(col) is not None}
+    history = history_block(features, latest, max(lags.values(), default=0), time_col)
+
+    # lags the model expects but the feature store does not serve
+    missing_lags = [col for col in lags if col not in latest.columns]
+    if missing_lags:
+        latest = pd.concat([
+            latest,
+            pd.DataFrame(history[:, [lags[col] for col in missing_lags]], columns=missing_lags, index=latest.index),
+        ], axis=1)
+    matrix, plan = align_features(latest, expected_features)
+
+    # slots rewritten at each step: rides and lags from the history, times
+    # and calendar features from the hour of each row
+    history_slots, history_cols, calendar_slots = [], [], []
+    for slot, col in enumerate(expected_features):
+        if col in lags or col == "rides":
+            history_slots.append(slot)
+            history_cols.append(lags.get(col, 0))
+        elif col in CALENDAR_FEATURES and col in latest.columns:
+            calendar_slots.append(slot)
+    datetime_seconds = np.empty((len(latest), len(plan.datetime_source_idx)), dtype=np.int64)
+    for i, source in enumerate(plan.datetime_source_idx):
+        datetime_seconds[:, i] = epoch_seconds(latest.iloc[:, source])
+    seconds = epoch_seconds(latest[time_col])
+
+    predictions = np.empty((n_hours, len(latest)), dtype=np.float64)
+    for step in range(n_hours):
+        if step:
+            history[:, 1:] = history[:, :-1]
+            history[:, 0] = predictions[step - 1]
+            matrix[:, history_slots] = history[:, history_cols]
+            matrix[:, plan.datetime_target_idx] = datetime_seconds + step * 3600
+            for slot in calendar_slots:
+                matrix[:, slot] = CALENDAR_FEATURES[expected_features[slot]](seconds + step * 3600)
+        predictions[step] = model.predict(plan.to_frame(matrix))
+
+    horizon = np.tile(np.arange(1, n_hours + 1, dtype=np.int16), len(latest))
+    hours = pd.DatetimeIndex(latest[time_col]).repeat(n_hours) + pd.to_timedelta(horizon, unit="h")
+    logger.info(f"🔮 Forecast {n_hours} hours for {len(latest)} locations")
+    return pd.DataFrame({
+        "pickup_location_id": latest["pickup_location_id"].to_numpy().repeat(n_hours),
+        "pickup_hour": hours,
+        "horizon": horizon,
+        "prediction": predictions.T.ravel(),
+    })
 
 
 def save_predictions(predictions_df: pd.DataFrame, path: str):
@@ -63,10 +401,18 @@ def save_predictions(predictions_df: pd.DataFrame, path: str):
 
 
 def main():
-    model, expected_features = load_model()
-    features = load_features_for_inference()
-    predictions_df = run_inference(model, features, expected_features)
-    save_predictions(predictions_df, PREDICTIONS_PATH)
+    model, expected_features = load_compiled_model()
+    features = load_latest_features(expected_features)
+
+    new_features = unlogged_rows(features)
+    if new_features.empty:
+        logger.info("⏭️ The newest hour is already in the prediction log")
+    else:
+        predictions_df = run_inference(model, new_features, expected_features)
+        append_predictions(predictions_df, new_features if LOG_PREDICTION_FEATURES else None)
+    forecast_df = forecast_next_hours(model, features, expected_features)
+    save_predictions(forecast_df, FORECASTS_PATH)
+    get_session().log_stats()
     logger.info("🚀 Inference finished successfully.")
 
 
@@ -1,6 +1,8 @@
 import pandas as pd
 import hopsworks
 
+from src.dtype_policy import to_store_dtypes
+
 def ingest_data_from_parquet(parquet_path: str):
     project = hopsworks.login()
     fs = project.get_feature_store()
@@ -27,7 +29,7 @@ def ingest_data_from_parquet(parquet_path: str):
     df["pickup_ts"] = pd.to_datetime(df["pickup_ts"], utc=True)
 
     # ✅ Insert into Hopsworks
-    feature_group.insert(df)
+    feature_group.insert(to_store_dtypes(df))
 
     print(f"✅ Inserted {len(df)} rows with proper UTC datetimes into Feature Group")
 
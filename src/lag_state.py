@@ -0,0 +1,208 @@
+# src/lag_state.py
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config import N_FEATURES
+from src.dtype_policy import FEATURE_DTYPE, LOCATION_ID_DTYPE, compact_features
+from src.location_hour_matrix import CALENDAR_FEATURES, ONE_HOUR_NS, LocationHourMatrix
+from src.paths import DATA_CACHE_DIR
+from src.ts_store import N_LOCATIONS
+
+LAG_STATE_DIR = DATA_CACHE_DIR / 'lag_state'
+RIDES_FILE_NAME = 'rides.f32'
+META_FILE_NAME = 'meta.json'
+
+
+def _hour_number(hour: pd.Timestamp) -> int:
+    """Hours since the epoch, used to place an hour in the ring buffer"""
+    return pd.Timestamp(hour).value // ONE_HOUR_NS
+
+
+class LagState:
+    """
+    Per-location ring buffer with the rides of the last `n_lags + 1` hours,
+    memory-mapped from a float32 file in `state_dir`: `last_hour` itself and
+    the `n_lags` hours before it, which is what a training row needs.
+
+    Hour `h` lives in column `h % n_hours`, so each run only writes the columns
+    of the hours that arrived since `last_hour`, and the features of
+    `last_hour` are one gather over the buffer. Hours that never arrived are NaN.
+    `meta.json` records the last hour and is marked `updating` while columns
+    are being written, so a crash mid-update is detected by `is_valid`.
+    """
+    def __init__(
+        self,
+        n_lags: int = N_FEATURES,
+        n_locations: int = N_LOCATIONS,
+        state_dir: Path = LAG_STATE_DIR,
+    ):
+        self.n_lags = n_lags
+        self.n_hours = n_lags + 1
+        self.n_locations = n_locations
+        self.state_dir = Path(state_dir)
+        self.location_ids = np.arange(1, n_locations + 1, dtype=LOCATION_ID_DTYPE)
+
+        self._rides = None
+        self._meta = self._load_meta()
+
+    @property
+    def _rides_path(self) -> Path:
+        return self.state_dir / RIDES_FILE_NAME
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.state_dir / META_FILE_NAME
+
+    @property
+    def last_hour(self) -> Optional[pd.Timestamp]:
+        last_hour = self._meta.get('last_hour')
+        return pd.Timestamp(last_hour) if last_hour else None
+
+    def _load_meta(self) -> dict:
+        if not self._meta_path.exists():
+            return {}
+        with open(self._meta_path) as f:
+            return json.load(f)
+
+    def _save_meta(self, **meta) -> None:
+        self._meta = {'n_lags': self.n_lags, 'n_hours': self.n_hours, 'n_locations': self.n_locations, **meta}
+        tmp_path = self._meta_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def is_valid(self) -> bool:
+        """
+        True if the buffer on disk has this shape, holds at least one hour and
+        its last update finished
+        """
+        return (
+            self._rides_path.exists()
+            and self._meta.get('n_lags') == self.n_lags
+            and self._meta.get('n_hours') == self.n_hours
+            and self._meta.get('n_locations') == self.n_locations
+            and self.last_hour is not None
+            and not self._meta.get('updating', False)
+        )
+
+    def _open(self, mode: str = 'r+') -> np.memmap:
+        if self._rides is None:
+            self._rides = np.memmap(
+                self._rides_path, dtype=FEATURE_DTYPE, mode=mode,
+                shape=(self.n_locations, self.n_hours),
+            )
+        return self._rides
+
+    def reset(self) -> None:
+        """Drops every hour from the buffer"""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._rides = None
+        rides = self._open(mode='w+')
+        rides[:] = np.nan
+        rides.flush()
+        self._save_meta(last_hour=None)
+
+    def update(self, ts_data: pd.DataFrame, time_col: str = 'pickup_ts') -> int:
+        """
+        Writes the hours of `ts_data` (`time_col`, `pickup_location_id`,
+        `rides`) that are newer than `last_hour` into the buffer. Hours between
+        `last_hour` and the newest one that are missing from `ts_data` become
+        NaN, and only the newest `n_hours` hours are ever written.
+
+        Returns:
+            int: number of hours written
+        """
+        if self._meta.get('updating', False):
+            raise ValueError('❌ Lag state was left mid-update, rebuild it first')
+        if (not self._rides_path.exists()
+                or self._meta.get('n_lags') != self.n_lags
+                or self._meta.get('n_hours') != self.n_hours
+                or self._meta.get('n_locations') != self.n_locations):
+            self.reset()
+
+        last_hour = self.last_hour
+        if last_hour is not None:
+            ts_data = ts_data[ts_data[time_col] > last_hour]
+        if ts_data.empty:
+            return 0
+
+        newest_hour = pd.Timestamp(ts_data[time_col].max()).floor('h')
+        if last_hour is not None:
+            first_hour = last_hour + pd.Timedelta(hours=1)
+        else:
+            first_hour = pd.Timestamp(ts_data[time_col].min()).floor('h')
+        first_hour = max(first_hour, newest_hour - pd.Timedelta(hours=self.n_hours - 1))
+
+        matrix = LocationHourMatrix.from_ts_data(
+            ts_data,
+            time_col=time_col,
+            location_ids=self.location_ids,
+            hours=pd.date_range(first_hour, newest_hour, freq='h'),
+        )
+        slots = (_hour_number(first_hour) + np.arange(matrix.n_hours)) % self.n_hours
+
+        rides = self._open()
+        self._save_meta(last_hour=None if last_hour is None else last_hour.isoformat(), updating=True)
+        rides[:, slots] = matrix.values
+        rides.flush()
+        self._save_meta(last_hour=newest_hour.isoformat())
+
+        return matrix.n_hours
+
+    def history_block(self) -> np.ndarray:
+        """
+        C-contiguous float32 (n_locations, n_lags + 1) array whose column `j`
+        holds the rides `j` hours before `last_hour`: `rides` of `last_hour`,
+        then its `lag_1`..`lag_{n_lags}`. Row `i` is location `location_ids[i]`.
+        """
+        if not self.is_valid():
+            raise ValueError('❌ Lag state is empty or incomplete, rebuild it first')
+
+        slots = (_hour_number(self.last_hour) - np.arange(self.n_hours)) % self.n_hours
+        return np.ascontiguousarray(self._open()[:, slots])
+
+    def to_features(self) -> pd.DataFrame:
+        """
+        The model input row of `last_hour` for every location, as training
+        builds it: `pickup_ts` and `pickup_hour` (both `last_hour`, as in the
+        feature group), `pickup_location_id`, `rides` of that hour, its
+        calendar features and `lag_1`..`lag_{n_lags}`.
+        The model predicts the hour after `last_hour` from it.
+        """
+        history = self.history_block()
+        lag_df = pd.DataFrame(history[:, 1:], columns=[f'lag_{lag}' for lag in range(1, self.n_lags + 1)])
+        seconds = np.array([self.last_hour.value // 10**9])
+        for i, (name, feature) in enumerate(CALENDAR_FEATURES.items()):
+            lag_df.insert(i, name, int(feature(seconds)[0]))
+        lag_df.insert(0, 'rides', history[:, 0])
+        lag_df.insert(0, 'pickup_location_id', self.location_ids)
+        lag_df.insert(0, 'pickup_hour', self.last_hour)
+        lag_df.insert(0, 'pickup_ts', self.last_hour)
+        return compact_features(lag_df)
+
+
+def lag_block_from_latest_rows(
+    features_now: pd.DataFrame,
+    n_lags: int,
+    location_ids: np.ndarray,
+    time_col: str = 'pickup_ts',
+) -> np.ndarray:
+    """
+    Builds the (len(location_ids), n_lags) lag block from the last `n_lags`
+    rows of every location, by position, as the
+    `groupby('pickup_location_id').tail(n_lags)` path does. Used to check a
+    `LagState` against that path.
+    """
+    features_now = features_now.sort_values([time_col], kind='stable')
+    lag_idx = features_now.groupby('pickup_location_id').cumcount(ascending=False).to_numpy()
+    row_idx = pd.Index(location_ids).get_indexer(features_now['pickup_location_id'])
+
+    valid = (row_idx >= 0) & (lag_idx < n_lags)
+    block = np.full((len(location_ids), n_lags), np.nan, dtype=FEATURE_DTYPE)
+    block[row_idx[valid], lag_idx[valid]] = features_now['rides'].to_numpy()[valid]
+    return block
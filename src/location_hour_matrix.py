@@ -0,0 +1,241 @@
+# src/location_hour_matrix.py
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.dtype_policy import FEATURE_DTYPE, LOCATION_ID_DTYPE, compact_ts_data
+
+ONE_HOUR_NS = 3600 * 10**9
+
+# calendar features of `build_features`, from UTC epoch seconds
+CALENDAR_FEATURES = {
+    'hour_of_day': lambda seconds: seconds // 3600 % 24,
+    # 1970-01-01 was a Thursday
+    'day_of_week': lambda seconds: (seconds // 86400 + 3) % 7,
+    'month': lambda seconds: seconds.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64) % 12 + 1,
+}
+
+
+class LocationHourMatrix:
+    """
+    Dense `locations x hours` array of hourly values (usually rides), shared
+    by the data, feature and inference pipelines.
+
+    Column `j` holds hour `start + j hours` and row `i` holds location
+    `location_ids[i]`, so a (location, timestamp) pair maps to a cell in O(1)
+    and a time range is a column slice. Hours without data can be kept as NaN,
+    which makes lags computed by timestamp correct when the source has gaps.
+    """
+    def __init__(
+        self,
+        values: np.ndarray,
+        start: pd.Timestamp,
+        location_ids: np.ndarray,
+    ):
+        self.values = values
+        self.start = pd.Timestamp(start)
+        self.location_ids = np.asarray(location_ids)
+
+        # location id -> row, for small non-negative integer ids
+        max_id = int(self.location_ids.max()) if len(self.location_ids) else -1
+        self._row_lookup = np.full(max_id + 2, -1, dtype=np.int64)
+        self._row_lookup[self.location_ids.astype(np.int64)] = np.arange(len(self.location_ids))
+
+    @property
+    def n_locations(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def n_hours(self) -> int:
+        return self.values.shape[1]
+
+    @property
+    def hours(self) -> pd.DatetimeIndex:
+        return pd.date_range(self.start, periods=self.n_hours, freq='h')
+
+    @property
+    def end(self) -> pd.Timestamp:
+        """First hour after the matrix"""
+        return self.start + pd.Timedelta(hours=self.n_hours)
+
+    @classmethod
+    def from_ts_data(
+        cls,
+        ts_data: pd.DataFrame,
+        time_col: str = 'pickup_hour',
+        value_col: str = 'rides',
+        location_col: Optional[str] = 'pickup_location_id',
+        location_ids: Optional[np.ndarray] = None,
+        hours: Optional[pd.DatetimeIndex] = None,
+        fill_value: float = np.nan,
+        dtype: Union[np.dtype, type] = FEATURE_DTYPE,
+    ) -> 'LocationHourMatrix':
+        """
+        Scatters long-format hourly data into a dense matrix.
+
+        Args:
+            ts_data: DataFrame with one row per (location, hour)
+            time_col: column with the hour of each row
+            value_col: column with the value of each row
+            location_col: column with the location of each row. If `None`,
+                all rows belong to a single location with id 0
+            location_ids: rows of the matrix. Defaults to the sorted unique
+                locations in `ts_data`
+            hours: consecutive hourly columns of the matrix. Defaults to every
+                hour between the first and last one in `ts_data`
+            fill_value: value of the cells without a row in `ts_data`. NaN
+                keeps gaps visible, 0 means "no rides"
+            dtype: dtype of the matrix
+        """
+        timestamps = pd.DatetimeIndex(ts_data[time_col])
+        if location_col is None:
+            ts_locations = np.zeros(len(ts_data), dtype=np.int64)
+        else:
+            ts_locations = ts_data[location_col].to_numpy()
+
+        if location_ids is None:
+            location_ids = np.unique(ts_locations[~pd.isna(ts_locations)]).astype(np.int64)
+        if hours is None:
+            hours = (pd.date_range(timestamps.min(), timestamps.max(), freq='h')
+                     if timestamps.notna().any() else pd.DatetimeIndex([], tz=timestamps.tz))
+
+        matrix = cls(
+            values=np.full((len(location_ids), len(hours)), fill_value, dtype=dtype),
+            start=hours[0] if len(hours) else pd.Timestamp(0, tz=hours.tz),
+            location_ids=location_ids,
+        )
+        rows, cols = matrix.locate(ts_locations, timestamps)
+        valid = (rows >= 0) & (cols >= 0)
+        matrix.values[rows[valid], cols[valid]] = ts_data[value_col].to_numpy()[valid]
+        return matrix
+
+    @classmethod
+    def from_rides(
+        cls,
+        rides: pd.DataFrame,
+        location_ids: Optional[np.ndarray] = None,
+        hours: Optional[pd.DatetimeIndex] = None,
+    ) -> 'LocationHourMatrix':
+        """
+        Counts raw ride events (`pickup_datetime`, `pickup_location_id`) per
+        location and hour, with 0 for hours without rides. Defaults to
+        locations 1..max(pickup_location_id) and every hour between the first
+        and last ride.
+        """
+        pickup_hours = rides['pickup_datetime'].dt.floor('h')
+        if location_ids is None:
+            location_ids = np.arange(1, int(rides['pickup_location_id'].max()) + 1)
+        if hours is None:
+            hours = pd.date_range(pickup_hours.min(), pickup_hours.max(), freq='h')
+
+        matrix = cls(
+            values=np.zeros((len(location_ids), len(hours)), dtype=np.int64),
+            start=hours[0],
+            location_ids=location_ids,
+        )
+        rows, cols = matrix.locate(rides['pickup_location_id'].to_numpy(), pickup_hours)
+        valid = (rows >= 0) & (cols >= 0)
+        flat_counts = np.bincount(
+            rows[valid] * matrix.n_hours + cols[valid],
+            minlength=matrix.n_locations * matrix.n_hours,
+        )
+        matrix.values = flat_counts.reshape(matrix.n_locations, matrix.n_hours)
+        return matrix
+
+    def hour_index(self, timestamps) -> np.ndarray:
+        """
+        Column of each timestamp, floored to the hour, or -1 outside the matrix
+        """
+        if np.ndim(timestamps) == 0:
+            timestamps = [timestamps]
+        timestamps = pd.DatetimeIndex(timestamps)
+        if timestamps.tz is None and self.start.tz is not None:
+            timestamps = timestamps.tz_localize(self.start.tz)
+        elif timestamps.tz is not None and self.start.tz is None:
+            timestamps = timestamps.tz_convert(None)
+
+        offsets = timestamps.as_unit('ns').asi8 - self.start.as_unit('ns').value
+        cols = np.floor_divide(offsets, ONE_HOUR_NS)
+        outside = (cols < 0) | (cols >= self.n_hours) | timestamps.isna()
+        return np.where(outside, -1, cols)
+
+    def row_index(self, location_ids) -> np.ndarray:
+        """Row of each location id, or -1 for unknown locations"""
+        location_ids = np.atleast_1d(location_ids)
+        known = ~pd.isna(location_ids)
+        ids = np.where(known, location_ids, -1).astype(np.int64)
+        known &= (ids >= 0) & (ids < len(self._row_lookup))
+        return np.where(known, self._row_lookup[np.where(known, ids, 0)], -1)
+
+    def locate(self, location_ids, timestamps) -> Tuple[np.ndarray, np.ndarray]:
+        """(row, column) of each (location id, timestamp) pair, -1 when outside"""
+        return self.row_index(location_ids), self.hour_index(timestamps)
+
+    def slice_hours(self, from_hour, to_hour) -> 'LocationHourMatrix':
+        """
+        Matrix with the hours `from_hour` <= hour < `to_hour`, as a view
+        """
+        start_col = int(np.clip(self._offset(from_hour), 0, self.n_hours))
+        end_col = int(np.clip(self._offset(to_hour), start_col, self.n_hours))
+        return LocationHourMatrix(
+            values=self.values[:, start_col:end_col],
+            start=self.start + pd.Timedelta(hours=start_col),
+            location_ids=self.location_ids,
+        )
+
+    def _offset(self, timestamp) -> int:
+        return (pd.Timestamp(timestamp) - self.start) // pd.Timedelta(hours=1)
+
+    def _padded(self, n_before: int) -> Tuple[np.ndarray, int]:
+        """
+        Values as float, with `n_before` NaN hours before every location,
+        flattened. Returns the flat array and its row width.
+        """
+        width = n_before + self.n_hours
+        padded = np.full((self.n_locations, width), np.nan, dtype=FEATURE_DTYPE)
+        padded[:, n_before:] = self.values
+        return padded.ravel(), width
+
+    def lag_block(self, rows: np.ndarray, cols: np.ndarray, n_lags: int) -> np.ndarray:
+        """
+        C-contiguous float32 (len(rows), n_lags) array whose column `lag - 1`
+        holds the value `lag` hours before each (row, column) cell, or NaN
+        before the start of the matrix. Cells outside the matrix (-1) get
+        NaN lags.
+
+        Windows are taken over the reversed padded values, so lag_1..lag_n
+        are consecutive in memory and one gather builds the whole block.
+        """
+        if len(rows) == 0:
+            return np.empty(shape=(0, n_lags), dtype=FEATURE_DTYPE)
+
+        # the first hour of the first location only has NaN padding behind it
+        outside = (rows < 0) | (cols < 0)
+        rows, cols = np.where(outside, 0, rows), np.where(outside, 0, cols)
+
+        flat, width = self._padded(n_lags)
+        positions = rows * width + n_lags + cols
+        windows = sliding_window_view(flat[::-1], n_lags)
+        return windows[len(flat) - positions]
+
+    def shifted(self, rows: np.ndarray, cols: np.ndarray, hours: int) -> np.ndarray:
+        """Value `hours` after (or before, if negative) each cell, NaN outside"""
+        target_cols = cols + hours
+        inside = (rows >= 0) & (cols >= 0) & (target_cols >= 0) & (target_cols < self.n_hours)
+        values = np.full(len(rows), np.nan, dtype=FEATURE_DTYPE)
+        values[inside] = self.values[rows[inside], target_cols[inside]]
+        return values
+
+    def to_ts_data(self, time_col: str = 'pickup_hour', value_col: str = 'rides') -> pd.DataFrame:
+        """
+        Long-format DataFrame ordered by location, then hour, with columns
+        `time_col`, `value_col` and `pickup_location_id`
+        """
+        hours = self.hours
+        return compact_ts_data(pd.DataFrame({
+            time_col: hours[np.tile(np.arange(self.n_hours), self.n_locations)],
+            value_col: self.values.ravel(),
+            'pickup_location_id': np.repeat(self.location_ids.astype(LOCATION_ID_DTYPE), self.n_hours),
+        }))
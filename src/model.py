@@ -1,9 +1,21 @@
+from typing import List, Sequence
+
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import FunctionTransformer
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.pipeline import make_pipeline, Pipeline
 import lightgbm as lgb
 
+from src.dtype_policy import FEATURE_DTYPE
+
+# rolling windows, in hours, and numbers of weeks of the same-hour averages
+ROLLING_WINDOWS = (3, 6, 24, 168)
+SAME_HOUR_WEEKS = (2, 4)
+
+# lags averaged by `average_rides_last_4_weeks`
+LAST_4_WEEKS_LAGS = (7*24, 2*7*24, 3*7*24, 4*7*24)
+
 
 def average_rides_last_4_weeks(X: pd.DataFrame) -> pd.DataFrame:
     """
@@ -15,7 +27,7 @@ def average_rides_last_4_weeks(X: pd.DataFrame) -> pd.DataFrame:
     If any of the lag columns are missing, fills them with NaN before averaging.
     """
     X = X.copy()
-    lag_hours = [7*24, 2*7*24, 3*7*24, 4*7*24]
+    lag_hours = list(LAST_4_WEEKS_LAGS)
     lag_cols = [f'rides_previous_{h}_hour' for h in lag_hours]
 
     # Ensure all lag columns exist
@@ -58,17 +70,240 @@ class TemporalFeaturesEngineer(BaseEstimator, TransformerMixin):
 
 
 
-def get_pipeline(**hyperparams) -> Pipeline:
+def rolling_stat_names(
+    windows: Sequence[int] = ROLLING_WINDOWS,
+    n_weeks: Sequence[int] = SAME_HOUR_WEEKS,
+) -> List[str]:
+    """Columns computed by `rolling_stats`, in order"""
+    names = []
+    for w in windows:
+        names += [f'rolling_mean_{w}h', f'rolling_std_{w}h']
+    names += [f'same_hour_mean_last_{n}_weeks' for n in n_weeks]
+    names += ['ratio_last_24h_to_previous_24h', 'ratio_last_hour_to_day_before']
+    return names
+
+
+def rolling_stats_into(
+    history: np.ndarray,
+    out: np.ndarray,
+    windows: Sequence[int] = ROLLING_WINDOWS,
+    n_weeks: Sequence[int] = SAME_HOUR_WEEKS,
+) -> np.ndarray:
+    """
+    Writes the rolling statistics of each row of `history`, whose column
+    `lag - 1` holds the rides `lag` hours before the hour to predict, into
+    the columns of `out`, in the order of `rolling_stat_names`:
+    - mean and std of the last `w` hours, for each `w` in `windows`
+    - mean of the same hour in each of the last `n` weeks, for each `n`
+    - rides of the last 24 hours over the 24 hours before them
+    - rides of the last hour over the same hour one day earlier
+
+    Every window is read from per-row cumulative sums and sums of squares, so
+    it costs O(1) per row however long it is. Windows with a NaN are NaN,
+    like `pandas.Series.rolling`, and std uses ddof=1 like pandas.
+    """
+    n_rows = len(history)
+
+    # float64 prefix sums, so sums of squares of large counts stay exact.
+    # Only the lags inside the longest window (or the last 2 days) are summed
+    recent = history[:, :max(max(windows), 2 * 24)]
+    cumsum = np.zeros((n_rows, recent.shape[1] + 1))
+    np.cumsum(recent, axis=1, out=cumsum[:, 1:])
+    cumsum_sq = np.zeros_like(cumsum)
+    np.cumsum(np.square(recent, dtype=np.float64), axis=1, out=cumsum_sq[:, 1:])
+
+    col = 0
+    for w in windows:
+        total, total_sq = cumsum[:, w], cumsum_sq[:, w]
+        out[:, col] = total / w
+        var = (total_sq - total * total / w) / (w - 1) if w > 1 else np.full(n_rows, np.nan)
+        out[:, col + 1] = np.sqrt(np.maximum(var, 0))
+        col += 2
+
+    # same hour of previous weeks, e.g. lags 168, 336, 504, 672
+    weekly = history[:, 7 * 24 * np.arange(1, max(n_weeks) + 1) - 1]
+    weekly_cumsum = np.cumsum(weekly, axis=1, dtype=np.float64)
+    for n in n_weeks:
+        out[:, col] = weekly_cumsum[:, n - 1] / n
+        col += 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        last_day = cumsum[:, 24]
+        day_before = cumsum[:, 48] - cumsum[:, 24]
+        out[:, col] = np.where(day_before > 0, last_day / day_before, np.nan)
+        out[:, col + 1] = np.where(history[:, 24] > 0, history[:, 0] / history[:, 24], np.nan)
+
+    return out
+
+
+def rolling_stats(
+    history: np.ndarray,
+    windows: Sequence[int] = ROLLING_WINDOWS,
+    n_weeks: Sequence[int] = SAME_HOUR_WEEKS,
+) -> pd.DataFrame:
+    """`rolling_stats_into` as a float32 DataFrame with one column per statistic"""
+    names = rolling_stat_names(windows, n_weeks)
+    out = np.empty((len(history), len(names)), dtype=FEATURE_DTYPE)
+    return pd.DataFrame(rolling_stats_into(history, out, windows, n_weeks), columns=names)
+
+
+def _rolling_stats_max_lag(windows: Sequence[int], n_weeks: Sequence[int]) -> int:
+    return max(max(windows), 2 * 24 + 1, 7 * 24 * max(n_weeks))
+
+
+class RollingStatsFeatures(BaseEstimator, TransformerMixin):
+    """
+    Adds the `rolling_stats` of the `rides_previous_{lag}_hour` columns.
+    Lags missing from X are treated as NaN, so the windows that need them
+    are NaN too.
+    """
+    def __init__(self, windows: Sequence[int] = ROLLING_WINDOWS, n_weeks: Sequence[int] = SAME_HOUR_WEEKS):
+        self.windows = windows
+        self.n_weeks = n_weeks
+
+    def fit(self, X, y=None):
+        self.max_lag_ = _rolling_stats_max_lag(self.windows, self.n_weeks)
+        self.lags_ = np.array(
+            [lag for lag in range(1, self.max_lag_ + 1) if f'rides_previous_{lag}_hour' in X.columns],
+            dtype=np.int64,
+        )
+        return self
+
+    def transform(self, X, y=None):
+        history = np.full((len(X), self.max_lag_), np.nan, dtype=FEATURE_DTYPE)
+        if len(self.lags_):
+            lag_cols = [f'rides_previous_{lag}_hour' for lag in self.lags_]
+            history[:, self.lags_ - 1] = X[lag_cols].to_numpy(dtype=FEATURE_DTYPE)
+
+        stats = rolling_stats(history, self.windows, self.n_weeks)
+        stats.index = X.index
+        return pd.concat([X, stats], axis=1)
+
+
+class ArrayFeatureEngineer(BaseEstimator, TransformerMixin):
+    """
+    NumPy variant of `average_rides_last_4_weeks`, `RollingStatsFeatures` and
+    `TemporalFeaturesEngineer` in one step.
+
+    `fit` resolves the column layout once: where every input column goes in
+    the output and which slots are reserved for the derived columns. Then
+    `transform` allocates a single float32 array, writes each input column
+    into it, and fills the derived slots in place. X itself is never copied
+    or modified. Columns come out in the same order as the DataFrame steps
+    of `get_pipeline`, listed in `feature_names_out_`.
+    """
+    def __init__(self, windows: Sequence[int] = ROLLING_WINDOWS, n_weeks: Sequence[int] = SAME_HOUR_WEEKS):
+        self.windows = windows
+        self.n_weeks = n_weeks
+
+    def fit(self, X, y=None):
+        self.input_columns_ = [c for c in X.columns if c != 'pickup_hour']
+        missing_4_weeks = [f'rides_previous_{h}_hour' for h in LAST_4_WEEKS_LAGS
+                           if f'rides_previous_{h}_hour' not in X.columns]
+        stat_names = rolling_stat_names(self.windows, self.n_weeks)
+
+        self.feature_names_out_ = (
+            self.input_columns_ + missing_4_weeks + ['average_rides_last_4_weeks']
+            + stat_names + ['hour', 'day_of_week']
+        )
+        position = {c: i for i, c in enumerate(self.feature_names_out_)}
+
+        self.missing_slots_ = np.array([position[c] for c in missing_4_weeks], dtype=np.int64)
+        self.last_4_weeks_slots_ = np.array(
+            [position[f'rides_previous_{h}_hour'] for h in LAST_4_WEEKS_LAGS], dtype=np.int64
+        )
+        self.average_slot_ = position['average_rides_last_4_weeks']
+        self.stats_start_ = position[stat_names[0]]
+        self.hour_slot_ = position['hour']
+        self.day_of_week_slot_ = position['day_of_week']
+
+        # slots of rides_previous_1_hour..rides_previous_{max_lag}_hour
+        self.max_lag_ = _rolling_stats_max_lag(self.windows, self.n_weeks)
+        self.history_slots_ = np.array(
+            [position.get(f'rides_previous_{lag}_hour', -1) for lag in range(1, self.max_lag_ + 1)],
+            dtype=np.int64,
+        )
+        return self
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array(self.feature_names_out_, dtype=object)
+
+    def _history(self, out: np.ndarray) -> np.ndarray:
+        """
+        Lags 1..max_lag as a view of `out` when their columns are contiguous,
+        like the `rides_previous_*` block of `transform_ts_data_into_features_and_target`
+        """
+        slots = self.history_slots_
+        if (slots >= 0).all():
+            step = int(slots[1] - slots[0]) if len(slots) > 1 else 1
+            if step in (1, -1) and (np.diff(slots) == step).all():
+                stop = slots[-1] + step
+                return out[:, slots[0]:(stop if stop >= 0 else None):step]
+
+        history = np.full((len(out), self.max_lag_), np.nan, dtype=FEATURE_DTYPE)
+        present = slots >= 0
+        history[:, present] = out[:, slots[present]]
+        return history
+
+    def transform_into(self, X: pd.DataFrame, out: np.ndarray) -> np.ndarray:
+        """Writes the features of X into the preallocated (len(X), n_features) `out`"""
+        for i, col in enumerate(self.input_columns_):
+            out[:, i] = X[col].to_numpy()
+        out[:, self.missing_slots_] = np.nan
+
+        with np.errstate(invalid='ignore'):
+            lags = out[:, self.last_4_weeks_slots_]
+            n_valid = (~np.isnan(lags)).sum(axis=1)
+            out[:, self.average_slot_] = np.where(n_valid > 0, np.nansum(lags, axis=1) / n_valid, np.nan)
+
+        n_stats = len(rolling_stat_names(self.windows, self.n_weeks))
+        rolling_stats_into(
+            self._history(out),
+            out[:, self.stats_start_:self.stats_start_ + n_stats],
+            self.windows,
+            self.n_weeks,
+        )
+
+        pickup_hour = X['pickup_hour']
+        if not pd.api.types.is_datetime64_any_dtype(pickup_hour):
+            pickup_hour = pd.to_datetime(pickup_hour, errors='coerce')
+        if pickup_hour.isna().any():
+            print("⚠️ Warning: Some pickup_hour values could not be parsed as datetime.")
+            pickup_hour = pickup_hour.fillna(pd.Timestamp("1970-01-01"))
+        pickup_hour = pd.DatetimeIndex(pickup_hour)
+        out[:, self.hour_slot_] = pickup_hour.hour
+        out[:, self.day_of_week_slot_] = pickup_hour.dayofweek
+
+        return out
+
+    def transform(self, X, y=None):
+        out = np.empty((len(X), len(self.feature_names_out_)), dtype=FEATURE_DTYPE)
+        return self.transform_into(X, out)
+
+
+def get_pipeline(numpy_features: bool = False, **hyperparams) -> Pipeline:
     """
     Build the full preprocessing + model pipeline with fixed step names.
+
+    With `numpy_features`, the feature steps are replaced by one
+    `ArrayFeatureEngineer` step that builds the same columns into a single
+    float32 array, without copying the input frame.
     """
+    if numpy_features:
+        return Pipeline([
+            ("features", ArrayFeatureEngineer()),
+            ("model", lgb.LGBMRegressor(**hyperparams)),
+        ])
+
     add_feature_average_rides_last_4_weeks = FunctionTransformer(
         average_rides_last_4_weeks, validate=False
     )
+    add_rolling_stats = RollingStatsFeatures()
     add_temporal_features = TemporalFeaturesEngineer()
 
     return Pipeline([
         ("average_rides_last_4_weeks", add_feature_average_rides_last_4_weeks),
+        ("rolling_stats", add_rolling_stats),
         ("temporal_features", add_temporal_features),
         ("model", lgb.LGBMRegressor(**hyperparams)),
     ])
\ No newline at end of file
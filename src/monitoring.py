@@ -6,17 +6,16 @@ from datetime import datetime
 from src.logger import get_logger
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import os
+from src.config import DASHBOARD_HOURS
+from src.prediction_log import read_last_hours
 
 logger = get_logger()
 
 
-def load_predictions(filepath="data/predictions.csv") -> pd.DataFrame:
-    """Load predictions CSV."""
-    df = pd.read_csv(filepath)
-    logger.info(f"📥 Loaded predictions from {filepath} with shape {df.shape}")
-
-    # Ensure timestamp is parsed
-    df["pickup_ts"] = pd.to_datetime(df["pickup_ts"], unit="ms")
+def load_predictions(n_hours: int = DASHBOARD_HOURS) -> pd.DataFrame:
+    """Load the last `n_hours` hours of the prediction log."""
+    df = read_last_hours(n_hours, columns=["rides", "predicted_rides_next_hour"])
+    logger.info(f"📥 Loaded {n_hours} hours of predictions with shape {df.shape}")
     return df
 
 
@@ -0,0 +1,187 @@
+# src/month_cache.py
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.paths import DATA_CACHE_DIR
+
+HOURLY_RIDES_CACHE_DIR = DATA_CACHE_DIR / 'hourly_rides'
+MEMORY_BUDGET_BYTES = 256 * 1024**2
+DISK_BUDGET_BYTES = 1024**3
+
+
+class MonthCache:
+    """
+    Two-level LRU cache of hourly ride counts, one entry per (year, month).
+
+    Each entry is a DataFrame with columns `pickup_hour`, `pickup_location_id`
+    and `rides`, sorted by `pickup_hour`, so a time window is answered with a
+    binary search and a slice. Entries live in memory and as parquet files in
+    `cache_dir`; the least recently used months are evicted from each level
+    once its byte budget is exceeded. Months missing from both levels are
+    computed with `load_month(year, month)`; empty months are never cached.
+
+    Reads and loads run outside the lock, so callers of different months do
+    not wait on each other's downloads; callers of a month that is already
+    being loaded wait on that one load.
+    """
+    def __init__(
+        self,
+        load_month: Callable[[int, int], pd.DataFrame],
+        cache_dir: Path = HOURLY_RIDES_CACHE_DIR,
+        memory_budget_bytes: int = MEMORY_BUDGET_BYTES,
+        disk_budget_bytes: int = DISK_BUDGET_BYTES,
+    ):
+        self.load_month = load_month
+        self.cache_dir = Path(cache_dir)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+
+        self._months = OrderedDict()
+        self._memory_bytes = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0, 'miss': 0}
+
+    def _path(self, year: int, month: int) -> Path:
+        return self.cache_dir / f'hourly_rides_{year}-{month:02d}.parquet'
+
+    def _put_in_memory(self, key: Tuple[int, int], ts_data: pd.DataFrame) -> None:
+        self._months[key] = ts_data
+        self._memory_bytes += int(ts_data.memory_usage(deep=True).sum())
+
+        # evict least recently used months, but always keep the newest one
+        while self._memory_bytes > self.memory_budget_bytes and len(self._months) > 1:
+            _, evicted = self._months.popitem(last=False)
+            self._memory_bytes -= int(evicted.memory_usage(deep=True).sum())
+
+    def _put_on_disk(self, path: Path, ts_data: pd.DataFrame) -> None:
+        with self._disk_lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.parquet.tmp')
+            ts_data.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+            # evict least recently used files, ordered by their last access time
+            files = sorted(self.cache_dir.glob('hourly_rides_*.parquet'), key=lambda p: p.stat().st_mtime)
+            total = sum(p.stat().st_size for p in files)
+            for old_path in files[:-1]:
+                if total <= self.disk_budget_bytes:
+                    break
+                total -= old_path.stat().st_size
+                old_path.unlink()
+
+    def _read_from_disk(self, path: Path) -> Optional[pd.DataFrame]:
+        """The cached month at `path`, or None if it is missing or empty"""
+        try:
+            ts_data = pd.read_parquet(path)
+            os.utime(path)
+        except FileNotFoundError:
+            # never cached, or evicted by another month's write
+            return None
+        if ts_data.empty:
+            # empty files were written before empty months were skipped
+            path.unlink(missing_ok=True)
+            return None
+        return ts_data
+
+    def _load(self, year: int, month: int) -> pd.DataFrame:
+        """Reads the month from disk, or computes it and writes it to disk"""
+        path = self._path(year, month)
+        ts_data = self._read_from_disk(path)
+        if ts_data is not None:
+            with self._lock:
+                self.hits['disk'] += 1
+            return ts_data
+
+        with self._lock:
+            self.hits['miss'] += 1
+        ts_data = self.load_month(year, month)
+        ts_data = ts_data.sort_values(by=['pickup_hour', 'pickup_location_id'])
+        ts_data = ts_data.reset_index(drop=True)
+
+        # a month that failed to download or is not published yet is
+        # loaded again on the next call instead of being cached empty
+        if not ts_data.empty:
+            self._put_on_disk(path, ts_data)
+        return ts_data
+
+    def _get_month(self, year: int, month: int) -> pd.DataFrame:
+        """
+        The cached DataFrame of `year` and `month` itself, shared with every
+        other caller, so it must not be modified
+        """
+        key = (year, month)
+        with self._lock:
+            if key in self._months:
+                self._months.move_to_end(key)
+                self.hits['memory'] += 1
+                return self._months[key]
+
+            future = self._in_flight.get(key)
+            is_loader = future is None
+            if is_loader:
+                future = self._in_flight[key] = Future()
+
+        if not is_loader:
+            return future.result()
+
+        try:
+            ts_data = self._load(year, month)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if not ts_data.empty:
+                self._put_in_memory(key, ts_data)
+            del self._in_flight[key]
+        future.set_result(ts_data)
+        return ts_data
+
+    def get_month(self, year: int, month: int) -> pd.DataFrame:
+        """
+        Returns a copy of the hourly ride counts of `year` and `month`, sorted
+        by pickup_hour, which the caller is free to modify
+        """
+        return self._get_month(year, month).copy()
+
+    def query(self, from_date: datetime, to_date: datetime) -> pd.DataFrame:
+        """
+        Returns the hourly ride counts with `from_date` <= pickup_hour < `to_date`
+        """
+        from_date, to_date = pd.Timestamp(from_date), pd.Timestamp(to_date)
+        months = pd.period_range(from_date, to_date - pd.Timedelta(microseconds=1), freq='M')
+
+        slices = []
+        for period in months:
+            # concat below copies the slices, so the cached month is not exposed
+            ts_data = self._get_month(period.year, period.month)
+            pickup_hours = ts_data['pickup_hour'].to_numpy()
+            start = np.searchsorted(pickup_hours, from_date.to_datetime64(), side='left')
+            end = np.searchsorted(pickup_hours, to_date.to_datetime64(), side='left')
+            slices.append(ts_data.iloc[start:end])
+
+        if not slices:
+            return pd.DataFrame(columns=['pickup_hour', 'pickup_location_id', 'rides'])
+        return pd.concat(slices, ignore_index=True)
+
+    def clear(self, disk: bool = False) -> None:
+        """Empties the in-memory level and, if `disk`, the on-disk level too"""
+        with self._lock:
+            self._months.clear()
+            self._memory_bytes = 0
+        if disk:
+            with self._disk_lock:
+                for path in self.cache_dir.glob('hourly_rides_*.parquet'):
+                    path.unlink()
@@ -6,6 +6,8 @@ DATA_DIR = PARENT_DIR / 'data'
 RAW_DATA_DIR = PARENT_DIR / 'data' / 'raw'
 TRANSFORMED_DATA_DIR = PARENT_DIR / 'data' / 'transformed'
 DATA_CACHE_DIR = PARENT_DIR / 'data' / 'cache'
+TS_STORE_DIR = PARENT_DIR / 'data' / 'ts_store'
+PREDICTION_LOG_DIR = PARENT_DIR / 'data' / 'prediction_log'
 
 MODELS_DIR = PARENT_DIR / 'models'
 
@@ -22,4 +24,10 @@ if not Path(MODELS_DIR).exists():
     os.mkdir(MODELS_DIR)
 
 if not Path(DATA_CACHE_DIR).exists():
-    os.mkdir(DATA_CACHE_DIR)
\ No newline at end of file
+    os.mkdir(DATA_CACHE_DIR)
+
+if not Path(TS_STORE_DIR).exists():
+    os.mkdir(TS_STORE_DIR)
+
+if not Path(PREDICTION_LOG_DIR).exists():
+    os.mkdir(PREDICTION_LOG_DIR)
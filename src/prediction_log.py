@@ -0,0 +1,231 @@
+# src/prediction_log.py
+import operator
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from functools import reduce
+from typing import Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from src.dtype_policy import compact_features, to_datetime_utc
+from src.logger import get_logger
+from src.paths import PREDICTION_LOG_DIR
+
+logger = get_logger()
+
+PREDICTIONS_DATASET = 'predictions'
+FEATURES_DATASET = 'features'
+
+# hive partition `hour=2022-01-01T05`, in an order strings sort the same way
+PARTITION_COL = 'hour'
+HOUR_FORMAT = '%Y-%m-%dT%H'
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_COL, pa.string())]), flavor='hive')
+
+KEY_COLUMNS = ['pickup_location_id', 'pickup_ts']
+LOGGED_AT_COL = 'logged_at'
+PREDICTION_PREFIX = 'predicted_'
+
+
+def _to_timestamps(values: pd.Series) -> pd.Series:
+    """
+    Naive UTC timestamps from datetimes, from epoch milliseconds as the
+    feature view serves `pickup_ts`, or from epoch seconds as
+    `run_inference` outputs it
+    """
+    return to_datetime_utc(values).dt.tz_convert(None)
+
+
+def _partition_keys(pickup_ts: pd.Series) -> pd.Series:
+    """`hour` partition of every row, formatted once per distinct hour"""
+    codes, hours = pd.factorize(pickup_ts.dt.floor('h'))
+    return pd.Series(hours.strftime(HOUR_FORMAT)[codes], index=pickup_ts.index)
+
+
+def _hour_key(hour: pd.Timestamp) -> str:
+    return hour.strftime(HOUR_FORMAT)
+
+
+def _naive_utc(timestamp: datetime) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    return timestamp.tz_convert(None) if timestamp.tz is not None else timestamp
+
+
+def _write_dataset(df: pd.DataFrame, path: Path, run_id: str) -> List[Path]:
+    """
+    Appends `df` to the hour-partitioned dataset at `path`, as one new file
+    per hour. Files are written to a staging directory that readers ignore,
+    then moved into their partitions one by one.
+    """
+    staging = path / f'.staging-{run_id}'
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        staging,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=f'part-{run_id}-{{i}}.parquet',
+    )
+
+    written = []
+    for staged in sorted(staging.glob(f'{PARTITION_COL}=*/*.parquet')):
+        target = path / staged.relative_to(staging)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, target)
+        written.append(target)
+    shutil.rmtree(staging)
+    return written
+
+
+def append_predictions(
+    predictions: pd.DataFrame,
+    features: Optional[pd.DataFrame] = None,
+    root: Path = PREDICTION_LOG_DIR,
+    logged_at: Optional[datetime] = None,
+) -> List[Path]:
+    """
+    Appends a run of predictions to the log: `pickup_location_id`,
+    `pickup_ts`, `rides` and the `predicted_*` columns, partitioned by the
+    hour of `pickup_ts`. With `features`, their columns are appended to a
+    sidecar dataset with the same keys and partitions.
+
+    Rows logged again for the same (pickup_location_id, pickup_ts) replace
+    the older ones when read.
+
+    Returns:
+        List with the parquet files that were written
+    """
+    logged_at = _naive_utc(logged_at if logged_at is not None else pd.Timestamp.utcnow())
+    run_id = logged_at.strftime('%Y%m%dT%H%M%S%f')
+
+    columns = [
+        col for col in predictions.columns
+        if col in (*KEY_COLUMNS, 'rides') or col.startswith(PREDICTION_PREFIX)
+    ]
+    log = predictions[columns].copy()
+    log['pickup_ts'] = _to_timestamps(log['pickup_ts'])
+    log[LOGGED_AT_COL] = logged_at
+    log[PARTITION_COL] = _partition_keys(log['pickup_ts'])
+    written = _write_dataset(log, Path(root) / PREDICTIONS_DATASET, run_id)
+
+    if features is not None:
+        sidecar = compact_features(features.copy())
+        sidecar['pickup_ts'] = _to_timestamps(sidecar['pickup_ts'])
+        sidecar[LOGGED_AT_COL] = logged_at
+        sidecar[PARTITION_COL] = _partition_keys(sidecar['pickup_ts'])
+        written += _write_dataset(sidecar, Path(root) / FEATURES_DATASET, run_id)
+
+    logger.info(f"💾 Logged {len(log)} predictions over {log[PARTITION_COL].nunique()} hours "
+                f"({len(written)} files) to {root}")
+    return written
+
+
+def list_hours(root: Path = PREDICTION_LOG_DIR, dataset: str = PREDICTIONS_DATASET) -> List[pd.Timestamp]:
+    """Hours with logged rows, from the partition directories alone"""
+    path = Path(root) / dataset
+    if not path.exists():
+        return []
+    return sorted(
+        pd.Timestamp(p.name[len(PARTITION_COL) + 1:])
+        for p in path.glob(f'{PARTITION_COL}=*') if p.is_dir()
+    )
+
+
+def unlogged_rows(
+    features: pd.DataFrame,
+    root: Path = PREDICTION_LOG_DIR,
+    time_col: str = 'pickup_ts',
+) -> pd.DataFrame:
+    """
+    Rows of `features` in the hours after the last logged one, so a run only
+    appends what earlier runs have not logged. With an empty log, only the
+    rows of the newest hour are returned.
+    """
+    pickup_ts = _to_timestamps(features[time_col])
+    hours = list_hours(root)
+    if not hours:
+        return features[pickup_ts.dt.floor('h') == pickup_ts.max().floor('h')]
+    return features[pickup_ts >= hours[-1] + pd.Timedelta(hours=1)]
+
+
+def _read_dataset(
+    path: Path,
+    from_hour: Optional[datetime],
+    to_hour: Optional[datetime],
+    location_ids: Optional[Iterable[int]],
+    columns: Optional[List[str]],
+) -> pd.DataFrame:
+    """
+    Rows with `from_hour` <= pickup_ts < `to_hour`. Only the hour partitions
+    in the range are opened, and location ids are filtered while scanning.
+    """
+    dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING) if path.exists() else None
+    if dataset is None or not dataset.files:
+        return pd.DataFrame(columns=columns or KEY_COLUMNS)
+
+    filters = []
+    if from_hour is not None:
+        from_hour = _naive_utc(from_hour)
+        filters.append(ds.field(PARTITION_COL) >= _hour_key(from_hour.floor('h')))
+    if to_hour is not None:
+        to_hour = _naive_utc(to_hour)
+        filters.append(ds.field(PARTITION_COL) < _hour_key(to_hour.ceil('h')))
+    if location_ids is not None:
+        filters.append(ds.field('pickup_location_id').isin(list(location_ids)))
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys([*KEY_COLUMNS, *columns, LOGGED_AT_COL]))
+    df = dataset.to_table(columns=read_columns, filter=reduce(operator.and_, filters) if filters else None).to_pandas()
+
+    # exact bounds inside the first and last partitions
+    if from_hour is not None:
+        df = df[df['pickup_ts'] >= from_hour]
+    if to_hour is not None:
+        df = df[df['pickup_ts'] < to_hour]
+
+    # the latest run wins for every (location, hour)
+    df = df.sort_values(LOGGED_AT_COL, kind='stable').drop_duplicates(KEY_COLUMNS, keep='last')
+    df = df.drop(columns=[c for c in (PARTITION_COL, LOGGED_AT_COL) if c in df.columns])
+    return df.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+
+def read_predictions(
+    from_hour: Optional[datetime] = None,
+    to_hour: Optional[datetime] = None,
+    location_ids: Optional[Iterable[int]] = None,
+    columns: Optional[List[str]] = None,
+    root: Path = PREDICTION_LOG_DIR,
+) -> pd.DataFrame:
+    """
+    Logged predictions with `from_hour` <= pickup_ts < `to_hour` (either
+    bound optional), ordered by location and hour
+    """
+    return _read_dataset(Path(root) / PREDICTIONS_DATASET, from_hour, to_hour, location_ids, columns)
+
+
+def read_features(
+    from_hour: Optional[datetime] = None,
+    to_hour: Optional[datetime] = None,
+    location_ids: Optional[Iterable[int]] = None,
+    columns: Optional[List[str]] = None,
+    root: Path = PREDICTION_LOG_DIR,
+) -> pd.DataFrame:
+    """Logged model input features, with the same range query as `read_predictions`"""
+    return _read_dataset(Path(root) / FEATURES_DATASET, from_hour, to_hour, location_ids, columns)
+
+
+def read_last_hours(
+    n_hours: int,
+    location_ids: Optional[Iterable[int]] = None,
+    columns: Optional[List[str]] = None,
+    root: Path = PREDICTION_LOG_DIR,
+) -> pd.DataFrame:
+    """Logged predictions of the `n_hours` hours up to the last logged one"""
+    hours = list_hours(root)
+    if not hours:
+        return pd.DataFrame(columns=columns or KEY_COLUMNS)
+    to_hour = hours[-1] + pd.Timedelta(hours=1)
+    return read_predictions(to_hour - pd.Timedelta(hours=n_hours), to_hour, location_ids, columns, root)
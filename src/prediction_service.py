@@ -0,0 +1,411 @@
+# src/prediction_service.py
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import (
+    FEATURE_VIEW_METADATA,
+    MAX_BATCH_SIZE,
+    MAX_BATCH_WAIT_MS,
+    N_FEATURES,
+    SERVICE_HOST,
+    SERVICE_PORT,
+    SERVICE_REFRESH_SECONDS,
+)
+from src.feature_selection import required_lags
+from src.feature_store_api import get_batch_data, load_lag_features_from_store
+from src.inference import add_missing_lag_features, latest_rows, load_model, prepare_features, run_inference
+from src.logger import get_logger
+
+logger = get_logger()
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+class MicroBatcher:
+    """
+    Gathers the rows of concurrent `submit` calls into one `predict_fn` call.
+
+    A batch closes once it holds `max_batch_size` rows or `max_wait_ms` after
+    its first request arrived. Requests that arrive while a batch is being
+    predicted, in a worker thread, queue up for the next one.
+    """
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_BATCH_WAIT_MS,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.n_batches = 0
+        self.n_rows = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self) -> None:
+        """Starts gathering batches, on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, rows: np.ndarray) -> np.ndarray:
+        """Predictions of `rows`, once the batch they end up in is predicted"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((rows, future))
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        n_rows = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while n_rows < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            batch.append(item)
+            n_rows += len(item[0])
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            rows = np.concatenate([rows for rows, _ in batch])
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict_fn, rows)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.n_batches += 1
+            self.n_rows += len(rows)
+            offsets = np.cumsum([len(rows) for rows, _ in batch])[:-1]
+            for (_, future), predictions_of_request in zip(batch, np.split(predictions, offsets)):
+                if not future.done():
+                    future.set_result(predictions_of_request)
+
+
+class PredictionService:
+    """
+    Keeps the model and the model input of the newest hour, one row per
+    location and built as in training, in memory, and scores `/predict`
+    requests for the hour after it through a `MicroBatcher`.
+    """
+    def __init__(
+        self,
+        model,
+        features: pd.DataFrame,
+        expected_features: List[str],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_BATCH_WAIT_MS,
+    ):
+        self.model = model
+        self.expected_features = expected_features
+        self.batcher = MicroBatcher(self._predict_rows, max_batch_size, max_wait_ms)
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.set_features(features)
+
+    @classmethod
+    def from_store(cls, **kwargs) -> 'PredictionService':
+        """Service on the saved model bundle and the lag state of the feature store"""
+        model, expected_features = load_model()
+        return cls(model, load_service_features(expected_features), expected_features, **kwargs)
+
+    def set_features(self, features: pd.DataFrame) -> None:
+        """
+        Swaps in the model input of a new hour, one row per location with
+        every expected feature. `pickup_ts` becomes the hour after it, the
+        one the predictions are for.
+        """
+        missing = [col for col in self.expected_features if col not in features.columns]
+        if missing:
+            raise ValueError(f'❌ Service features lack {len(missing)} expected features: {missing[:10]}')
+
+        self._X = prepare_features(features.copy(), self.expected_features)
+        self._row_of_location = pd.Index(features['pickup_location_id'].to_numpy())
+        self.features_hour = pd.Timestamp(features['pickup_ts'].max())
+        self.pickup_ts = self.features_hour + pd.Timedelta(hours=1)
+
+    def start(self, refresh_seconds: float = 0) -> None:
+        """Starts batching and, if `refresh_seconds`, refreshing the features"""
+        self.batcher.start()
+        if refresh_seconds:
+            self._refresh_task = asyncio.create_task(self._refresh_periodically(refresh_seconds))
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        await self.batcher.stop()
+
+    async def _refresh_periodically(self, every_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(every_seconds)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception('⚠️ Feature refresh failed, serving the previous hour')
+
+    async def refresh(self) -> None:
+        """Updates the lag state from the feature store, off the event loop"""
+        features = await asyncio.get_running_loop().run_in_executor(
+            None, load_service_features, self.expected_features,
+        )
+        self.set_features(features)
+        logger.info(f"🔄 Features refreshed for {self.pickup_ts}")
+
+    def check_against_inference(self, features: pd.DataFrame) -> bool:
+        """
+        Compares the service's predictions with `run_inference` on the newest
+        row of every location in `features` (feature store rows with their
+        history), and logs how many differ
+        """
+        latest = latest_rows(add_missing_lag_features(features, self.expected_features))
+        if pd.Timestamp(latest['pickup_ts'].max()) != self.features_hour:
+            logger.warning(f"⚠️ Service features are for {self.features_hour}, "
+                           f"the feature store is at {latest['pickup_ts'].max()}")
+            return False
+
+        expected = run_inference(self.model, latest, self.expected_features)['predicted_rides_next_hour'].to_numpy()
+        rows = self._row_of_location.get_indexer(latest['pickup_location_id'])
+        mismatches = (rows < 0) | ~np.isclose(self._predict_rows(np.where(rows < 0, 0, rows)), expected)
+        if mismatches.any():
+            logger.warning(f"⚠️ Service predictions differ from run_inference for {int(mismatches.sum())} locations")
+            return False
+
+        logger.info(f"✅ Service predictions match run_inference for {len(rows)} locations")
+        return True
+
+    def _predict_rows(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict(self._X.iloc[rows]))
+
+    async def predict(self, location_ids: Optional[List[int]] = None) -> Dict[int, float]:
+        """Predicted rides of the next hour for `location_ids`, all locations by default"""
+        if location_ids is None:
+            location_ids = self._row_of_location.tolist()
+        rows = self._row_of_location.get_indexer(location_ids)
+        if (rows < 0).any():
+            raise ValueError(f'Unknown locations {np.asarray(location_ids)[rows < 0].tolist()}')
+
+        predictions = await self.batcher.submit(rows)
+        return dict(zip((int(i) for i in location_ids), predictions.tolist()))
+
+    async def handle_request(self, method: str, path: str, body: bytes) -> Tuple[int, dict]:
+        if method == 'GET' and path == '/health':
+            return 200, {
+                'status': 'ok',
+                'pickup_ts': self.pickup_ts.isoformat(),
+                'n_batches': self.batcher.n_batches,
+                'mean_batch_size': self.batcher.n_rows / max(self.batcher.n_batches, 1),
+            }
+        if method == 'POST' and path == '/predict':
+            try:
+                request = json.loads(body or b'{}')
+                predictions = await self.predict(request.get('zones'))
+            except (ValueError, AttributeError) as e:
+                return 400, {'error': str(e)}
+            return 200, {'pickup_ts': self.pickup_ts.isoformat(), 'predictions': predictions}
+        if method == 'POST' and path == '/refresh':
+            await self.refresh()
+            return 200, {'pickup_ts': self.pickup_ts.isoformat()}
+        return 404, {'error': f'No route for {method} {path}'}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Minimal HTTP/1.1 with keep-alive and JSON bodies"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(' ', 2)
+                headers = await _read_headers(reader)
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, payload = await self.handle_request(method, path, body)
+                except Exception as e:
+                    logger.exception('❌ Request failed')
+                    status, payload = 500, {'error': str(e)}
+
+                writer.write(_http_message(f'HTTP/1.1 {status} {HTTP_STATUS[status]}', payload))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def load_service_features(expected_features: List[str]) -> pd.DataFrame:
+    """
+    Model input of the newest hour from the lag state, with only the lags
+    the model uses
+    """
+    return load_lag_features_from_store(
+        FEATURE_VIEW_METADATA, required_lags(expected_features, default=N_FEATURES),
+    )
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return headers
+        name, value = line.decode().split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+
+
+def _http_message(start_line: str, payload: dict) -> bytes:
+    body = json.dumps(payload).encode()
+    head = f'{start_line}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+    return head.encode() + body
+
+
+async def start_service(
+    service: PredictionService,
+    host: str = SERVICE_HOST,
+    port: int = SERVICE_PORT,
+    refresh_seconds: float = 0,
+) -> asyncio.AbstractServer:
+    """Starts serving `service` on the running event loop"""
+    service.start(refresh_seconds)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    logger.info(f"🚀 Prediction service listening on http://{host}:{port}")
+    return server
+
+
+async def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, **kwargs) -> None:
+    service = PredictionService.from_store(**kwargs)
+    server = await start_service(service, host, port, SERVICE_REFRESH_SECONDS)
+    async with server:
+        await server.serve_forever()
+
+
+async def _client(
+    host: str,
+    port: int,
+    payloads: List[bytes],
+    latencies: List[float],
+) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in payloads:
+            start = time.perf_counter()
+            writer.write(
+                f'POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            headers = await _read_headers(reader)
+            await reader.readexactly(int(headers.get('content-length', 0)))
+            if b' 200 ' not in status_line:
+                raise RuntimeError(f'❌ Request failed: {status_line.decode().strip()}')
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load_test(
+    host: str = SERVICE_HOST,
+    port: int = SERVICE_PORT,
+    n_clients: int = 32,
+    n_requests: int = 2000,
+    zones_per_request: int = 1,
+    location_ids: Optional[List[int]] = None,
+    seed: int = 42,
+) -> dict:
+    """
+    Sends `n_requests` /predict requests for `zones_per_request` random
+    locations from `n_clients` concurrent keep-alive connections
+
+    Returns:
+        dict: p50 and p99 latency in seconds, and requests per second
+    """
+    rng = np.random.default_rng(seed)
+    location_ids = location_ids or list(range(1, 266))
+    payloads = [
+        json.dumps({'zones': rng.choice(location_ids, zones_per_request, replace=False).tolist()}).encode()
+        for _ in range(n_requests)
+    ]
+
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(host, port, payloads[i::n_clients], latencies) for i in range(n_clients)
+    ))
+    seconds = time.perf_counter() - start
+
+    return {
+        'n_clients': n_clients,
+        'n_requests': len(latencies),
+        'zones_per_request': zones_per_request,
+        'p50_seconds': float(np.percentile(latencies, 50)),
+        'p99_seconds': float(np.percentile(latencies, 99)),
+        'requests_per_second': len(latencies) / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve next-hour predictions over HTTP')
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_BATCH_WAIT_MS)
+    parser.add_argument('--load-test', action='store_true',
+                        help='send load to a running service instead of serving')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--zones-per-request', type=int, default=1)
+    parser.add_argument('--check', action='store_true',
+                        help='compare the service predictions with run_inference on the feature store and exit')
+    args = parser.parse_args()
+
+    if args.check:
+        service = PredictionService.from_store()
+        ok = service.check_against_inference(get_batch_data(FEATURE_VIEW_METADATA))
+        raise SystemExit(0 if ok else 1)
+
+    if args.load_test:
+        result = asyncio.run(run_load_test(
+            args.host, args.port, args.clients, args.requests, args.zones_per_request,
+        ))
+        print(f"📈 {result['n_requests']} requests from {result['n_clients']} clients: "
+              f"p50 {result['p50_seconds'] * 1000:.1f}ms, p99 {result['p99_seconds'] * 1000:.1f}ms, "
+              f"{result['requests_per_second']:.0f} requests/s")
+        return
+
+    asyncio.run(serve(args.host, args.port, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms))
+
+
+if __name__ == '__main__':
+    main()
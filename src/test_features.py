@@ -4,6 +4,7 @@ import hopsworks
 
 from src import config
 from src.feature_store_api import get_or_create_feature_view
+from src.features import add_lag_features_and_target
 from src.logger import get_logger
 
 logger = get_logger()
@@ -39,25 +40,9 @@ def build_features(df: pd.DataFrame) -> pd.DataFrame:
     df["day_of_week"] = df["pickup_ts"].dt.dayofweek
     df["month"] = df["pickup_ts"].dt.month
 
-    # ⚡ Build lag features efficiently
-    lag_features = []
-    for lag in range(1, config.N_FEATURES + 1):
-        lag_features.append(
-            df.groupby("pickup_location_id")["rides"].shift(lag).rename(f"lag_{lag}")
-        )
-    lag_df = pd.concat(lag_features, axis=1)
-
-    # Concatenate everything
-    df = pd.concat([df, lag_df], axis=1)
-
-    # Target column
-    df["target_rides_next_hour"] = (
-        df.groupby("pickup_location_id")["rides"].shift(-1)
-    )
-
-    # Drop rows with NaNs from shifting
-    df = df.dropna().reset_index(drop=True)
-    return df
+    # ⚡ Build lag features and target from one padded per-location array,
+    # dropping rows with NaNs from shifting
+    return add_lag_features_and_target(df, config.N_FEATURES)
 
 
 def main():
@@ -1,24 +1,67 @@
 # src/train.py
+import argparse
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from datetime import datetime
+from typing import Optional, Union
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 import lightgbm as lgb
 import optuna
+from optuna.storages import JournalStorage
+from optuna.storages.journal import JournalFileBackend
 import joblib
 import os
+import hashlib
+import json
 import hopsworks
 from src import config
 from src.logger import get_logger
-from src.feature_store_api import load_batch_of_features_from_store
-from src.config import FEATURE_VIEW_METADATA, N_FEATURES, N_HYPERPARAMETER_SEARCH_TRIALS, MAX_MAE
+from src.dtype_policy import compact_features, from_store_dtypes, to_datetime_utc
+from src.compiled_model import compile_pipeline
+from src.feature_selection import select_lag_features
+from src.data_split import train_test_split
+from src.feature_store_api import get_session, load_batch_of_features_from_store
+from src.paths import DATA_CACHE_DIR, MODELS_DIR
+from src.config import (
+    FEATURE_VIEW_METADATA, N_FEATURES, N_HYPERPARAMETER_SEARCH_TRIALS, MAX_MAE,
+    N_SEARCH_WORKERS, N_THREADS_PER_TRIAL,
+)
 
 logger = get_logger()
 
 TARGET_COL = "target_rides_next_hour"
 
+# boosting rounds are capped, and stop once the validation MAE stalls
+MAX_N_ESTIMATORS = 500
+EARLY_STOPPING_ROUNDS = 50
+# trials report their validation MAE to the pruner every this many rounds
+PRUNING_REPORT_EVERY = 10
+
+# the search bins the training hours once, into LightGBM binary files that
+# every trial loads. Bins must not depend on tuned parameters, hence no
+# feature pre-filtering on min_child_samples
+SEARCH_DATASET_DIR = DATA_CACHE_DIR / "search_dataset"
+TRAIN_DATASET_FILE = "train.bin"
+VALID_DATASET_FILE = "valid.bin"
+DATASET_PARAMS = {"max_bin": 255, "feature_pre_filter": False, "verbosity": -1}
+
+# incremental runs add at most this many rounds on the hours since the
+# watermark, and fall back to a full retrain when the MAE of the current
+# model on the newest hours is this much worse than at its last training
+N_INCREMENTAL_ROUNDS = 100
+DRIFT_TOLERANCE = 0.2
+
+# studies persist across runs in one SQLite file, one study per feature
+# schema, so each run resumes the search of the previous ones
+SEARCH_STORAGE_URL = f"sqlite:///{MODELS_DIR / 'optuna_studies.db'}"
+# seconds a worker waits for another one to release the SQLite lock
+SQLITE_TIMEOUT = 60
+
 
 def fetch_features_and_target() -> pd.DataFrame:
     """Fetch features and generate target column."""
@@ -37,26 +80,94 @@ def fetch_features_and_target() -> pd.DataFrame:
         df[TARGET_COL] = df.groupby("pickup_location_id")[ride_column].shift(-1)
         df = df.dropna(subset=[TARGET_COL]).reset_index(drop=True)
 
+    df = compact_features(df)
     print(f"⚙️ Features ready: {df.shape}")
     return df
 
 
-def split_data(df: pd.DataFrame, test_size: float = 0.2, random_state: int = 42):
-    X = df.drop(columns=[TARGET_COL])
-    y = df[TARGET_COL]
+def with_datetime_split(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with `pickup_ts` and `pickup_ts_split` as UTC datetimes, whatever
+    dtype the feature store served (epoch milliseconds, naive or UTC
+    datetimes). `pickup_ts_split` defaults to `pickup_ts`.
+    """
+    df = from_store_dtypes(df)
+    if "pickup_ts_split" not in df.columns:
+        return df.assign(pickup_ts_split=df["pickup_ts"])
+    if df["pickup_ts_split"].dtype != df["pickup_ts"].dtype:
+        return df.assign(pickup_ts_split=to_datetime_utc(df["pickup_ts_split"]))
+    return df
+
+
+def get_time_cutoff(df: pd.DataFrame, test_size: float) -> pd.Timestamp:
+    """First `pickup_ts_split` of the latest `test_size` fraction of the hours"""
+    hours = np.sort(df["pickup_ts_split"].unique())
+    return pd.Timestamp(hours[int(len(hours) * (1 - test_size))])
 
-    datetime_cols = X.select_dtypes(include=["datetime64[ns, UTC]", "datetime64[ns]"]).columns
-    for col in datetime_cols:
-        X[col] = X[col].astype("int64") // 10**9
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
-    print(f"Split data: X_train={X_train.shape}, X_test={X_test.shape}")
+def split_data(df: pd.DataFrame, test_size: float = 0.2):
+    """
+    Time-based split: the latest `test_size` fraction of the hours is held
+    out, so the model is always evaluated on hours after the ones it saw.
+    """
+    df = with_datetime_split(df)
+
+    cutoff = get_time_cutoff(df, test_size)
+    X_train, y_train, X_test, y_test = train_test_split(df, cutoff, TARGET_COL)
+    print(f"Split data at {cutoff}: X_train={X_train.shape}, X_test={X_test.shape}")
     return X_train, X_test, y_train, y_test
 
 
-def objective(trial, X_train, y_train):
-    """Optuna objective for LightGBM."""
-    params = {
+def split_validation(X: pd.DataFrame, y: pd.Series, validation_size: float = 0.2):
+    """
+    Holds out the latest `validation_size` fraction of the hours of an
+    already split training set, for early stopping and pruning
+    """
+    time_col = "pickup_ts" if "pickup_ts" in X.columns else "pickup_hour"
+    hours = np.sort(X[time_col].unique())
+    is_valid = (X[time_col] >= hours[int(len(hours) * (1 - validation_size))]).to_numpy()
+    return X[~is_valid], y[~is_valid], X[is_valid], y[is_valid]
+
+
+def optuna_pruning_callback(trial, metric: str = "l1", report_every: int = PRUNING_REPORT_EVERY):
+    """
+    LightGBM callback that reports the validation `metric` to the Optuna
+    `trial` and stops the fit as soon as the pruner gives up on it
+    """
+    def _callback(env):
+        if (env.iteration + 1) % report_every:
+            return
+        for _, eval_name, value, _ in env.evaluation_result_list:
+            if eval_name == metric:
+                trial.report(value, step=env.iteration + 1)
+                if trial.should_prune():
+                    raise optuna.TrialPruned(f"Pruned at round {env.iteration + 1}, MAE={value:.4f}")
+    return _callback
+
+
+def fit_pipeline(params: dict, X_train, y_train, X_valid=None, y_valid=None, callbacks=None) -> Pipeline:
+    """
+    Fits the scaler + LightGBM pipeline. With a validation set, boosting
+    stops once its MAE has not improved for `EARLY_STOPPING_ROUNDS` rounds.
+    """
+    scaler = StandardScaler().fit(X_train)
+    model = lgb.LGBMRegressor(**{"n_estimators": MAX_N_ESTIMATORS, **params})
+
+    fit_params = {}
+    if X_valid is not None:
+        fit_params = {
+            "eval_set": [(scaler.transform(X_valid), y_valid)],
+            "eval_metric": "l1",
+            "callbacks": [lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False), *(callbacks or [])],
+        }
+    model.fit(scaler.transform(X_train), y_train, **fit_params)
+
+    return Pipeline([("scaler", scaler), ("model", model)])
+
+
+def suggest_params(trial) -> dict:
+    """LightGBM parameters of a trial"""
+    return {
         "objective": "regression",
         "metric": "mae",
         "boosting_type": "gbdt",
@@ -67,16 +178,55 @@ def objective(trial, X_train, y_train):
         "min_child_samples": trial.suggest_int("min_child_samples", 5, 100),
     }
 
-    pipeline = Pipeline([
-        ("scaler", StandardScaler()),
-        ("model", lgb.LGBMRegressor(**params, n_estimators=500))
-    ])
 
-    pipeline.fit(X_train, y_train)
-    y_pred = pipeline.predict(X_train)
-    mae = np.mean(np.abs(y_train - y_pred))
+def build_search_datasets(X_fit, y_fit, X_valid, y_valid, dataset_dir: Path = SEARCH_DATASET_DIR):
+    """
+    Bins the fit and validation hours once and saves them as LightGBM binary
+    files, which every trial loads without re-binning. The validation set
+    reuses the bin edges of the fit set.
+
+    The scaler of the pipeline is left out on purpose: it is a monotonic
+    map of each feature, so the trees split the data the same way with or
+    without it.
+    """
+    dataset_dir = Path(dataset_dir)
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    train_path, valid_path = dataset_dir / TRAIN_DATASET_FILE, dataset_dir / VALID_DATASET_FILE
+    for path in (train_path, valid_path):
+        path.unlink(missing_ok=True)
+
+    train_set = lgb.Dataset(X_fit, y_fit, params=DATASET_PARAMS, free_raw_data=False).construct()
+    valid_set = lgb.Dataset(X_valid, y_valid, reference=train_set, params=DATASET_PARAMS, free_raw_data=False).construct()
+    train_set.save_binary(str(train_path))
+    valid_set.save_binary(str(valid_path))
+
+    print(f"🗃️ Binned search datasets saved to {dataset_dir}: {train_set.num_data()} fit rows, "
+          f"{valid_set.num_data()} validation rows, {train_set.num_feature()} features")
+    return train_path, valid_path
 
-    print(f"Trial params: {params}, MAE={mae:.4f}")
+
+def load_search_datasets(train_path: Path, valid_path: Path):
+    """Loads the binned datasets of `build_search_datasets`"""
+    train_set = lgb.Dataset(str(train_path), params=DATASET_PARAMS).construct()
+    valid_set = lgb.Dataset(str(valid_path), reference=train_set, params=DATASET_PARAMS).construct()
+    return train_set, valid_set
+
+
+def objective(trial, train_set: lgb.Dataset, valid_set: lgb.Dataset, num_threads: int = N_THREADS_PER_TRIAL):
+    """Optuna objective for LightGBM on the binned datasets, scored on the validation hours."""
+    params = suggest_params(trial)
+
+    booster = lgb.train(
+        {**params, "num_threads": num_threads},
+        train_set,
+        num_boost_round=MAX_N_ESTIMATORS,
+        valid_sets=[valid_set],
+        callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False), optuna_pruning_callback(trial)],
+    )
+    mae = booster.best_score["valid_0"]["l1"]
+    trial.set_user_attr("best_iteration", booster.best_iteration or MAX_N_ESTIMATORS)
+
+    print(f"Trial params: {params}, validation MAE={mae:.4f} after {booster.best_iteration} rounds")
 
     if mae > MAX_MAE:
         raise optuna.TrialPruned()
@@ -84,7 +234,129 @@ def objective(trial, X_train, y_train):
     return mae
 
 
-def save_model_with_features(model, X_train):
+def get_storage(storage: Optional[Union[str, Path]]):
+    """
+    Optuna storage from a database URL, or from the path of a journal file.
+    None is kept, for an in-memory study.
+    """
+    if isinstance(storage, Path):
+        return JournalStorage(JournalFileBackend(str(storage)))
+    if isinstance(storage, str) and storage.startswith("sqlite"):
+        return optuna.storages.RDBStorage(storage, engine_kwargs={"connect_args": {"timeout": SQLITE_TIMEOUT}})
+    return storage
+
+
+def feature_schema_hash(feature_names) -> str:
+    """Short hash of the ordered feature names, which keys the study"""
+    return hashlib.sha256(json.dumps([str(name) for name in feature_names]).encode()).hexdigest()[:12]
+
+
+def get_study_name(feature_names) -> str:
+    return f"{config.MODEL_NAME}_v{config.MODEL_VERSION}_{feature_schema_hash(feature_names)}"
+
+
+def create_study(storage: Optional[Union[str, Path]] = SEARCH_STORAGE_URL, study_name: Optional[str] = None) -> optuna.Study:
+    """
+    Study that prunes trials whose validation MAE is worse than the median.
+    An existing study with the same name in `storage` is resumed.
+    """
+    return optuna.create_study(
+        direction="minimize",
+        storage=get_storage(storage),
+        study_name=study_name,
+        load_if_exists=True,
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=5 * PRUNING_REPORT_EVERY),
+    )
+
+
+def warm_start_study(study: optuna.Study, storage: Union[str, Path] = SEARCH_STORAGE_URL) -> Optional[dict]:
+    """
+    Enqueues the best parameters of the most recent other study in `storage`,
+    e.g. the one of the previous feature schema, as the first trial of a
+    study without trials. Parameters outside the current search space are
+    left to the sampler.
+
+    Returns:
+        Optional[dict]: the enqueued parameters, None if nothing was enqueued
+    """
+    if study.trials:
+        return None
+
+    previous = [
+        summary for summary in optuna.get_all_study_summaries(get_storage(storage), include_best_trial=True)
+        if summary.study_name != study.study_name and summary.best_trial is not None
+    ]
+    if not previous:
+        return None
+
+    latest = max(previous, key=lambda summary: summary.datetime_start or datetime.min)
+    study.enqueue_trial(latest.best_trial.params, skip_if_exists=True)
+    print(f"🔥 Warm-starting from the best trial of '{latest.study_name}': {latest.best_trial.params}")
+    return latest.best_trial.params
+
+
+def _search_worker(train_path: Path, valid_path: Path, storage: Union[str, Path], study_name: str,
+                   n_trials: int, num_threads: int) -> None:
+    """Runs `n_trials` trials of the shared study in a worker process"""
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    train_set, valid_set = load_search_datasets(train_path, valid_path)
+    study = create_study(storage, study_name)
+    study.optimize(lambda trial: objective(trial, train_set, valid_set, num_threads), n_trials=n_trials)
+
+
+def run_search(
+    train_path: Path,
+    valid_path: Path,
+    n_trials: int = N_HYPERPARAMETER_SEARCH_TRIALS,
+    n_workers: Optional[int] = N_SEARCH_WORKERS,
+    num_threads: int = N_THREADS_PER_TRIAL,
+    storage: Union[str, Path] = SEARCH_STORAGE_URL,
+    study_name: Optional[str] = None,
+) -> optuna.Study:
+    """
+    Runs the search in `n_workers` processes of `num_threads` LightGBM
+    threads each, on the binned datasets of `build_search_datasets`.
+
+    The workers share one study, so the sampler and the pruner see the trials
+    of every worker. `storage` is a database URL, or the path of a journal
+    file. A study that already exists there is resumed, and a new one starts
+    from the best parameters of the previous study.
+    """
+    if n_workers is None:
+        n_workers = max(1, (os.cpu_count() or 1) // num_threads)
+    n_workers = max(1, min(n_workers, n_trials))
+
+    study = create_study(storage, study_name)
+    if study.trials:
+        print(f"♻️ Resuming study '{study.study_name}' with {len(study.trials)} trials")
+    else:
+        warm_start_study(study, storage)
+    study_name = study.study_name
+
+    print(f"🔀 Searching {n_trials} trials in {n_workers} workers x {num_threads} LightGBM threads...")
+    if n_workers == 1:
+        _search_worker(train_path, valid_path, storage, study_name, n_trials, num_threads)
+    else:
+        trials_per_worker = [n_trials // n_workers + (i < n_trials % n_workers) for i in range(n_workers)]
+        # spawn, as forking after LightGBM has used OpenMP can deadlock the children
+        with ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(_search_worker, train_path, valid_path, storage, study_name, n, num_threads)
+                for n in trials_per_worker
+            ]
+            for future in futures:
+                future.result()
+
+    return create_study(storage, study_name)
+
+
+def save_model_with_features(model, X_train, watermark: Optional[pd.Timestamp] = None,
+                             reference_mae: Optional[float] = None, save_feature_files: bool = True):
+    """
+    Saves the model bundle and its compiled export. With `save_feature_files`,
+    the feature schema and the fallback features for inference are written
+    from `X_train` too.
+    """
     model_path = f"models/{config.MODEL_NAME}_v{config.MODEL_VERSION}.pkl"
     os.makedirs("models", exist_ok=True)
 
@@ -92,11 +364,26 @@ def save_model_with_features(model, X_train):
         "model": model,
         "expected_features": X_train.columns.tolist(),
         "feature_names": X_train.columns.tolist(),
+        # last hour the model was trained on, and its MAE on the latest hours
+        # it was evaluated on, for incremental runs
+        "watermark": watermark,
+        "reference_mae": reference_mae,
     }
 
     joblib.dump(bundle, model_path)
     print(f"✅ Model and feature names saved: {model_path}")
 
+    # NumPy-only export of the same model, for fast inference cold starts
+    compiled_path = f"models/{config.MODEL_NAME}_v{config.MODEL_VERSION}_compiled.npz"
+    try:
+        compile_pipeline(model, X_train.columns.tolist()).save(compiled_path)
+        print(f"✅ Compiled model saved: {compiled_path}")
+    except ValueError as e:
+        print(f"{e}. ⚠️ Inference will use the joblib pipeline")
+
+    if not save_feature_files:
+        return
+
     schema_path = os.path.join("models", "feature_schema.parquet")
     pd.DataFrame({"feature_name": X_train.columns}).to_parquet(schema_path, index=False)
     print(f"✅ Feature schema saved: {schema_path}")
@@ -107,27 +394,152 @@ def save_model_with_features(model, X_train):
     print(f"✅ Saved fallback features for inference: {fallback_path}")
 
 
-def main():
-    df = fetch_features_and_target()
+def load_model_bundle() -> Optional[dict]:
+    model_path = f"models/{config.MODEL_NAME}_v{config.MODEL_VERSION}.pkl"
+    if not os.path.exists(model_path):
+        return None
+    return joblib.load(model_path)
+
+
+def split_new_hours(df: pd.DataFrame, watermark: pd.Timestamp):
+    """Features and target of the hours after `watermark`"""
+    df = with_datetime_split(df.drop(columns="pickup_ts_split", errors="ignore"))
+    _, _, X_new, y_new = train_test_split(df, watermark + pd.Timedelta(hours=1), TARGET_COL)
+    return X_new, y_new
+
+
+def mae(model, X, y) -> float:
+    return float(np.mean(np.abs(y - model.predict(X))))
+
+
+def continue_boosting(pipeline: Pipeline, X, y, n_rounds: int, X_valid=None, y_valid=None) -> Pipeline:
+    """
+    Adds up to `n_rounds` trees to the LightGBM model of `pipeline`, fit on
+    X, y with the already fitted scaler, so the existing trees keep their
+    meaning. With a validation set, boosting stops early as in `fit_pipeline`.
+    """
+    scaler, model = pipeline.named_steps["scaler"], pipeline.named_steps["model"]
+    updated = lgb.LGBMRegressor(**{**model.get_params(), "n_estimators": n_rounds})
+
+    fit_params = {}
+    if X_valid is not None:
+        fit_params = {
+            "eval_set": [(scaler.transform(X_valid), y_valid)],
+            "eval_metric": "l1",
+            "callbacks": [lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)],
+        }
+    updated.fit(scaler.transform(X), y, init_model=model.booster_, **fit_params)
+
+    return Pipeline([("scaler", scaler), ("model", updated)])
+
+
+def train_full(df: pd.DataFrame) -> None:
+    """Searches hyperparameters and trains a new model on every hour"""
+    df = from_store_dtypes(df)
     X_train, X_test, y_train, y_test = split_data(df, test_size=0.2)
+    X_fit, y_fit, X_valid, y_valid = split_validation(X_train, y_train)
+
+    # Lags that do not improve the MAE are left out from here on. They are
+    # ranked and compared on the earlier fit hours, and a set is only kept if
+    # it is also within tolerance on the validation hours
+    X_select, y_select, X_select_valid, y_select_valid = split_validation(X_fit, y_fit)
+    selected = select_lag_features(
+        X_select, y_select, X_select_valid, y_select_valid, X_holdout=X_valid, y_holdout=y_valid,
+    )
+    X_train, X_test, X_fit, X_valid = (X[selected] for X in (X_train, X_test, X_fit, X_valid))
 
     print(f"Starting hyperparameter optimization for {N_HYPERPARAMETER_SEARCH_TRIALS} trials...")
-    study = optuna.create_study(direction="minimize")
-    study.optimize(lambda trial: objective(trial, X_train, y_train), n_trials=N_HYPERPARAMETER_SEARCH_TRIALS)
+    train_path, valid_path = build_search_datasets(X_fit, y_fit, X_valid, y_valid)
+    study = run_search(
+        train_path, valid_path, N_HYPERPARAMETER_SEARCH_TRIALS, study_name=get_study_name(X_fit.columns),
+    )
 
     print(f"Best parameters found: {study.best_params}")
 
-    # Train final model
-    final_pipeline = Pipeline([
-        ("scaler", StandardScaler()),
-        ("model", lgb.LGBMRegressor(**study.best_params, n_estimators=500))
-    ])
-    final_pipeline.fit(X_train, y_train)
+    # Train final model on all training hours, with the rounds the search found
+    n_estimators = study.best_trial.user_attrs.get("best_iteration", MAX_N_ESTIMATORS)
+    final_pipeline = fit_pipeline({**study.best_params, "n_estimators": n_estimators}, X_train, y_train)
     print("✅ Final model trained.")
 
-    save_model_with_features(final_pipeline, X_train)
+    test_mae = mae(final_pipeline, X_test, y_test)
+    print(f"📊 Test MAE on the held-out hours: {test_mae:.4f}")
+
+    save_model_with_features(final_pipeline, X_train, df["pickup_ts"].max(), test_mae)
+
+
+def train_incremental(df: pd.DataFrame) -> bool:
+    """
+    Keeps boosting the saved model on the hours after its watermark, instead
+    of retraining on the whole history.
+
+    The latest hours of the new data are held out as a gate: if the saved
+    model is more than `DRIFT_TOLERANCE` worse on them than its reference
+    MAE, the data drifted and a full retrain is needed. If the new rounds
+    do not beat the saved model there, it is kept as is.
+
+    Returns:
+        bool: False if a full retrain is needed instead
+    """
+    bundle = load_model_bundle()
+    if bundle is None or bundle.get("watermark") is None or bundle.get("reference_mae") is None:
+        print("⚠️ No model with a training watermark, a full retrain is needed")
+        return False
+
+    # watermarks are UTC, like pickup_ts once read from the store
+    df = from_store_dtypes(df)
+    pipeline, watermark = bundle["model"], to_datetime_utc(pd.Series([bundle["watermark"]])).iloc[0]
+    X_new, y_new = split_new_hours(df, watermark)
+    if not set(bundle["expected_features"]) <= set(X_new.columns):
+        print("⚠️ Feature schema changed since the last training, a full retrain is needed")
+        return False
+    X_new = X_new[bundle["expected_features"]]
+    if X_new.empty:
+        print(f"✅ No hours after the watermark {watermark}, the model is up to date")
+        return True
+
+    X_fit, y_fit, X_valid, y_valid = split_validation(X_new, y_new)
+    if X_fit.empty:
+        print(f"✅ Not enough hours after the watermark {watermark} to update the model")
+        return True
+
+    current_mae = mae(pipeline, X_valid, y_valid)
+    print(f"🕐 {len(X_new)} rows after {watermark}, current MAE on the newest hours {current_mae:.4f} "
+          f"(reference {bundle['reference_mae']:.4f})")
+    if current_mae > bundle["reference_mae"] * (1 + DRIFT_TOLERANCE):
+        print("⚠️ Drift detected, a full retrain is needed")
+        return False
+
+    updated = continue_boosting(pipeline, X_fit, y_fit, N_INCREMENTAL_ROUNDS, X_valid, y_valid)
+    # LightGBM counts the trees of the initial model in the boosting rounds
+    n_rounds = updated.named_steps["model"].booster_.current_iteration() - pipeline.named_steps["model"].booster_.current_iteration()
+    updated_mae = mae(updated, X_valid, y_valid)
+    print(f"📊 MAE on the newest hours after {n_rounds} more rounds: {updated_mae:.4f}")
+    if n_rounds == 0 or updated_mae >= current_mae:
+        print("✅ More rounds do not help on the newest hours, keeping the current model")
+        return True
+
+    # Same number of rounds, now on every new hour
+    final_pipeline = continue_boosting(pipeline, X_new, y_new, n_rounds)
+    # The schema and fallback features of the full run are kept, since X_new
+    # only holds the hours after the watermark
+    save_model_with_features(final_pipeline, X_new, df["pickup_ts"].max(), updated_mae, save_feature_files=False)
+    return True
+
+
+def main(incremental: bool = False):
+    df = fetch_features_and_target()
+    get_session().log_stats()
+
+    if incremental and train_incremental(df):
+        print("🚀 Incremental training finished successfully.")
+        return
+
+    train_full(df)
     print("🚀 Training pipeline finished successfully.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the taxi demand model")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep boosting the saved model on the hours since its last training")
+    main(parser.parse_args().incremental)
@@ -0,0 +1,158 @@
+# src/ts_store.py
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+from src.data import add_missing_slots, fetch_ts_data_from_data_warehouse
+from src.paths import TS_STORE_DIR
+
+WATERMARK_FILE_NAME = '_watermark.json'
+TS_DATA_COLUMNS = ['pickup_hour', 'pickup_location_id', 'rides']
+N_LOCATIONS = 265
+
+
+def get_partition_path(day: pd.Timestamp, root: Path = TS_STORE_DIR) -> Path:
+    """
+    Returns the parquet file holding the hourly time-series of `day`
+    """
+    return (
+        Path(root)
+        / f'year={day.year}'
+        / f'month={day.month:02d}'
+        / f'day={day.day:02d}'
+        / 'ts_data.parquet'
+    )
+
+
+def get_watermark(root: Path = TS_STORE_DIR) -> Optional[pd.Timestamp]:
+    """
+    Returns the high-watermark of the store: every pickup_hour strictly before
+    it has already been aggregated. `None` if the store is empty.
+    """
+    path = Path(root) / WATERMARK_FILE_NAME
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return pd.Timestamp(json.load(f)['high_watermark'])
+
+
+def set_watermark(watermark: datetime, root: Path = TS_STORE_DIR) -> None:
+    path = Path(root) / WATERMARK_FILE_NAME
+    tmp_path = path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'high_watermark': pd.Timestamp(watermark).isoformat()}, f)
+    os.replace(tmp_path, path)
+
+
+def _write_parquet_atomically(df: pd.DataFrame, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.parquet.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def upsert_ts_data(ts_data: pd.DataFrame, root: Path = TS_STORE_DIR) -> List[Path]:
+    """
+    Writes `ts_data` into its day partitions. Rows of `ts_data` replace stored
+    rows with the same (pickup_hour, pickup_location_id).
+
+    Returns:
+        List with the partition files that were written
+    """
+    written = []
+    ts_data = ts_data[TS_DATA_COLUMNS]
+    for day, ts_data_one_day in ts_data.groupby(ts_data['pickup_hour'].dt.floor('D')):
+        path = get_partition_path(day, root)
+        if path.exists():
+            ts_data_one_day = pd.concat([pd.read_parquet(path), ts_data_one_day])
+            ts_data_one_day = ts_data_one_day.drop_duplicates(
+                subset=['pickup_hour', 'pickup_location_id'], keep='last'
+            )
+
+        ts_data_one_day = ts_data_one_day.sort_values(by=['pickup_location_id', 'pickup_hour'])
+        _write_parquet_atomically(ts_data_one_day, path)
+        written.append(path)
+
+    return written
+
+
+def read_ts_data(
+    from_hour: datetime,
+    to_hour: datetime,
+    root: Path = TS_STORE_DIR,
+) -> pd.DataFrame:
+    """
+    Reads the hourly time-series with `from_hour` <= pickup_hour < `to_hour`.
+    Only the day partitions that overlap the range are opened.
+    """
+    from_hour, to_hour = pd.Timestamp(from_hour), pd.Timestamp(to_hour)
+    days = pd.date_range(from_hour.floor('D'), to_hour, freq='D', inclusive='left')
+
+    ts_data = [
+        pd.read_parquet(path)
+        for path in (get_partition_path(day, root) for day in days)
+        if path.exists()
+    ]
+    if not ts_data:
+        return pd.DataFrame(columns=TS_DATA_COLUMNS)
+
+    ts_data = pd.concat(ts_data)
+    ts_data = ts_data[(ts_data.pickup_hour >= from_hour) & (ts_data.pickup_hour < to_hour)]
+    return ts_data.sort_values(by=['pickup_location_id', 'pickup_hour']).reset_index(drop=True)
+
+
+def update_ts_store(
+    to_date: datetime,
+    from_date: Optional[datetime] = None,
+    root: Path = TS_STORE_DIR,
+    fetch_ts_data: Callable[[datetime, datetime], pd.DataFrame] = fetch_ts_data_from_data_warehouse,
+    n_locations: int = N_LOCATIONS,
+) -> pd.DataFrame:
+    """
+    Aggregates only the hours between the store's high-watermark and
+    `to_date` into hourly rides per location, upserts their partitions and
+    moves the watermark to `to_date`.
+
+    Args:
+        to_date: end (exclusive) of the hours to aggregate, floored to the hour
+        from_date: where to start when the store is empty. Hours before the
+            watermark are never aggregated again
+        root: directory of the store
+        fetch_ts_data: function returning hourly `rides` per `pickup_hour` and
+            `pickup_location_id` between two datetimes
+        n_locations: locations 1..`n_locations` get a row for every hour
+
+    Returns:
+        pd.DataFrame: the new (pickup_hour, pickup_location_id, rides) rows
+    """
+    to_date = pd.Timestamp(to_date).floor('H')
+    watermark = get_watermark(root)
+
+    if watermark is None and from_date is None:
+        raise ValueError('The store is empty, pass `from_date` to backfill it')
+    start = pd.Timestamp(from_date).floor('H') if from_date is not None else watermark
+    if watermark is not None and from_date is not None:
+        start = max(start, watermark)
+
+    if start >= to_date:
+        print(f'Time-series store is up to date until {watermark}')
+        return pd.DataFrame(columns=TS_DATA_COLUMNS)
+
+    print(f'Aggregating rides from {start} to {to_date}')
+    agg_rides = fetch_ts_data(start.to_pydatetime(), to_date.to_pydatetime())
+
+    # add rows for (locations, pickup_hours)s with 0 rides
+    ts_data = add_missing_slots(
+        agg_rides,
+        full_range=pd.date_range(start, to_date, freq='H', inclusive='left'),
+        n_locations=n_locations,
+    )
+
+    upsert_ts_data(ts_data, root)
+    set_watermark(to_date, root)
+
+    return ts_data[TS_DATA_COLUMNS]
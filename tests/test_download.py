@@ -0,0 +1,111 @@
+# tests/test_download.py
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.download import DownloadError, download_file
+
+BODY = bytes(range(256)) * 1024
+
+
+class RawDataServer(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the raw data host. Paths pick the behavior:
+    /file honors Range, /no-range ignores it, /flaky answers 503 twice,
+    /truncated drops the connection halfway once, /missing is a 404.
+    """
+    failures = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('Range')))
+        if self.path == '/missing':
+            return self._send(404)
+        if self.path == '/flaky' and self.failures.get('/flaky', 0) < 2:
+            self.failures['/flaky'] = self.failures.get('/flaky', 0) + 1
+            return self._send(503)
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.path != '/no-range':
+            start = int(range_header[len('bytes='):].rstrip('-'))
+            if start >= len(BODY):
+                return self._send(416, {'Content-Range': f'bytes */{len(BODY)}'})
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(BODY) - 1}/{len(BODY)}')
+        else:
+            self.send_response(200)
+        body = BODY[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if self.path == '/truncated' and not self.failures.get('/truncated'):
+            self.failures['/truncated'] = 1
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def _send(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+@pytest.fixture
+def base_url():
+    RawDataServer.failures, RawDataServer.requests = {}, []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RawDataServer)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def _with_part(tmp_path, n_bytes):
+    local_file = tmp_path / 'rides.parquet'
+    (tmp_path / 'rides.parquet.part').write_bytes(BODY[:n_bytes])
+    return local_file
+
+
+def test_resumes_partial_file(base_url, tmp_path):
+    local_file = _with_part(tmp_path, 1000)
+    assert download_file(f'{base_url}/file', local_file).read_bytes() == BODY
+    assert RawDataServer.requests == [('/file', 'bytes=1000-')]
+
+
+def test_server_ignoring_range_rewrites_file(base_url, tmp_path):
+    local_file = _with_part(tmp_path, 1000)
+    assert download_file(f'{base_url}/no-range', local_file).read_bytes() == BODY
+
+
+def test_complete_part_file_is_not_downloaded_again(base_url, tmp_path):
+    local_file = _with_part(tmp_path, len(BODY))
+    assert download_file(f'{base_url}/file', local_file).read_bytes() == BODY
+    assert len(RawDataServer.requests) == 1
+    assert not (tmp_path / 'rides.parquet.part').exists()
+
+
+def test_retries_server_errors(base_url, tmp_path):
+    local_file = download_file(f'{base_url}/flaky', tmp_path / 'rides.parquet', backoff_seconds=0)
+    assert local_file.read_bytes() == BODY
+    assert len(RawDataServer.requests) == 3
+
+
+def test_truncated_body_resumes(base_url, tmp_path):
+    local_file = download_file(f'{base_url}/truncated', tmp_path / 'rides.parquet', backoff_seconds=0)
+    assert local_file.read_bytes() == BODY
+    assert RawDataServer.requests[-1] == ('/truncated', f'bytes={len(BODY) // 2}-')
+
+
+def test_missing_file_fails_without_retries(base_url, tmp_path):
+    with pytest.raises(DownloadError):
+        download_file(f'{base_url}/missing', tmp_path / 'rides.parquet', backoff_seconds=0)
+    assert len(RawDataServer.requests) == 1
@@ -0,0 +1,114 @@
+# tests/test_feature_store_session.py
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('hopsworks')
+
+from src import config
+from src import feature_store_api as fsa
+
+
+class ExpiredToken(Exception):
+    status_code = 401
+
+
+class FakeFeatureView:
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    def get_batch_data(self, start_time=None, **kwargs) -> pd.DataFrame:
+        df = self.frame
+        if start_time is not None:
+            df = df[df['pickup_ts'] >= start_time.value // 10**6]
+        return df.reset_index(drop=True)
+
+
+class FakeFeatureGroup:
+    def __init__(self, columns, expire_on_materialize: bool = False):
+        self.features = [SimpleNamespace(name=col) for col in columns]
+        self.inserted = []
+        self.expire_on_materialize = expire_on_materialize
+        self.materialized = 0
+
+    def select(self, columns):
+        return list(columns)
+
+    def insert(self, df, write_options=None):
+        self.inserted.append(df)
+
+    def materialize(self, start_time=None, end_time=None):
+        if self.expire_on_materialize:
+            self.expire_on_materialize = False
+            raise ExpiredToken('token expired')
+        self.materialized += 1
+
+
+class FakeFeatureStore:
+    """Hopsworks feature store stand-in, counting the handle lookups"""
+    def __init__(self, frame: pd.DataFrame, predictions_group: FakeFeatureGroup):
+        self.frame = frame
+        self.groups = {config.FEATURE_GROUP_PREDICTIONS_METADATA.name: predictions_group}
+        self.views = {config.FEATURE_VIEW_METADATA.name: FakeFeatureView(frame)}
+        self.lookups = 0
+
+    def get_feature_view(self, name, version):
+        self.lookups += 1
+        return self.views[name]
+
+    def create_feature_view(self, name, version, query):
+        self.views[name] = FakeFeatureView(self.frame[query])
+        return self.views[name]
+
+    def get_or_create_feature_group(self, name, version, **kwargs):
+        self.lookups += 1
+        return self.groups.setdefault(name, FakeFeatureGroup(self.frame.columns))
+
+
+@pytest.fixture
+def feature_store():
+    hours = pd.date_range('2024-01-01', periods=24, freq='h', tz='UTC')
+    frame = pd.DataFrame({
+        'pickup_hour': np.repeat(hours, 2),
+        'pickup_ts': np.repeat(hours.asi8 // 10**6, 2),
+        'pickup_location_id': np.tile([1, 2], 24),
+        'rides': np.arange(48),
+    })
+    store = FakeFeatureStore(frame, FakeFeatureGroup(['pickup_location_id', 'pickup_hour'], expire_on_materialize=True))
+    logins = []
+    fsa.set_session(fsa.FeatureStoreSession(login=lambda: logins.append(1) or SimpleNamespace(get_feature_store=lambda: store)))
+    yield store
+    fsa.set_session(None)
+
+
+def test_pipeline_run_logs_in_once(feature_store):
+    session = fsa.get_session()
+    for _ in range(3):
+        features = fsa.get_batch_data(config.FEATURE_VIEW_METADATA)
+    newest = fsa.get_batch_data(
+        config.FEATURE_VIEW_METADATA, columns=['rides'], start_time=pd.Timestamp('2024-01-01 20:00', tz='UTC'),
+    )
+
+    assert features['pickup_ts'].dtype == 'datetime64[ns, UTC]'
+    assert len(newest) == 8 and set(newest.columns) == {'pickup_ts', 'pickup_location_id', 'rides'}
+    assert session.stats['logins'] == 1
+    # the feature view, the feature group and the projected view, once each
+    assert session.stats['handle_lookups'] == feature_store.lookups == 3
+    assert session.stats['handle_hits'] == 2
+
+
+def test_expired_token_on_materialize_logs_in_again(feature_store):
+    predictions = pd.DataFrame({
+        'pickup_location_id': np.array([1, 2], dtype=np.int16),
+        'pickup_hour': pd.Timestamp('2024-01-02', tz='UTC'),
+    })
+    fsa.log_predictions_to_store(predictions)
+
+    session = fsa.get_session()
+    group = feature_store.groups[config.FEATURE_GROUP_PREDICTIONS_METADATA.name]
+    assert group.materialized == 1
+    assert session.stats['reconnects'] == 1 and session.stats['logins'] == 2
+    # inserted with the feature group's bigint columns
+    assert group.inserted[0]['pickup_location_id'].dtype == np.int64
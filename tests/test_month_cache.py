@@ -0,0 +1,67 @@
+# tests/test_month_cache.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src.month_cache import MonthCache
+
+LOAD_SECONDS = 0.2
+
+
+def _month(year: int, month: int) -> pd.DataFrame:
+    pickup_hour = pd.date_range(f'{year}-{month:02d}-01', periods=48, freq='h')
+    return pd.DataFrame({
+        'pickup_hour': pickup_hour.repeat(2),
+        'pickup_location_id': [1, 2] * len(pickup_hour),
+        'rides': range(2 * len(pickup_hour)),
+    })
+
+
+class SlowLoader:
+    """Stands in for the download and aggregation of a month"""
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, year: int, month: int) -> pd.DataFrame:
+        with self._lock:
+            self.calls.append((year, month))
+        time.sleep(LOAD_SECONDS)
+        return _month(year, month)
+
+
+def test_same_month_is_loaded_once(tmp_path):
+    loader = SlowLoader()
+    cache = MonthCache(load_month=loader, cache_dir=tmp_path)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        months = list(executor.map(lambda _: cache.get_month(2024, 1), range(8)))
+
+    assert loader.calls == [(2024, 1)]
+    assert all(ts_data.equals(months[0]) for ts_data in months)
+
+
+def test_different_months_load_concurrently(tmp_path):
+    loader = SlowLoader()
+    cache = MonthCache(load_month=loader, cache_dir=tmp_path)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda month: cache.get_month(2024, month), range(1, 5)))
+    elapsed = time.perf_counter() - start
+
+    assert sorted(loader.calls) == [(2024, month) for month in range(1, 5)]
+    assert elapsed < 2 * LOAD_SECONDS
+
+
+def test_callers_cannot_modify_the_cache(tmp_path):
+    cache = MonthCache(load_month=SlowLoader(), cache_dir=tmp_path)
+
+    cache.get_month(2024, 1)['rides'] = -1
+    window = cache.query(pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-02'))
+    window['rides'] = -1
+
+    assert (cache.get_month(2024, 1)['rides'] >= 0).all()
+    assert cache.hits == {'memory': 2, 'disk': 0, 'miss': 1}
@@ -0,0 +1,47 @@
+# tests/test_prediction_log.py
+import numpy as np
+import pandas as pd
+
+from src.prediction_log import append_predictions, list_hours, read_last_hours, unlogged_rows
+
+
+def _feature_view_rows(hours: pd.DatetimeIndex, n_locations: int = 3) -> pd.DataFrame:
+    """Rows shaped like the feature view's, `pickup_ts` as int64 epoch milliseconds"""
+    return pd.DataFrame({
+        'pickup_location_id': np.tile(np.arange(1, n_locations + 1), len(hours)),
+        'pickup_ts': np.repeat(hours.asi8 // 10**6, n_locations),
+        'rides': np.arange(len(hours) * n_locations),
+        'predicted_rides_next_hour': np.ones(len(hours) * n_locations),
+    })
+
+
+def test_ms_epoch_round_trip(tmp_path):
+    hours = pd.date_range('2024-01-01', periods=6, freq='h')
+    rows = _feature_view_rows(hours)
+
+    # an empty log takes the newest hour only
+    first = unlogged_rows(rows, tmp_path)
+    assert (first['pickup_ts'] == hours[-1].value // 10**6).all()
+    append_predictions(rows[rows['pickup_ts'] < hours[4].value // 10**6], root=tmp_path)
+    assert list_hours(tmp_path) == list(hours[:4])
+
+    # only the hours after the last logged one are left
+    new = unlogged_rows(rows, tmp_path)
+    assert sorted(new['pickup_ts'].unique()) == [h.value // 10**6 for h in hours[4:]]
+    append_predictions(new, root=tmp_path)
+
+    logged = read_last_hours(3, root=tmp_path)
+    assert sorted(logged['pickup_ts'].unique()) == list(hours[3:])
+    assert len(logged) == 3 * 3
+    assert unlogged_rows(rows, tmp_path).empty
+
+
+def test_epoch_seconds_and_datetimes_match(tmp_path):
+    hours = pd.date_range('2024-01-01', periods=2, freq='h', tz='UTC')
+    rows = _feature_view_rows(hours)
+    seconds = rows.assign(pickup_ts=rows['pickup_ts'] // 1000)
+    datetimes = rows.assign(pickup_ts=pd.to_datetime(rows['pickup_ts'], unit='ms', utc=True))
+
+    append_predictions(seconds, root=tmp_path / 'seconds')
+    append_predictions(datetimes, root=tmp_path / 'datetimes')
+    assert list_hours(tmp_path / 'seconds') == list_hours(tmp_path / 'datetimes') == list(hours.tz_convert(None))